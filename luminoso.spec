@@ -7,6 +7,9 @@ os.path.join(HOMEPATH,'support/useUnicode.py'), 'luminoso/app.py'],
                      'luminoso/lib',
                      '.',
                     ])
+# en_nl.py only points at the English language pack, which isn't a module,
+# so it has to be collected as a data file next to the executable.
+langpacks = [('lang_en.lpk', 'luminoso/lib/standalone_nlp/lang_en.lpk', 'DATA')]
 pyz = PYZ(a.pure)
 exe = EXE(pyz,
           a.scripts,
@@ -19,7 +22,7 @@ exe = EXE(pyz,
 coll = COLLECT( exe,
                a.binaries,
                a.zipfiles,
-               a.datas,
+               a.datas + langpacks,
                strip=False,
                upx=True,
                name=os.path.join('dist', 'luminoso'))
@@ -0,0 +1,101 @@
+"""
+Measure how association counting scales with the number of worker
+processes, on a synthetic corpus.
+
+    python -m luminoso.assoc_bench [documents] [max_workers]
+
+The corpus has `documents` documents (default 2000) of 20 sentences, each
+with 5 to 20 concepts drawn from a Zipf-like distribution over a 20,000
+concept vocabulary, with random polarity and the occasional tag. It is
+counted with 1, 2, 4, ... up to `max_workers` processes (default: the
+number of CPUs), and every result is checked against the single-process
+one.
+"""
+import sys, time, random
+import multiprocessing
+import numpy as np
+from luminoso.cooccurrence import count_associations, HAVE_SCIPY
+
+VOCABULARY_SIZE = 20000
+SENTENCES_PER_DOCUMENT = 20
+
+def synthetic_corpus(ndocs, seed=0):
+    """
+    Make the sentences of `ndocs` documents, and the ids of the concepts
+    that are valid in them (all but every tenth one).
+    """
+    rand = random.Random(seed)
+    words = [u'concept%d' % i for i in xrange(VOCABULARY_SIZE)]
+    tags = [u'#tag%d' % i for i in xrange(20)]
+    weights = 1.0 / np.arange(1, VOCABULARY_SIZE + 1)
+    cumulative = np.cumsum(weights / weights.sum())
+    docs = []
+    for d in xrange(ndocs):
+        sentences = []
+        for s in xrange(SENTENCES_PER_DOCUMENT):
+            n = rand.randint(5, 20)
+            picks = np.searchsorted(cumulative, np.random.random(n))
+            sentence = [(words[min(i, VOCABULARY_SIZE - 1)], rand.choice((1, -1)))
+                        for i in picks]
+            if rand.random() < 0.05:
+                sentence.append((rand.choice(tags), 1))
+            sentences.append(sentence)
+        docs.append(sentences)
+    concept_ids = {}
+    for i, concept in enumerate(words + tags):
+        if i % 10 != 9: concept_ids[concept] = i
+    return docs, concept_ids
+
+def summed(arrays):
+    """
+    Add up repeated entries, so that results can be compared.
+    """
+    import scipy.sparse
+    values, rows, cols = arrays
+    size = VOCABULARY_SIZE + 20
+    matrix = scipy.sparse.coo_matrix((values, (rows, cols)),
+                                     shape=(size, size)).tocsr()
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    return matrix
+
+def same_matrix(a, b):
+    return (a.shape == b.shape and a.nnz == b.nnz
+            and np.array_equal(a.indptr, b.indptr)
+            and np.array_equal(a.indices, b.indices)
+            and np.allclose(a.data, b.data))
+
+def benchmark(ndocs, max_workers):
+    np.random.seed(0)
+    start = time.time()
+    docs, concept_ids = synthetic_corpus(ndocs)
+    print "Made %d documents in %.1f s (SciPy: %s)" % (
+        ndocs, time.time() - start, HAVE_SCIPY and 'yes' or 'no')
+    workers = 1
+    baseline = None
+    expected = None
+    print "%8s %10s %10s %8s" % ('workers', 'seconds', 'speedup', 'same')
+    while workers <= max_workers:
+        start = time.time()
+        arrays = count_associations(docs, concept_ids, workers)
+        elapsed = time.time() - start
+        if baseline is None: baseline = elapsed
+        if HAVE_SCIPY:
+            result = summed(arrays)
+            if expected is None: expected = result
+            same = same_matrix(result, expected) and 'yes' or 'NO'
+        else:
+            same = '?'
+        print "%8d %10.2f %9.2fx %8s" % (workers, elapsed, baseline / elapsed,
+                                         same)
+        workers *= 2
+
+def main(args):
+    ndocs = 2000
+    max_workers = multiprocessing.cpu_count()
+    if len(args) > 0: ndocs = int(args[0])
+    if len(args) > 1: max_workers = int(args[1])
+    benchmark(ndocs, max_workers)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
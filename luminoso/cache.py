@@ -0,0 +1,228 @@
+"""
+Persistent caches that let a study be re-analyzed without redoing work on
+the parts of it that haven't changed.
+"""
+from __future__ import with_statement
+import os
+import hashlib
+import cPickle as pickle
+import logging
+logger = logging.getLogger('luminoso')
+
+def save_pickle_atomically(obj, filename):
+    """
+    Pickle `obj` into `filename` without ever leaving a half-written file
+    behind, even if we're interrupted.
+    """
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as out:
+        pickle.dump(obj, out, -1)
+    if os.path.exists(filename):
+        # os.rename won't replace an existing file on Windows.
+        os.remove(filename)
+    os.rename(tmpname, filename)
+
+class ConceptCache(object):
+    """
+    Remembers the ParsedDocument for each document, keyed by the SHA-1 of
+    the document's text, so that only new or changed documents need to go
+    through concept extraction again.
+
+    The cache is loaded lazily, the first time it is asked for something.
+    Entries that aren't used during an analysis are stale, and are
+    discarded by :meth:`collect_garbage`.
+    """
+    # Increase this whenever concept extraction starts giving different
+    # results, so that old caches are thrown away.
+    VERSION = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries = None
+        self.used = set()
+        self.dirty = False
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except IOError:
+            return {}
+        except Exception:
+            logger.warn('Discarding unreadable concept cache %s' % self.filename)
+            return {}
+        if data.get('version') != self.VERSION:
+            return {}
+        return data['entries']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get the cached extraction results for the text with this hash, or
+        None if there aren't any.
+        """
+        result = self.entries.get(key)
+        if result is not None:
+            self.used.add(key)
+        return result
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.used.add(key)
+        self.dirty = True
+
+    def collect_garbage(self):
+        """
+        Forget everything that hasn't been looked up or stored since this
+        cache was opened.
+        """
+        stale = [key for key in self.entries if key not in self.used]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.dirty = True
+        return len(stale)
+
+    def save(self):
+        if not self.dirty: return
+        save_pickle_atomically({'version': self.VERSION,
+                                'entries': self.entries}, self.filename)
+        self.dirty = False
+
+class VerdictCache(object):
+    """
+    Remembers which concepts pass a filter, such as the blacklist, so that
+    each distinct concept only has to be checked once.
+
+    The filter is identified by a `fingerprint`. Verdicts that were saved
+    with a different fingerprint are ignored, so changing the blacklist (or
+    anything else that goes into the fingerprint) starts over.
+    """
+    def __init__(self, filename, fingerprint):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.checked = 0
+
+    def _load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except IOError:
+            return {}
+        except Exception:
+            logger.warn('Discarding unreadable verdict cache %s' % self.filename)
+            return {}
+        if data.get('fingerprint') != self.fingerprint:
+            return {}
+        return data['verdicts']
+
+    def allowed(self, vocabulary, test):
+        """
+        Get the set of concepts in `vocabulary` for which `test(concept)`
+        is true, only running the test on concepts that aren't cached.
+
+        Afterward, the cache holds exactly the verdicts on `vocabulary`
+        and is saved if anything changed.
+        """
+        old = self._load()
+        verdicts = {}
+        self.checked = 0
+        for concept in vocabulary:
+            verdict = old.get(concept)
+            if verdict is None:
+                verdict = bool(test(concept))
+                self.checked += 1
+            verdicts[concept] = verdict
+        if self.checked or len(verdicts) != len(old):
+            save_pickle_atomically({'fingerprint': self.fingerprint,
+                                    'verdicts': verdicts}, self.filename)
+        return set(concept for concept, verdict in verdicts.items() if verdict)
+
+class StageCache(object):
+    """
+    Keeps the result of each stage of an analysis in `directory`, along
+    with the key of the inputs it was computed from, so that an analysis
+    only has to redo the stages whose inputs changed. Only the latest
+    result of each stage is kept.
+
+    A stage's key is a hash of everything its result depends on, including
+    the keys of the stages it uses, so a change to any input is passed on
+    to every stage after it.
+    """
+    # Increase this whenever a stage starts giving different results for
+    # the same inputs.
+    VERSION = 2
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def key(cls, name, inputs):
+        """
+        Make the key of stage `name` from `inputs`, which should be made of
+        things with a consistent repr, such as sorted lists.
+        """
+        sha = hashlib.sha1()
+        sha.update('%s %d\n' % (name, cls.VERSION))
+        sha.update(repr(inputs))
+        return sha.hexdigest()
+
+    def _filename(self, name, ext):
+        return os.path.join(self.directory, '%s.%s' % (name, ext))
+
+    def get(self, name, key):
+        """
+        Get the saved result of stage `name`, or raise KeyError if there
+        isn't one with this key.
+
+        Keys are kept in a small file of their own, so that a result that's
+        out of date is never loaded.
+        """
+        try:
+            with open(self._filename(name, 'key')) as f:
+                saved_key = f.read().strip()
+            if saved_key != key:
+                raise KeyError(name)
+            with open(self._filename(name, 'pickle'), 'rb') as f:
+                return pickle.load(f)
+        except IOError:
+            raise KeyError(name)
+        except (KeyError, MemoryError):
+            raise
+        except Exception:
+            logger.warn('Discarding unreadable %s stage' % name)
+            raise KeyError(name)
+
+    def previous(self, name):
+        """
+        Get the saved result of stage `name` whatever its inputs were, or
+        None if there isn't one.
+        """
+        try:
+            with open(self._filename(name, 'pickle'), 'rb') as f:
+                return pickle.load(f)
+        except IOError:
+            return None
+        except MemoryError:
+            raise
+        except Exception:
+            return None
+
+    def put(self, name, key, value):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        keyfile = self._filename(name, 'key')
+        if os.path.exists(keyfile):
+            os.remove(keyfile)
+        save_pickle_atomically(value, self._filename(name, 'pickle'))
+        # Written last, so an interrupted save leaves no key behind.
+        with open(keyfile, 'w') as out:
+            out.write(key + '\n')
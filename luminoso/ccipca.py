@@ -0,0 +1,86 @@
+"""
+Candid covariance-free incremental PCA (CCIPCA), from Weng, Zhang and
+Hwang, "Candid Covariance-Free Incremental Principal Component Analysis"
+(IEEE PAMI, 2003).
+
+CCIPCA keeps estimates of the top eigenvectors of the covariance of a
+stream of vectors, and updates them as each new vector arrives without
+ever forming the covariance matrix. Each eigenvector is kept scaled by its
+eigenvalue. A new vector pulls each one toward itself, in proportion to
+how much of the vector lies along it, and is then deflated by that
+eigenvector before it goes on to the next one.
+
+A study's SVD, A = U Sigma V^T, is the (uncentered) PCA of the columns of
+A: the columns of U are the eigenvectors of A A^T / n, with eigenvalues
+Sigma**2 / n, where n is the number of columns. In a study whose blend
+has a column for each document, CCIPCA can start from the SVD and fold new
+documents into it as new columns, which moves U and Sigma toward the SVD
+that a full analysis would find. (An associative study's columns are
+concepts, so this doesn't apply to it.)
+"""
+import numpy as np
+
+class CCIPCA(object):
+    """
+    Incremental estimates of the top eigenvectors and eigenvalues of the
+    covariance of a stream of vectors.
+
+    `vectors` is an n by k array whose columns are unit eigenvectors,
+    `values` their eigenvalues, and `count` the number of vectors they
+    summarize so far. `amnesia` makes newer vectors count for more than
+    older ones: 0 weights every vector equally, and Weng et al. suggest 2
+    to 4.
+    """
+    def __init__(self, vectors, values, count, amnesia=2.0):
+        vectors = np.asarray(vectors, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        self.weighted = vectors * values
+        self.count = count
+        self.amnesia = amnesia
+
+    @classmethod
+    def from_svd(cls, U, Sigma, ncols, amnesia=2.0):
+        """
+        Start from the SVD of a matrix with `ncols` columns.
+        """
+        Sigma = np.asarray(Sigma, dtype=np.float64)
+        return cls(U, Sigma ** 2 / ncols, ncols, amnesia)
+
+    def learn(self, x):
+        """
+        Update the estimates with one more vector `x`.
+        """
+        self.count += 1
+        n = float(self.count)
+        amnesia = min(self.amnesia, n - 1)
+        old_weight = (n - 1 - amnesia) / n
+        new_weight = (1 + amnesia) / n
+        u = np.array(x, dtype=np.float64)
+        for i in xrange(self.weighted.shape[1]):
+            v = self.weighted[:, i]
+            norm = np.sqrt(np.dot(v, v))
+            if norm == 0: continue
+            along = np.dot(u, v) / norm
+            v *= old_weight
+            v += (new_weight * along) * u
+            norm = np.sqrt(np.dot(v, v))
+            if norm == 0: continue
+            direction = v / norm
+            u -= np.dot(u, direction) * direction
+
+    def values(self):
+        return np.sqrt((self.weighted ** 2).sum(axis=0))
+
+    def vectors(self):
+        values = self.values()
+        return self.weighted / np.maximum(values, 1e-300)
+
+    def svd(self):
+        """
+        Get the U and Sigma of the SVD that the estimates correspond to,
+        largest singular value first.
+        """
+        values = self.values()
+        order = np.argsort(-values, kind='mergesort')
+        Sigma = np.sqrt(values[order] * self.count)
+        return self.vectors()[:, order], Sigma
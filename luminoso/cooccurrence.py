@@ -0,0 +1,320 @@
+"""
+Counting how often concepts appear near each other, which gives the
+association matrix of a study's documents.
+
+Two concepts are associated when they appear in the same sentence, or when
+one appears in a sentence and the other in the window of concepts that
+came before it in the same document. That window holds the last 100
+concepts before the previous sentence started, along with the sentences
+since then and every tag (a concept starting with '#') seen so far.
+
+:func:`association_matrix` computes this with sparse matrix products if
+SciPy is available, and otherwise falls back on counting pairs one at a
+time.
+"""
+import numpy as np
+from luminoso.entries import EntryBuffer, square_matrix_from_arrays
+from luminoso.parallel import parallel_map, worker_pool, close_pool
+from luminoso.spill import ExternalSum
+
+try:
+    import scipy.sparse
+    HAVE_SCIPY = True
+except ImportError:
+    HAVE_SCIPY = False
+
+# How many concepts before the previous sentence stay in the window.
+WINDOW_SIZE = 100
+
+# Each association worker gets at least this many documents.
+MIN_SHARD_DOCUMENTS = 50
+
+# When counting with a memory limit, documents are counted this many at a
+# time until we know how many entries a document tends to produce.
+FIRST_BATCH_DOCUMENTS = 200
+
+def association_matrix(documents, vocabulary, valid_concepts, workers=1,
+                       memory_limit=None, scratch_dir=None):
+    """
+    Get the square SparseMatrix of associations between `valid_concepts`
+    in `documents`. Concepts are numbered by their index in `vocabulary`.
+
+    If `memory_limit` is given, in bytes, the entries are counted with
+    :func:`count_associations_external`, spilling to `scratch_dir`.
+    """
+    concept_ids = dict((concept, vocabulary.index(concept))
+                       for concept in valid_concepts)
+    doc_sentences = [doc.parse().sentences for doc in documents]
+    if memory_limit:
+        values, rows, cols = count_associations_external(
+            doc_sentences, concept_ids, memory_limit, scratch_dir, workers)
+    else:
+        values, rows, cols = count_associations(doc_sentences, concept_ids,
+                                                workers)
+    assert len(values) > 0
+    return square_matrix_from_arrays(values, rows, cols, vocabulary)
+
+def count_associations(doc_sentences, concept_ids, workers=1):
+    """
+    Count the associations in a list of documents' sentences, returning
+    arrays of values, row ids and column ids. A (row, column) pair may be
+    repeated, in which case its values should be added.
+
+    With more than one worker, the documents are split into contiguous
+    shards, each shard's associations are counted in a separate process
+    using the same concept ids, and the results are put together.
+    """
+    if workers is None or workers < 1: workers = 1
+    shards = association_shards(0, len(doc_sentences), workers)
+    partials = parallel_map(shard_association_arrays, shards, workers,
+                            _set_shard_data, (doc_sentences, concept_ids))
+    _set_shard_data(None, None)
+    return _join_partials(partials)
+
+def association_shards(start, stop, workers):
+    """
+    Split the documents from `start` to `stop` into contiguous shards for
+    `workers` workers, as a list of `(start, stop)` pairs.
+    """
+    nshards = min(workers * 2, (stop - start) // MIN_SHARD_DOCUMENTS)
+    if workers == 1 or nshards <= 1:
+        nshards = 1
+    bounds = np.linspace(start, stop, nshards + 1).astype(int)
+    return [(bounds[i], bounds[i+1]) for i in xrange(nshards)]
+
+def _join_partials(partials):
+    if len(partials) == 1: return partials[0]
+    return tuple(np.concatenate(arrays) for arrays in zip(*partials))
+
+def count_associations_external(doc_sentences, concept_ids, memory_limit,
+                                scratch_dir=None, workers=1):
+    """
+    Count associations like :func:`count_associations`, but never hold much
+    more than `memory_limit` bytes of entries at once (plus the final
+    result, which has no repeated entries).
+
+    Documents are counted in batches, sized so that each batch's entries
+    fit in part of the budget. The batches' totals are kept in an
+    ExternalSum, which spills sorted runs to `scratch_dir` when they don't
+    fit, and merges them at the end. One pool of workers, which is given
+    all the documents when it starts, counts every batch.
+    """
+    if not concept_ids:
+        return np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if workers is None or workers < 1: workers = 1
+    size = max(concept_ids.values()) + 1
+    totals = ExternalSum(memory_limit, scratch_dir)
+    pool = worker_pool(workers, _set_shard_data, (doc_sentences, concept_ids))
+    failed = True
+    try:
+        start = 0
+        batch = FIRST_BATCH_DOCUMENTS
+        while start < len(doc_sentences):
+            stop = min(start + batch, len(doc_sentences))
+            shards = association_shards(start, stop, workers)
+            values, rows, cols = _join_partials(parallel_map(
+                shard_association_arrays, shards, workers, pool=pool))
+            totals.add(rows.astype(np.int64) * size + cols, values)
+            # Aim for batches that fill about a quarter of the buffer.
+            per_doc = max(1.0, float(len(values)) / (stop - start))
+            batch = max(1, int(totals.max_entries / 4 / per_doc))
+            start = stop
+        keys, values = totals.result()
+        failed = False
+    finally:
+        close_pool(pool, failed)
+        _set_shard_data(None, None)
+        totals.cleanup()
+    return values, keys // size, keys % size
+
+# The documents and concept ids that shard_association_arrays works on.
+# They're given to each worker process once, when it starts, so that on
+# systems that fork they don't need to be copied at all.
+_shard_sentences = None
+_shard_concept_ids = None
+
+def _set_shard_data(doc_sentences, concept_ids):
+    global _shard_sentences, _shard_concept_ids
+    _shard_sentences = doc_sentences
+    _shard_concept_ids = concept_ids
+
+def shard_association_arrays(shard):
+    """
+    Count the associations in the documents from `start` to `stop`, where
+    `shard` is `(start, stop)`. Returns arrays of values, row ids and
+    column ids, which may repeat (row, column) pairs.
+    """
+    start, stop = shard
+    doc_sentences = _shard_sentences[start:stop]
+    if HAVE_SCIPY:
+        occurrences = flatten_occurrences(doc_sentences, _shard_concept_ids)
+        if occurrences is not None:
+            return association_arrays(occurrences)
+    entries = association_entries(doc_sentences, _shard_concept_ids)
+    return entries.arrays()
+
+def association_entries(doc_sentences, concept_ids):
+    """
+    Count associations by visiting every pair of nearby concepts, and
+    return them as an EntryBuffer.
+    """
+    entries = EntryBuffer()
+    for sentences in doc_sentences:
+        prev_concepts = []
+        for concepts in sentences:
+            for concept1, value1 in concepts:
+                id1 = concept_ids.get(concept1)
+                if id1 is not None:
+                    for concept2, value2 in concepts:
+                        if concept2 in concept_ids and concept1 < concept2:
+                            id2 = concept_ids[concept2]
+                            entries.append(value1*value2, id1, id2)
+                            entries.append(value1*value2, id2, id1)
+                    for concept2, value2 in prev_concepts:
+                        if concept2 in concept_ids and concept1 != concept2:
+                            id2 = concept_ids[concept2]
+                            entries.append(value1*value2/2, id1, id2)
+                            entries.append(value1*value2/2, id2, id1)
+            # Remember tags, but forget words that were too long ago
+            prev_concepts = [p for p in prev_concepts[:-WINDOW_SIZE] if
+            p[0].startswith('#')] + prev_concepts[-WINDOW_SIZE:]
+            prev_concepts.extend(concepts)
+    return entries
+
+class Occurrences(object):
+    """
+    Every concept occurrence in a set of documents, flattened into arrays.
+
+    - `ids`: the concept id of each occurrence, or -1 if it isn't valid
+    - `values`: the value (polarity) of each occurrence
+    - `is_tag`: whether each occurrence is a tag
+    - `sentence_starts`: the index of the first occurrence of each
+      sentence, followed by the total number of occurrences
+    - `doc_starts`: for each sentence, the index of the first occurrence
+      in its document
+    - `floor_half`: whether the values are integers, so that neighbor
+      weights of `value1*value2/2` are rounded down by integer division
+    """
+    def __init__(self, ids, values, is_tag, sentence_starts, doc_starts,
+                 floor_half):
+        self.ids = ids
+        self.values = values
+        self.is_tag = is_tag
+        self.sentence_starts = sentence_starts
+        self.doc_starts = doc_starts
+        self.floor_half = floor_half
+
+def flatten_occurrences(doc_sentences, concept_ids):
+    """
+    Collect the Occurrences in a list of documents' sentences, numbering
+    concepts by `concept_ids` (which only holds valid ones). Returns None if the neighbor
+    weights can't be computed with matrix products: that is, if the values
+    mix integers and floats, or are integers other than 1 and -1.
+    """
+    ids = []
+    values = []
+    is_tag = []
+    sentence_starts = []
+    doc_starts = []
+    num_ints = 0
+    for sentences in doc_sentences:
+        doc_start = len(ids)
+        for concepts in sentences:
+            sentence_starts.append(len(ids))
+            doc_starts.append(doc_start)
+            for concept, value in concepts:
+                ids.append(concept_ids.get(concept, -1))
+                values.append(value)
+                is_tag.append(concept.startswith('#'))
+                if isinstance(value, (int, long)): num_ints += 1
+    sentence_starts.append(len(ids))
+    values = np.array(values, dtype=np.float64)
+    all_ints = (num_ints == len(values))
+    if num_ints and not (all_ints and np.all(np.abs(values) == 1)):
+        return None
+    return Occurrences(np.array(ids, dtype=np.int64), values,
+                       np.array(is_tag, dtype=bool),
+                       np.array(sentence_starts, dtype=np.int64),
+                       np.array(doc_starts, dtype=np.int64), all_ints)
+
+def _concatenated_ranges(starts, stops):
+    """
+    For each i, the numbers in range(starts[i], stops[i]), all in one
+    array, along with the i that each one came from.
+    """
+    lengths = stops - starts
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - offsets[owners] + starts[owners]
+    return positions, owners
+
+def window_matrix(occ):
+    """
+    Get the sparse matrix whose entry (s, k) is 1 when occurrence k is in
+    the window before sentence s.
+    """
+    num_sentences = len(occ.doc_starts)
+    num_occurrences = len(occ.ids)
+    starts = occ.sentence_starts[:-1]
+    # The window before the first sentence of a document is empty.
+    # Otherwise, it has every occurrence from WINDOW_SIZE before the
+    # previous sentence up to this sentence, and the tags before that.
+    prev_starts = np.concatenate([[0], starts[:-1]])
+    first = starts == occ.doc_starts
+    lo = np.maximum(occ.doc_starts, prev_starts - WINDOW_SIZE)
+    lo[first] = starts[first]
+    positions, rows = _concatenated_ranges(lo, starts)
+
+    tag_positions = np.flatnonzero(occ.is_tag & (occ.ids >= 0))
+    tag_lo = np.searchsorted(tag_positions, occ.doc_starts)
+    tag_hi = np.searchsorted(tag_positions, lo)
+    tag_indices, tag_rows = _concatenated_ranges(tag_lo, tag_hi)
+
+    rows = np.concatenate([rows, tag_rows])
+    cols = np.concatenate([positions, tag_positions[tag_indices]])
+    return scipy.sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)),
+        shape=(num_sentences, num_occurrences))
+
+def association_arrays(occ):
+    """
+    Compute the associations between the concepts in `occ`, returned as
+    arrays of values, row ids and column ids.
+
+    If X is the sentence-by-concept matrix and N is the matrix of concepts
+    in the window before each sentence, the associations within sentences
+    are X^T X, and those with the window are M + M^T, where M is X^T N
+    halved. Rounding down is handled by subtracting the number of pairs
+    before halving, since for values of 1 and -1, floor(v1*v2/2) is
+    (v1*v2 - 1)/2. Nothing is associated with itself.
+    """
+    num_sentences = len(occ.doc_starts)
+    num_occurrences = len(occ.ids)
+    valid = np.flatnonzero(occ.ids >= 0)
+    if len(valid) == 0:
+        nothing = np.zeros(0, dtype=np.int64)
+        return np.zeros(0), nothing, nothing
+    num_concepts = int(occ.ids.max()) + 1
+    shape = (num_occurrences, num_concepts)
+    signed = scipy.sparse.csr_matrix(
+        (occ.values[valid], (valid, occ.ids[valid])), shape=shape)
+    counts = scipy.sparse.csr_matrix(
+        (np.ones(len(valid)), (valid, occ.ids[valid])), shape=shape)
+
+    sentence_of = np.repeat(np.arange(num_sentences),
+                            np.diff(occ.sentence_starts))
+    in_sentence = scipy.sparse.csr_matrix(
+        (np.ones(num_occurrences), (sentence_of, np.arange(num_occurrences))),
+        shape=(num_sentences, num_occurrences))
+    window = window_matrix(occ)
+
+    X = in_sentence * signed
+    N = window * signed
+    neighbors = X.T * N
+    if occ.floor_half:
+        neighbors = neighbors - (in_sentence * counts).T * (window * counts)
+    neighbors = neighbors * 0.5
+    assoc = (X.T * X + neighbors + neighbors.T).tocoo()
+
+    keep = (assoc.row != assoc.col) & (assoc.data != 0)
+    return assoc.data[keep], assoc.row[keep], assoc.col[keep]
@@ -0,0 +1,198 @@
+"""
+The raw concept counts behind a study's document matrix, kept from one
+analysis to the next so that the matrix can be updated instead of rebuilt.
+
+Each study document's row of counts is stored along with the hash of the
+text it came from. When documents are added, changed or removed, only
+their rows are counted or forgotten, and the number of documents each
+concept appears in is adjusted to match. The TF-IDF weights, which change
+for every concept whenever the number of documents does, are then applied
+to all the rows at once with NumPy.
+"""
+from __future__ import with_statement
+import math
+import cPickle as pickle
+import numpy as np
+from csc import divisi2
+from csc.divisi2.ordered_set import OrderedSet
+from luminoso.cache import save_pickle_atomically
+from luminoso.entries import first_appearance
+import logging
+logger = logging.getLogger('luminoso')
+
+# Only this many concepts from the start of a document go into the document
+# matrix, whether it is built from these counts or from scratch.
+MAX_DOCUMENT_CONCEPTS = 1000
+
+def tfidf_from_counts(row_names, rows, ids, values, doc_totals, doc_freq,
+                      concepts):
+    """
+    Make the TF-IDF weighted matrix that `normalize_tfidf(cols_are_terms=True)`
+    would make from a document matrix of raw counts.
+
+    Each entry is a document's total value for a concept: `rows` are
+    indices into `row_names`, and `ids` are indices into `concepts`.
+    `doc_totals` gives the total absolute value of each document's row,
+    and `doc_freq` the number of rows that have a nonzero value for each
+    concept id. Concepts are in the order they first appear.
+    """
+    if len(ids) == 0:
+        return divisi2.SparseMatrix((0, 0)).normalize_tfidf(cols_are_terms=True)
+    ndocs = len(row_names)
+    concept_ids, cols = first_appearance(ids)
+    # As in normalize_tfidf, the idf uses integer division.
+    idf = np.array([freq and math.log(ndocs // freq) or 0.0
+                    for freq in doc_freq[concept_ids]])
+    nonzero = values != 0
+    rows, cols, values = rows[nonzero], cols[nonzero], values[nonzero]
+    weights = values / doc_totals[rows] * idf[cols]
+    matrix = divisi2.SparseMatrix.from_lists(weights, rows, cols,
+                                             nrows=ndocs,
+                                             ncols=len(concept_ids))
+    matrix.row_labels = OrderedSet(row_names)
+    matrix.col_labels = OrderedSet([concepts[i] for i in concept_ids])
+    return matrix
+
+class DocumentCounts(object):
+    """
+    The concept counts of each study document, saved in `filename`.
+
+    The counts depend on which concepts are allowed and on how concepts are
+    extracted, which are identified by a `fingerprint`. Counts that were
+    saved with a different fingerprint are thrown away.
+    """
+    VERSION = 1
+
+    def __init__(self, filename=None, fingerprint=None):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        # every concept that has been counted, giving each one an id
+        self.concepts = OrderedSet()
+        # for each document name, the hash of its text, and the ids and
+        # total values of its allowed concepts, in order of appearance
+        self.rows = {}
+        # how many documents have a nonzero total for each concept id
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.dirty = False
+        self.added = 0
+        self.removed = 0
+        if filename is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except IOError:
+            return
+        except Exception:
+            logger.warn('Discarding unreadable document counts %s'
+                        % self.filename)
+            return
+        if (data.get('version') != self.VERSION
+            or data.get('fingerprint') != self.fingerprint):
+            return
+        self.concepts = data['concepts']
+        self.rows = data['rows']
+        self.doc_freq = data['doc_freq']
+
+    def save(self):
+        if not self.dirty or self.filename is None: return
+        save_pickle_atomically({'version': self.VERSION,
+                                'fingerprint': self.fingerprint,
+                                'concepts': self.concepts,
+                                'rows': self.rows,
+                                'doc_freq': self.doc_freq}, self.filename)
+        self.dirty = False
+
+    def update(self, documents, allowed):
+        """
+        Make the counts match `documents`, counting the concepts in
+        `allowed` for the documents that are new or whose text has
+        changed, and forgetting the documents that are gone.
+        """
+        self.added = self.removed = 0
+        names = set()
+        for doc in documents:
+            names.add(doc.name)
+            row = self.rows.get(doc.name)
+            if row is not None:
+                if row[0] == doc.content_hash: continue
+                self._remove(doc.name)
+            self._add(doc, allowed)
+        for name in [name for name in self.rows if name not in names]:
+            self._remove(name)
+        if self.removed: self._compact()
+        logger.info('Document counts: %d added, %d removed, %d unchanged'
+                    % (self.added, self.removed, len(self.rows) - self.added))
+
+    def _add(self, doc, allowed):
+        totals = {}
+        order = []
+        for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+            if concept in allowed:
+                if concept not in totals:
+                    totals[concept] = 0
+                    order.append(concept)
+                totals[concept] += value
+        ids = np.array([self.concepts.add(concept) for concept in order],
+                       dtype=np.int64)
+        values = np.array([totals[concept] for concept in order],
+                          dtype=np.float64)
+        if len(self.doc_freq) < len(self.concepts):
+            grown = np.zeros(len(self.concepts), dtype=np.int64)
+            grown[:len(self.doc_freq)] = self.doc_freq
+            self.doc_freq = grown
+        self.doc_freq[ids[values != 0]] += 1
+        self.rows[doc.name] = (doc.content_hash, ids, values)
+        self.added += 1
+        self.dirty = True
+
+    def _remove(self, name):
+        content_hash, ids, values = self.rows.pop(name)
+        self.doc_freq[ids[values != 0]] -= 1
+        self.removed += 1
+        self.dirty = True
+
+    def _compact(self):
+        """
+        Forget the concepts that no counted document has any more, and
+        renumber the rest, so that the concepts and their document
+        frequencies don't keep growing as documents come and go.
+        """
+        used = np.zeros(len(self.concepts), dtype=bool)
+        for content_hash, ids, values in self.rows.values():
+            used[ids] = True
+        if used.all(): return
+        new_ids = np.cumsum(used) - 1
+        self.concepts = OrderedSet([concept for concept, keep
+                                    in zip(self.concepts, used) if keep])
+        self.doc_freq = self.doc_freq[used]
+        for name, (content_hash, ids, values) in self.rows.items():
+            self.rows[name] = (content_hash, new_ids[ids], values)
+        self.dirty = True
+
+    def tfidf_matrix(self, documents):
+        """
+        Make the TF-IDF weighted matrix of `documents`, which must all have
+        been counted. The result is exactly what
+        `normalize_tfidf(cols_are_terms=True)` gives on the raw counts:
+        documents without allowed concepts are left out, and concepts are
+        in the order they first appear.
+        """
+        named_rows = [(doc.name, self.rows[doc.name]) for doc in documents]
+        named_rows = [(name, row) for name, row in named_rows if len(row[1])]
+        if not named_rows:
+            return divisi2.SparseMatrix((0, 0)).normalize_tfidf(
+                cols_are_terms=True)
+        ids = np.concatenate([row[1] for name, row in named_rows])
+        values = np.concatenate([row[2] for name, row in named_rows])
+        rows = np.repeat(np.arange(len(named_rows)),
+                         [len(row[1]) for name, row in named_rows])
+        # The rows only hold counted documents, so the document
+        # frequencies of these concepts are the ones in the matrix.
+        doc_totals = np.bincount(rows, weights=np.abs(values),
+                                 minlength=len(named_rows))
+        return tfidf_from_counts([name for name, row in named_rows], rows,
+                                 ids, values, doc_totals, self.doc_freq,
+                                 self.concepts)
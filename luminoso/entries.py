@@ -0,0 +1,102 @@
+"""
+Compact buffers of sparse matrix entries.
+
+Building a study's matrices used to mean making a `(value, row_label,
+col_label)` tuple for every entry, which takes far more memory than the
+matrix itself. An EntryBuffer instead keeps integer ids in flat arrays,
+and labels are only attached when the divisi2 SparseMatrix is made.
+"""
+from array import array
+import numpy as np
+from csc import divisi2
+from csc.divisi2.ordered_set import OrderedSet
+
+def first_appearance(ids):
+    """
+    Renumber an array of ids as 0, 1, 2... in the order that each id first
+    appears, which is how divisi2 assigns indices to new labels.
+
+    Returns the distinct ids in that order, and the new number of each
+    entry in `ids`.
+    """
+    distinct, first, inverse = np.unique(ids, return_index=True,
+                                         return_inverse=True)
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return distinct[order], rank[inverse]
+
+class EntryBuffer(object):
+    """
+    The entries of a sparse matrix, as parallel arrays of float32 values
+    and integer row and column ids. Entries with the same row and column
+    are added together when the matrix is made, as they are by
+    `divisi2.make_sparse`.
+    """
+    def __init__(self):
+        self.values = array('f')
+        self.rows = array('i')
+        self.cols = array('i')
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value, row, col):
+        self.values.append(value)
+        self.rows.append(row)
+        self.cols.append(col)
+
+    def arrays(self):
+        """
+        Get the values, rows and columns as NumPy arrays, which share
+        memory with the buffer.
+        """
+        if len(self) == 0:
+            return (np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=np.int32))
+        return (np.frombuffer(self.values, dtype=np.float32),
+                np.frombuffer(self.rows, dtype=np.int32),
+                np.frombuffer(self.cols, dtype=np.int32))
+
+    def to_matrix(self, row_labels, col_labels):
+        """
+        Make a labeled SparseMatrix out of these entries. The labels of
+        row and column ids are looked up in `row_labels` and `col_labels`.
+
+        Only the rows and columns that have entries are included, in the
+        order they first appear, so the result is the same as running
+        `divisi2.make_sparse` on the equivalent list of named entries.
+        """
+        if len(self) == 0: return divisi2.SparseMatrix((0, 0))
+        values, rows, cols = self.arrays()
+        row_ids, rows = first_appearance(rows)
+        col_ids, cols = first_appearance(cols)
+        matrix = divisi2.SparseMatrix.from_lists(
+            values.astype(np.float64), rows, cols,
+            nrows=len(row_ids), ncols=len(col_ids))
+        matrix.row_labels = OrderedSet([row_labels[i] for i in row_ids])
+        matrix.col_labels = OrderedSet([col_labels[i] for i in col_ids])
+        return matrix
+
+    def to_square_matrix(self, labels):
+        """
+        Make a square SparseMatrix whose rows and columns both have
+        `labels`, like `SparseMatrix.square_from_named_entries`.
+        """
+        return square_matrix_from_arrays(*(self.arrays() + (labels,)))
+
+def square_matrix_from_arrays(values, rows, cols, labels):
+    """
+    Make a square SparseMatrix from parallel arrays of values, row ids and
+    column ids, including only the ids that appear, in the order they
+    first appear (looking at all the rows, then all the columns).
+    """
+    if len(values) == 0: return divisi2.SparseMatrix((0, 0))
+    n = len(rows)
+    ids, both = first_appearance(np.concatenate([rows, cols]))
+    matrix = divisi2.SparseMatrix.from_lists(
+        np.asarray(values, dtype=np.float64), both[:n], both[n:],
+        nrows=len(ids), ncols=len(ids))
+    matrix.row_labels = matrix.col_labels = \
+        OrderedSet([labels[i] for i in ids])
+    return matrix
@@ -31,6 +31,174 @@ class lazy_property(object):
 # For .all_concepts, only include concepts where we know more than this number of things.
 CUTOFF = 1
 
+# How many words to remember the lemmas of.
+WORD_SPLIT_CACHE_SIZE = 100000
+
+class MemoCache(object):
+    """
+    A bounded memo table that keeps track of how often it is useful.
+
+    Entries are kept in two generations. New entries go into the recent
+    generation; when that fills up, it becomes the old generation and the
+    previous old generation is thrown away. An old entry that gets looked
+    up is moved back into the recent generation. This approximates keeping
+    the most recently used entries, without any bookkeeping on a hit, and
+    never holds more than `maxsize` entries.
+
+        >>> cache = MemoCache(4)
+        >>> cache.get('cow')
+        >>> cache.put('cow', (u'cow', u''))
+        >>> cache.get('cow')
+        (u'cow', u'')
+        >>> cache.hits, cache.misses
+        (1, 1)
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._recent = {}
+        self._old = {}
+
+    def get(self, key):
+        """
+        Get the value stored for `key`, or None if there isn't one.
+        """
+        value = self._recent.get(key)
+        if value is None:
+            value = self._old.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.put(key, value)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if len(self._recent) >= self.maxsize // 2:
+            self._old = self._recent
+            self._recent = {}
+        self._recent[key] = value
+
+    def clear(self):
+        self._recent = {}
+        self._old = {}
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._recent) + len(self._old)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0: return 0.0
+        return float(self.hits) / lookups
+
+    def cache_info(self):
+        """
+        Describe how well the cache is working, so it can be sized.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self), 'maxsize': self.maxsize}
+
+# Everything tokenize() needs to change, found in a single scan. A match is
+# a special sequence along with any spaces after it, or a run of spaces that
+# needs to be collapsed.
+TOKENIZE_RE = re.compile(r"""
+    (?=[.,:;?!%"'()nc\ \n])
+    (?:
+        (?P<punct>[.,:;?!%]+[\ \n]*)
+      | (?P<quote>"[\ \n]*)
+      | (?P<negation>n't[\ \n]*)
+      | (?P<apostrophe>'[\ \n]*)
+      | (?P<cannot>cannot[\ \n]*)
+      | (?P<paren>[()][\ \n]*)
+      | (?P<space>\ [\ \n]+|\n[\ \n]*)
+    )
+""", re.VERBOSE)
+
+# Punctuation that is stripped from the ends of words before they are
+# lemmatized.
+LEMMA_PUNCT = string.punctuation.replace("'", "").replace('-', '').replace("`", "")
+
+# Text that doesn't match this is already tokenized, except perhaps for
+# whitespace at its ends.
+NEEDS_TOKENIZING_RE = re.compile(r"""[.,:;?!%"'()\r\n]|n't|cannot|\ \ """)
+
+def tokenize(text):
+    """
+    Tokenize `text` in one pass over it. See :meth:`EuroNL.tokenize`.
+
+    The output is exactly what the original series of replacements gave:
+
+    - Line breaks become spaces and carriage returns are dropped.
+    - An apostrophe after a space becomes a backquote; any other
+      apostrophe is split from the word before it, and "n't" is split off
+      as a whole. "cannot" becomes "can not".
+    - Pairs of double quotes become `` and ''. An unpaired final quote is
+      left alone.
+    - A run of .,:;?!% is split from the word before it if it is followed
+      by a space (including one inserted by the rules above) or ends the
+      text.
+    - Parentheses are split from both sides.
+    - Runs of spaces are collapsed, and the result is stripped.
+    """
+    if not NEEDS_TOKENIZING_RE.search(text):
+        return text.strip()
+    if '\r' in text: text = text.replace('\r', '')
+    nquotes = text.count('"')
+    paired_quotes = nquotes - nquotes % 2
+    textlen = len(text)
+    # [quotes seen so far, end of the previous match, whether the output
+    # for the previous match ended in a space]
+    state = [0, -1, False]
+
+    def replace(match):
+        start, end = match.span()
+        # Is the output just before this match already a space?
+        if start == state[1]: spaced = state[2]
+        else: spaced = text[start - 1] == ' '
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == 'space':
+            state[1] = end
+            state[2] = True
+            if spaced: return ''
+            return ' '
+        core = token.rstrip(' \n')
+        trail = len(core) < len(token)
+        if kind == 'punct':
+            if (trail or end == textlen or text[end] == "'"
+                or text.startswith("n't", end)
+                or (text[end] == '"' and state[0] < paired_quotes)):
+                if not spaced: core = ' ' + core
+        elif kind == 'quote':
+            index = state[0]
+            state[0] += 1
+            if index < paired_quotes:
+                if index % 2 == 0: core = '``'
+                else: core = "''"
+                if not spaced: core = ' ' + core
+                trail = True
+        elif kind == 'negation':
+            if not spaced: core = " n't"
+        elif kind == 'apostrophe':
+            if start > 0 and text[start - 1] in ' \n':
+                core = '`'
+                trail = True
+            elif not spaced:
+                core = " '"
+        elif kind == 'cannot':
+            core = 'can not'
+        else:
+            if not spaced: core = ' ' + core
+            trail = True
+        state[1] = end
+        state[2] = trail
+        if trail: return core + ' '
+        return core
+
+    return TOKENIZE_RE.sub(replace, text).strip()
+
 class EuroNL(NLTools):
     """
     A language that generally follows our assumptions about European languages,
@@ -108,14 +276,7 @@ class EuroNL(NLTools):
             True
 
         """
-        step0 = text.replace('\r', '').replace('\n', ' ')
-        step1 = step0.replace(" '", " ` ").replace("'", " '").replace("n 't", 
-        " n't").replace("cannot", "can not")
-        step2 = re.sub('"([^"]*)"', r" `` \1 '' ", step1)
-        step3 = re.sub(r'([.,:;?!%]+) ', r" \1 ", step2)
-        step4 = re.sub(r'([.,:;?!%]+)$', r" \1", step3)
-        step5 = re.sub(r'([()])', r" \1 ", step4)
-        return re.sub(r'  +', ' ', step5).strip()
+        return tokenize(text)
 
     def untokenize(self, text):
         """
@@ -270,6 +431,13 @@ class EuroNL(NLTools):
         else:
             return list(windows)
                 
+    def normalized_words(self, text):
+        """
+        Get the words of the normalized form of `text`, the same as
+        `self.normalize(text).split()`. Subclasses may do this more quickly.
+        """
+        return self.normalize(text).split()
+
     def extract_concepts(self, text, max_words=2, check_conceptnet=False, also_allow=[]):
         """
         Extract a list of the concepts that are directly present in ``text``.
@@ -287,7 +455,7 @@ class EuroNL(NLTools):
             >>> en_nl.extract_concepts('People can be eating rice.', max_words=2, check_conceptnet=True)
             [u'person eat', u'person', u'eat rice', u'eat', u'rice']
         """
-        words = self.normalize(text).split()
+        words = self.normalized_words(text)
         windows = self.get_windows(words, window_size=max_words)
         if check_conceptnet:
             return [concept for concept in windows
@@ -350,6 +518,23 @@ class LemmatizedEuroNL(EuroNL):
         >>> en_nl.word_split(u'people')
         (u'person', u's')
         """
+        cache = self.word_split_cache
+        result = cache.get(word)
+        if result is None:
+            result = self._word_split(word)
+            cache.put(word, result)
+        return result
+
+    @lazy_property
+    def word_split_cache(self):
+        """
+        Remembers the results of :meth:`word_split` for the most frequently
+        seen words. Its `hits` and `misses` attributes (or `cache_info()`)
+        show how well it's working.
+        """
+        return MemoCache(WORD_SPLIT_CACHE_SIZE)
+
+    def _word_split(self, word):
         if word in self.exceptions:
             return self.exceptions[word]
         try:
@@ -358,7 +543,7 @@ class LemmatizedEuroNL(EuroNL):
             return (lemma, residue)
         except IndexError:
             return (word, u'')
-        
+
     def lemma_split(self, text, keep_stopwords=False):
         """
         When you *lemma split* or *lemma factor* a string, you get two strings
@@ -375,39 +560,58 @@ class LemmatizedEuroNL(EuroNL):
             (u'testy test ever test', u'this is the 1iest 2 that 3 was 4ed')
         """
         if not isinstance(text, unicode): text = text.decode('utf-8')
-        text = self.tokenize(text)
-        punct = string.punctuation.replace("'", "").replace('-',
-        '').replace("`", "")
-        
-        words = text.replace('/', ' ').split()
-        words = [w.strip(punct).lower() for w in words]
-        words = [self.autocorrect.get(word, word) for word in words if word]
-        lemma_tuples = [self.word_split(word) for word in words]
-        lemmas_pre = []
-        residue_pre = []
-        lemma_index = 0
-        for i in range(len(words)):
-            if not keep_stopwords and words[i] in self.stopwords:
-                residue_pre.append((None, words[i]))
-            else:
-                lemmas_pre.append((lemma_tuples[i][0], lemma_index))
-                residue_pre.append((lemma_index, lemma_tuples[i][1]))
-                lemma_index += 1
-        #lemmas_pre.sort()
-        permute = [l[1] for l in lemmas_pre]
-        invpermute = [permute.index(i) for i in range(len(permute))]
-        lemmas = [l[0] for l in lemmas_pre]
-        lemmas = [self.swapdict.get(lemma, lemma) for lemma in lemmas]
-
+        text, words = self._lemma_words(text)
+        stopwords = self.stopwords
+        swapdict = self.swapdict
+        lemmas = []
         residue = []
-        for lemma_index, ltext in residue_pre:
-            if lemma_index is None: residue.append(ltext)
-            else: residue.append(str(invpermute[lemma_index]+1) + ltext)
+        for word in words:
+            if not keep_stopwords and word in stopwords:
+                residue.append(word)
+            else:
+                lemma, inflection = self.word_split(word)
+                lemmas.append(swapdict.get(lemma, lemma))
+                # The lemmas stay in their original order, so each one is
+                # referred to by its position.
+                residue.append(str(len(lemmas)) + inflection)
         if len(lemmas) == 0 and not keep_stopwords:
             return self.lemma_split(text, keep_stopwords=True)
         return (u' '.join(lemmas), u' '.join(residue))
     lemma_factor = lemma_split
 
+    def _lemma_words(self, text):
+        """
+        Tokenize `text` and get the words in it that should be lemmatized.
+        Returns the tokenized text along with the words.
+        """
+        text = self.tokenize(text)
+        words = text.replace('/', ' ').split()
+        words = [w.strip(LEMMA_PUNCT).lower() for w in words]
+        autocorrect = self.autocorrect
+        return text, [autocorrect.get(word, word) for word in words if word]
+
+    def _normal_lemmas(self, text):
+        """
+        Get the list of lemmas that make up the normal form of `text`,
+        without building the residue that :meth:`lemma_split` would.
+        """
+        if not isinstance(text, unicode): text = text.decode('utf-8')
+        text, words = self._lemma_words(text)
+        stopwords = self.stopwords
+        swapdict = self.swapdict
+        lemmas = []
+        for word in words:
+            if word not in stopwords:
+                lemma = self.word_split(word)[0]
+                lemmas.append(swapdict.get(lemma, lemma))
+        if len(lemmas) == 0:
+            # Like lemma_split, fall back on keeping the stopwords.
+            text, words = self._lemma_words(text)
+            for word in words:
+                lemma = self.word_split(word)[0]
+                lemmas.append(swapdict.get(lemma, lemma))
+        return lemmas
+
     def normalize(self, text):
         """
         When you *normalize* a string (no relation to the operation of
@@ -421,9 +625,23 @@ class LemmatizedEuroNL(EuroNL):
             >>> en_nl.normalize("This is the testiest test that ever was tested")
             u'testy test ever test'
         """
-        return self.lemma_split(text)[0]
+        return u' '.join(self._normal_lemmas(text))
     normalize4 = normalize
 
+    def normalized_words(self, text):
+        """
+        Get the words of the normalized form of `text`. This is the same as
+        `self.normalize(text).split()`, but it takes time linear in the
+        length of the text and never builds the residue.
+
+            >>> en_nl.normalized_words("This is the testiest test that ever was tested")
+            [u'testy', u'test', u'ever', u'test']
+        """
+        words = []
+        for lemma in self._normal_lemmas(text):
+            words.extend(lemma.split())
+        return words
+
     def lemma_combine(self, lemmas, residue):
         """
         This is the inverse of :meth:`lemma_factor` -- it takes in a normal
@@ -0,0 +1,201 @@
+"""
+A language pack is a single binary file that holds everything a
+:class:`LemmatizedEuroNL` needs: its word lists, mappings, lemmatizer and
+unlemmatizer.
+
+Unlike the pickled modules that `make_standalone.py` used to write, nothing
+is read when the language is loaded. Each section is read the first time it
+is used, and the tries are memory-mapped rather than unpickled, so a
+program that never lemmatizes anything never pays for the lemmatizer.
+
+The file starts with `LANGPACK_MAGIC`, the length of a JSON header, and the
+header, which gives the offset and length of each section. Sections start
+on 8-byte boundaries.
+"""
+import os, sys
+import mmap
+import struct
+from trie import CompactTrie
+from euro import LemmatizedEuroNL, lazy_property
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+LANGPACK_MAGIC = 'LUMLPK1\n'
+
+WORDLISTS = ('stopwords', 'blacklist', 'frequencies')
+MAPPINGS = ('autocorrect', 'swapdict', 'exceptions')
+
+def _pad(n, alignment=8):
+    return '\0' * (-n % alignment)
+
+def write_language_pack(nl, filename):
+    """
+    Write the data of the LemmatizedEuroNL `nl` to a language pack.
+    """
+    sections = []
+    for name in WORDLISTS:
+        sections.append((name, u'\n'.join(sorted(getattr(nl, name))).encode('utf-8')))
+    for name in MAPPINGS:
+        sections.append((name, json.dumps(getattr(nl, name))))
+    sections.append(('lemmatizer', CompactTrie.from_node(nl.lemmatizer).to_string()))
+    unlem_keys = sorted(nl.unlemmatizer.keys())
+    for i, key in enumerate(unlem_keys):
+        trie = CompactTrie.from_node(nl.unlemmatizer[key])
+        sections.append(('unlemmatizer/%d' % i, trie.to_string()))
+
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        layout[name] = (offset, len(data))
+        offset += len(data) + len(_pad(len(data)))
+    header = json.dumps({'lang': nl.lang, 'sections': layout,
+                         'unlemmatizer': unlem_keys})
+    prefix = LANGPACK_MAGIC + struct.pack('<I', len(header)) + header
+    out = open(filename, 'wb')
+    try:
+        out.write(prefix + _pad(len(prefix)))
+        for name, data in sections:
+            out.write(data + _pad(len(data)))
+    finally:
+        out.close()
+
+def pack_path(module_file, filename):
+    """
+    Find the language pack `filename` that was written next to the module
+    `module_file`. In a frozen (PyInstaller) build the modules live inside
+    the executable's archive, so the pack is shipped as a data file next to
+    the executable instead.
+    """
+    path = os.path.join(os.path.dirname(module_file), filename)
+    if getattr(sys, 'frozen', False) and not os.path.exists(path):
+        path = os.path.join(os.path.dirname(sys.executable), filename)
+    return path
+
+class LanguagePack(object):
+    """
+    Read access to the sections of a language pack. The file is opened and
+    memory-mapped the first time a section is asked for.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    @lazy_property
+    def buffer(self):
+        f = open(self.filename, 'rb')
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+    @lazy_property
+    def header(self):
+        buffer = self.buffer
+        start = len(LANGPACK_MAGIC)
+        if buffer[:start] != LANGPACK_MAGIC:
+            raise ValueError("%s is not a language pack" % self.filename)
+        header_len = struct.unpack('<I', buffer[start:start+4])[0]
+        header = json.loads(buffer[start+4:start+4+header_len])
+        header['start'] = start + 4 + header_len + len(_pad(start + 4 + header_len))
+        return header
+
+    def section_offset(self, name):
+        offset, length = self.header['sections'][name]
+        return self.header['start'] + offset, length
+
+    def section(self, name):
+        offset, length = self.section_offset(name)
+        return self.buffer[offset:offset+length]
+
+    def wordlist(self, name):
+        data = self.section(name).decode('utf-8')
+        if not data: return set()
+        return set(data.split(u'\n'))
+
+    def mapping(self, name):
+        return json.loads(self.section(name))
+
+    def trie(self, name):
+        offset, length = self.section_offset(name)
+        return CompactTrie.from_buffer(self.buffer, offset)
+
+class TrieDict(object):
+    """
+    The unlemmatizer of a language pack: a read-only mapping from
+    `(pos, inflection)` to a :class:`CompactTrie`, which only reads each
+    trie when it is first looked up.
+    """
+    def __init__(self, pack):
+        self.pack = pack
+        self.index = {}
+        for i, (pos, infl) in enumerate(pack.header['unlemmatizer']):
+            self.index[pos, infl] = 'unlemmatizer/%d' % i
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        trie = self.loaded.get(key)
+        if trie is None:
+            trie = self.loaded[key] = self.pack.trie(self.index[key])
+        return trie
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+class PackedEuroNL(LemmatizedEuroNL):
+    """
+    A LemmatizedEuroNL whose data comes from a language pack. Creating one
+    is nearly free; each piece of data is loaded when it's first needed.
+    """
+    def __init__(self, filename, lang):
+        self.filename = filename
+        self.lang = lang
+        self.pack = LanguagePack(filename)
+
+    def __reduce__(self):
+        # Memory maps can't be pickled, but the file can be opened again.
+        return (PackedEuroNL, (self.filename, self.lang))
+
+    @lazy_property
+    def stopwords(self):
+        return self.pack.wordlist('stopwords')
+
+    @lazy_property
+    def blacklist(self):
+        return self.pack.wordlist('blacklist')
+
+    @lazy_property
+    def frequencies(self):
+        return self.pack.wordlist('frequencies')
+
+    @lazy_property
+    def autocorrect(self):
+        return self.pack.mapping('autocorrect')
+
+    @lazy_property
+    def swapdict(self):
+        return self.pack.mapping('swapdict')
+
+    @lazy_property
+    def exceptions(self):
+        return dict((word, tuple(split)) for word, split in
+                    self.pack.mapping('exceptions').items())
+
+    @lazy_property
+    def exceptions_rev(self):
+        return dict((split, word) for word, split in self.exceptions.items())
+
+    @lazy_property
+    def lemmatizer(self):
+        return self.pack.trie('lemmatizer')
+
+    @lazy_property
+    def unlemmatizer(self):
+        return TrieDict(self.pack)
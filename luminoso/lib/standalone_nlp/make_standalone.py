@@ -1,29 +1,43 @@
 from __future__ import with_statement
 __import__('os').environ.setdefault('DJANGO_SETTINGS_MODULE', 'csc.django_settings')
 from csc.nl import get_nl
+from csc.nl.euro import LemmatizedEuroNL
 import cPickle as pickle
 import local_unpickle
+from standalone_nlp.langpack import write_language_pack
+
+# The module that loads a language pack. Loading is lazy, so importing it
+# costs almost nothing.
+PACK_MODULE = '''from standalone_nlp.langpack import PackedEuroNL, pack_path
+%(lcode)s_nl = nltools = PackedEuroNL(
+    pack_path(__file__, 'lang_%(lcode)s.lpk'), %(lcode)r)
+'''
 
 def make_standalone(lcode):
     nl = get_nl(lcode)
+    # Pre-load objects
+    nl.stopwords
+    nl.lemmatizer
+    nl.unlemmatizer
+    nl.swapdict
+    nl.autocorrect
+    nl.blacklist
+    nl.frequencies
+
+    fake_picklestr = pickle.dumps(nl)
+    fake_obj = local_unpickle.loads(fake_picklestr)
+
     with open('lang_%s.py' % lcode, 'w') as out_py:
+        if isinstance(nl, LemmatizedEuroNL):
+            write_language_pack(fake_obj, 'lang_%s.lpk' % lcode)
+            out_py.write(PACK_MODULE % {'lcode': lcode})
+            return
+
+        # Other languages are still stored as a pickle.
         out_py.write('import sys, os\n')
         out_py.write('import cPickle as pickle\n')
         out_py.write('sys.path.insert(0, os.path.dirname(__file__))\n')
-        
-        # Pre-load objects
-        nl.stopwords
-        nl.lemmatizer
-        nl.unlemmatizer
-        nl.swapdict
-        nl.autocorrect
-        nl.blacklist
-        nl.frequencies
-
-        fake_picklestr = pickle.dumps(nl)
-        fake_obj = local_unpickle.loads(fake_picklestr)
         picklestr = pickle.dumps(fake_obj)
-
         out_py.write('picklestr = """%s"""\n' % (picklestr))
         out_py.write('%s_nl = nltools = pickle.loads(picklestr)\n' % (lcode))
 
@@ -0,0 +1,119 @@
+"""
+Check the single-pass tokenizer in euro.py against the series of
+replacements it was written to replace, and measure how fast both are.
+
+Run it on one or more study directories or text files:
+
+    python tokenize_bench.py ../../../ThaiFoodStudy
+
+It reports every document whose tokens differ (there should be none),
+followed by throughput on whole documents in MB/s and on two-word phrases,
+like the ones that blacklist checks tokenize, in calls per second.
+"""
+import os, sys, re, time, random, codecs
+from euro import tokenize
+
+def legacy_tokenize(text):
+    """
+    The original implementation of EuroNL.tokenize, kept as a reference.
+    """
+    step0 = text.replace('\r', '').replace('\n', ' ')
+    step1 = step0.replace(" '", " ` ").replace("'", " '").replace("n 't",
+    " n't").replace("cannot", "can not")
+    step2 = re.sub('"([^"]*)"', r" `` \1 '' ", step1)
+    step3 = re.sub(r'([.,:;?!%]+) ', r" \1 ", step2)
+    step4 = re.sub(r'([.,:;?!%]+)$', r" \1", step3)
+    step5 = re.sub(r'([()])', r" \1 ", step4)
+    return re.sub(r'  +', ' ', step5).strip()
+
+def find_texts(paths):
+    """
+    Get (filename, text) for every .txt file in the given files and
+    directories.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.endswith('.txt'):
+                        found.append(os.path.join(dirpath, filename))
+        else:
+            found.append(path)
+    texts = []
+    for filename in found:
+        f = codecs.open(filename, encoding='utf-8', errors='replace')
+        texts.append((filename, f.read()))
+        f.close()
+    return texts
+
+def diff_texts(texts):
+    """
+    Return the names of the texts that the two tokenizers disagree on.
+    """
+    return [name for name, text in texts
+            if tokenize(text) != legacy_tokenize(text)]
+
+# The characters that the tokenizer treats specially, and some ordinary
+# ones to go between them.
+FUZZ_PIECES = (list(u"ab n't canot \n\r\t\"'.,:;?!%()`-#\xe9") +
+               [u'cannot', u"n't", u'  ', u'x'])
+
+def fuzz(trials=100000, seed=0):
+    """
+    Compare the tokenizers on random short strings made of the pieces they
+    care about. Returns the strings they disagree on.
+    """
+    rand = random.Random(seed)
+    bad = []
+    for i in xrange(trials):
+        text = u''.join(rand.choice(FUZZ_PIECES)
+                        for j in xrange(rand.randint(0, 16)))
+        if tokenize(text) != legacy_tokenize(text):
+            bad.append(text)
+    return bad
+
+def throughput(func, texts, repeat=3):
+    """
+    Get the best time, in seconds, to run `func` over all of `texts`.
+    """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        for text in texts:
+            func(text)
+        elapsed = time.time() - start
+        if best is None or elapsed < best: best = elapsed
+    return max(best, 1e-9)
+
+def benchmark(texts):
+    documents = [text for name, text in texts]
+    megabytes = sum(len(text.encode('utf-8')) for text in documents) / 1e6
+    words = legacy_tokenize(u' '.join(documents)).split()
+    phrases = [u' '.join(words[i:i+2]) for i in xrange(len(words) - 1)]
+
+    print "%-10s %12s %16s" % ('', 'documents', 'phrases')
+    for name, func in [('legacy', legacy_tokenize), ('one-pass', tokenize)]:
+        doc_time = throughput(func, documents)
+        phrase_time = throughput(func, phrases)
+        print "%-10s %7.2f MB/s %9d calls/s" % (name, megabytes / doc_time,
+                                                len(phrases) / phrase_time)
+
+def main(paths):
+    texts = find_texts(paths)
+    bad = diff_texts(texts)
+    for name in bad:
+        print "DIFFERS: %s" % name
+    print "%d of %d documents tokenized differently" % (len(bad), len(texts))
+    bad = fuzz()
+    for text in bad[:20]:
+        print "DIFFERS: %r" % text
+    print "%d random strings tokenized differently" % len(bad)
+    if texts:
+        benchmark(texts)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        print __doc__
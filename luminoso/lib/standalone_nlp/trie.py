@@ -1,4 +1,11 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+import mmap
+import struct
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 class Leaf(object):
     existing = {}
@@ -81,16 +88,34 @@ class Node(object):
     
     def add_leaf(self, leaf):
         self.leaf_index[leaf.pos, leaf.inflections].append(leaf)
+        self._sorted_leaves = None
 
     def leaves(self):
-        result = []
-        for leaflist in self.leaf_index.values():
-            result.extend(leaflist)
-        # ignore rare/archaic inflections
-        result = [leaf for leaf in result if not israre(leaf.inflections)]
-        result.sort(key=lambda leaf: (pos_order(leaf.pos),
-          -10*len(leaf.delete)+len(leaf.add)))
+        """
+        Get the leaves at this node, best first, leaving out rare and archaic
+        inflections.
+
+        The list is computed once and then reused, so don't modify it.
+        """
+        # Nodes are usually unpickled without running __init__, so the
+        # cached list may not be there at all.
+        result = self.__dict__.get('_sorted_leaves')
+        if result is None:
+            result = []
+            for leaflist in self.leaf_index.values():
+                result.extend(leaflist)
+            # ignore rare/archaic inflections
+            result = [leaf for leaf in result if not israre(leaf.inflections)]
+            result.sort(key=lambda leaf: (pos_order(leaf.pos),
+              -10*len(leaf.delete)+len(leaf.add)))
+            self._sorted_leaves = result
         return result
+
+    def __getstate__(self):
+        # Don't save the cached leaf list.
+        state = self.__dict__.copy()
+        state.pop('_sorted_leaves', None)
+        return state
         
     def add(self, key, leaf):
         if len(key) == 0: self.add_leaf(leaf)
@@ -136,4 +161,252 @@ class Node(object):
 def default_trie():
     return Node(leaves=[Leaf('', '', None, None)])
 
+class CompactLeaf(object):
+    """
+    A leaf of a :class:`CompactTrie`. It works like a :class:`Leaf`, but
+    takes much less memory.
+    """
+    __slots__ = ('add', 'delete', 'pos', 'inflections')
+
+    def __init__(self, add, delete, pos, inflections):
+        self.add = add
+        self.delete = delete
+        self.pos = pos
+        self.inflections = inflections
+
+    def apply(self, string):
+        if len(self.delete) == 0:
+            stem = string
+        else:
+            stem = string[:-len(self.delete)]
+        return (stem + self.add, self.pos, self.inflections)
+
+    def __repr__(self):
+        if self.add: addstr = " +%s" % self.add
+        else: addstr = ''
+        if self.delete: delstr = " -%s" % self.delete
+        else: delstr = ''
+        return "<CompactLeaf%s%s (%s.%s)>" % (addstr, delstr, self.pos,
+        self.inflections)
+
+COMPACT_TRIE_MAGIC = 'LUMTRIE1'
+EMPTY, ROOT_CHECK = -1, -2
+
+def _align(n, alignment=8):
+    return (n + alignment - 1) // alignment * alignment
+
+class CompactTrie(object):
+    """
+    A read-only version of a :class:`Node` trie, stored in a handful of flat
+    integer arrays instead of a graph of Python objects. It gives the same
+    results from `lookup`, `mblem`, `unlem` and `leaves`.
+
+    The trie is a *double array*: the state reached from `state` on a
+    character with code `c` is `base[state] + c`, provided that `check` at
+    that position is `state`. Each state's leaves, already sorted and
+    filtered as :meth:`Node.leaves` would return them, are
+    `leaf_ids[leaf_start[state]:leaf_start[state+1]]`, which index into a
+    small table of :class:`CompactLeaf` objects.
+
+    Use :meth:`from_node` to convert an existing trie, :meth:`save` to
+    write it to a file, and :meth:`load` to memory-map it back.
+    """
+    ARRAYS = ('base', 'check', 'leaf_start', 'leaf_ids')
+
+    def __init__(self, alphabet, base, check, leaf_start, leaf_ids, leaves,
+                 permutation=None):
+        self.alphabet = alphabet
+        self.codes = dict((char, i+1) for i, char in enumerate(alphabet))
+        self.base = base
+        self.check = check
+        self.leaf_start = leaf_start
+        self.leaf_ids = leaf_ids
+        self.leaf_table = leaves
+        self.permutation = permutation
+        self._state_leaves = {}
+
+    @classmethod
+    def from_node(cls, root):
+        """
+        Convert a trie made of :class:`Node` objects.
+        """
+        import numpy as np
+        alphabet = set()
+        for node, suffix in root.walk(''):
+            alphabet.update(node.trie.keys())
+        alphabet = u''.join(sorted(alphabet))
+        codes = dict((char, i+1) for i, char in enumerate(alphabet))
+
+        base = [0]
+        check = [ROOT_CHECK]
+        states = [root]
+        # The lowest position that no state has taken yet. Positions are
+        # never given up, so it only moves forward.
+        first_free = 1
+        # Place the children of each state in breadth-first order. Children
+        # can go anywhere there's room, including before their parent, so
+        # the states still to be expanded are kept in a queue.
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            children = sorted((codes[key], child)
+                              for key, child in states[state].trie.items())
+            if not children: continue
+            while first_free < len(check) and check[first_free] != EMPTY:
+                first_free += 1
+            b = max(1, first_free - children[0][0])
+            while True:
+                needed = b + children[-1][0] + 1
+                if needed > len(check):
+                    check.extend([EMPTY] * (needed - len(check)))
+                    base.extend([0] * (needed - len(base)))
+                    states.extend([None] * (needed - len(states)))
+                if all(check[b + code] == EMPTY for code, child in children):
+                    break
+                b += 1
+            base[state] = b
+            for code, child in children:
+                check[b + code] = state
+                states[b + code] = child
+                queue.append(b + code)
+
+        leaf_table = []
+        leaf_numbers = {}
+        leaf_start = [0]
+        leaf_ids = []
+        for node in states:
+            if node is not None:
+                for leaf in node.leaves():
+                    key = (leaf.add, leaf.delete, leaf.pos, leaf.inflections)
+                    if key not in leaf_numbers:
+                        leaf_numbers[key] = len(leaf_table)
+                        leaf_table.append(CompactLeaf(*key))
+                    leaf_ids.append(leaf_numbers[key])
+            leaf_start.append(len(leaf_ids))
+
+        def int_array(values):
+            return np.array(values, dtype='<i4')
+        return cls(alphabet, int_array(base), int_array(check),
+                   int_array(leaf_start), int_array(leaf_ids), leaf_table,
+                   getattr(root, 'permutation', None))
+
+    def state_leaves(self, state):
+        leaves = self._state_leaves.get(state)
+        if leaves is None:
+            table = self.leaf_table
+            leaves = [table[i] for i in
+                      self.leaf_ids[self.leaf_start[state]:self.leaf_start[state+1]]]
+            self._state_leaves[state] = leaves
+        return leaves
+
+    def leaves(self):
+        return self.state_leaves(0)
+
+    def lookup(self, seq, pos=None, infl=None):
+        codes = self.codes
+        base = self.base
+        check = self.check
+        size = len(check)
+        state = 0
+        i = 0
+        while True:
+            if i < len(seq): key = seq[i]
+            else: key = '='
+            code = codes.get(key)
+            if code is None: break
+            target = int(base[state]) + code
+            if target >= size or check[target] != state: break
+            state = target
+            i += 1
+        return self.state_leaves(state)
+
+    def permute(self, string):
+        if self.permutation is not None:
+            padded = '='*(20-len(string)) + string
+            return [padded[i] for i in self.permutation]
+        else:
+            return list(string[::-1])
+
+    def mblem(self, string, pos=None, infl=None):
+        seq = self.permute(string)
+        leaves = self.lookup(seq, pos, infl)
+        return [leaf.apply(string) for leaf in leaves]
+
+    def unlem(self, string):
+        leaves = self.lookup(string[::-1])
+        return [leaf.apply(string)[0] for leaf in leaves]
+
+    def __repr__(self):
+        return "<CompactTrie: %d states, %d leaf types>" % (len(self.check),
+                                                            len(self.leaf_table))
+
+    def to_string(self):
+        """
+        Serialize this trie as a string of bytes, which :meth:`from_buffer`
+        can read back without copying the arrays.
+        """
+        if self.permutation is None: permutation = None
+        else: permutation = list(self.permutation)
+        arrays = [getattr(self, name).astype('<i4') for name in self.ARRAYS]
+        layout = []
+        offset = 0
+        for name, array in zip(self.ARRAYS, arrays):
+            layout.append((name, offset, len(array)))
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            'alphabet': self.alphabet,
+            'permutation': permutation,
+            'leaves': [(leaf.add, leaf.delete, leaf.pos, leaf.inflections)
+                       for leaf in self.leaf_table],
+            'arrays': layout,
+        })
+        prefix = COMPACT_TRIE_MAGIC + struct.pack('<I', len(header)) + header
+        parts = [prefix, '\0' * (_align(len(prefix)) - len(prefix))]
+        for (name, offset, count), array in zip(layout, arrays):
+            parts.append(array.tostring())
+            parts.append('\0' * (_align(array.nbytes) - array.nbytes))
+        return ''.join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer, offset=0):
+        """
+        Read a trie that was serialized with :meth:`to_string` and starts at
+        `offset` in `buffer`. The arrays share memory with the buffer, so if
+        it is memory-mapped, they are only paged in as they're used.
+        """
+        import numpy as np
+        end = offset + len(COMPACT_TRIE_MAGIC)
+        if buffer[offset:end] != COMPACT_TRIE_MAGIC:
+            raise ValueError("not a compact trie")
+        header_len = struct.unpack('<I', buffer[end:end+4])[0]
+        header = json.loads(buffer[end+4:end+4+header_len])
+        start = offset + _align(end + 4 + header_len - offset)
+        arrays = {}
+        for name, array_offset, count in header['arrays']:
+            arrays[name] = np.frombuffer(buffer, dtype='<i4', count=count,
+                                         offset=start + array_offset)
+        leaves = [CompactLeaf(*leaf) for leaf in header['leaves']]
+        permutation = header['permutation']
+        if permutation is not None: permutation = tuple(permutation)
+        return cls(header['alphabet'], arrays['base'], arrays['check'],
+                   arrays['leaf_start'], arrays['leaf_ids'], leaves,
+                   permutation)
+
+    def save(self, filename):
+        out = open(filename, 'wb')
+        try:
+            out.write(self.to_string())
+        finally:
+            out.close()
 
+    @classmethod
+    def load(cls, filename):
+        """
+        Memory-map a trie that was written with :meth:`save`.
+        """
+        f = open(filename, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        return cls.from_buffer(buffer)
@@ -0,0 +1,108 @@
+"""
+A manifest records the size, modification time and hash of every file that
+goes into a study, so that we can tell whether saved results are up to date
+without reading the whole study.
+"""
+from __future__ import with_statement
+import os
+import hashlib
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# The subdirectories of a study whose contents affect its analysis, and a
+# test for which of their files count.
+MANIFEST_SECTIONS = [
+    ('Documents', lambda name: name.endswith('.txt')),
+    ('Canonical', lambda name: name.endswith('.txt')),
+    ('Matrices', lambda name: name.endswith('.smat')),
+]
+
+def file_hash(path, blocksize=1 << 20):
+    """
+    Get the SHA-1 of a file's contents, reading it in blocks so that large
+    matrices don't have to fit in memory.
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block: break
+            sha.update(block)
+    return sha.hexdigest()
+
+class StudyManifest(object):
+    """
+    A mapping from each input file of a study (as a path relative to the
+    study directory) to its `(size, mtime, sha1)`.
+
+    Two manifests are equal if they list the same files with the same hashes;
+    sizes and modification times are only used to avoid rehashing files that
+    haven't been touched.
+    """
+    def __init__(self, entries=None):
+        if entries is None: entries = {}
+        self.entries = entries
+        self.rehashed = 0
+
+    @classmethod
+    def scan(cls, study_dir, previous=None):
+        """
+        Build the manifest of the study in `study_dir`. Files are only
+        hashed if they aren't in the `previous` manifest with the same size
+        and modification time.
+        """
+        if previous is None: previous = cls()
+        manifest = cls()
+        for section, wanted in MANIFEST_SECTIONS:
+            path = os.path.join(study_dir, section)
+            if not os.path.isdir(path): continue
+            for name in sorted(os.listdir(path)):
+                if not wanted(name): continue
+                relpath = section + '/' + name
+                fullpath = os.path.join(path, name)
+                st = os.stat(fullpath)
+                old = previous.entries.get(relpath)
+                if old is not None and (old[0], old[1]) == (st.st_size, st.st_mtime):
+                    sha1 = old[2]
+                else:
+                    sha1 = file_hash(fullpath)
+                    manifest.rehashed += 1
+                manifest.entries[relpath] = (st.st_size, st.st_mtime, sha1)
+        return manifest
+
+    def hashes(self):
+        return dict((path, entry[2]) for path, entry in self.entries.items())
+
+    def __eq__(self, other):
+        return isinstance(other, StudyManifest) and self.hashes() == other.hashes()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def changed_files(self, other):
+        """
+        List the paths that were added, removed or changed between this
+        manifest and `other`.
+        """
+        mine = self.hashes()
+        theirs = other.hashes()
+        return sorted(path for path in set(mine) | set(theirs)
+                      if mine.get(path) != theirs.get(path))
+
+    def save(self, filename):
+        with open(filename, 'w') as out:
+            json.dump({'files': self.entries}, out)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load a saved manifest. Raises IOError or ValueError if there is no
+        usable manifest at `filename`.
+        """
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(dict((path, tuple(entry))
+                        for path, entry in data['files'].items()))
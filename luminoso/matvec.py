@@ -0,0 +1,88 @@
+"""
+Multiplying a sparse matrix by blocks of vectors on several threads.
+
+Iterative SVDs spend nearly all their time multiplying the blend, a SciPy
+CSR matrix, by a block of dense vectors. SciPy lets go of the GIL while
+it does that, so the product can be spread over threads: the matrix's rows
+are cut into ranges holding about the same number of nonzeros, and each
+thread multiplies one range. The ranges share the matrix's arrays instead
+of copying them.
+"""
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import scipy.sparse
+
+def row_ranges(matrix, nranges):
+    """
+    Split the rows of the CSR `matrix` into at most `nranges` contiguous
+    ranges with about the same number of nonzeros, as a list of
+    `(start, stop)` pairs.
+    """
+    nrows = matrix.shape[0]
+    targets = np.linspace(0, matrix.nnz, nranges + 1)
+    bounds = np.searchsorted(matrix.indptr, targets)
+    bounds[0] = 0
+    bounds[-1] = nrows
+    bounds = np.unique(np.minimum(bounds, nrows))
+    return [(int(bounds[i]), int(bounds[i+1]))
+            for i in xrange(len(bounds) - 1)]
+
+def row_slice(matrix, start, stop):
+    """
+    Get rows `start` to `stop` of the CSR `matrix` as a CSR matrix that
+    shares its data and column indices.
+    """
+    lo, hi = matrix.indptr[start], matrix.indptr[stop]
+    data = matrix.data[lo:hi]
+    indices = matrix.indices[lo:hi]
+    rows = scipy.sparse.csr_matrix(
+        (data, indices, matrix.indptr[start:stop+1] - lo),
+        shape=(stop - start, matrix.shape[1]))
+    # Newer SciPy versions copy an array that is a small view of a larger
+    # one, which is what these are, so put the views back.
+    if rows.data.dtype == data.dtype and rows.indices.dtype == indices.dtype:
+        rows.data = data
+        rows.indices = indices
+    return rows
+
+class ThreadedCSR(object):
+    """
+    A CSR matrix that is multiplied by `matrix * X`, where X is a dense
+    vector or block of vectors, using the threads of `pool` (a ThreadPool).
+    With no pool, it's multiplied on this thread.
+    """
+    def __init__(self, matrix, pool=None, nthreads=1):
+        self.matrix = matrix.tocsr()
+        self.shape = self.matrix.shape
+        self.dtype = self.matrix.dtype
+        self.pool = pool
+        if pool is None: nthreads = 1
+        self.blocks = [(start, stop, row_slice(self.matrix, start, stop))
+                       for start, stop in row_ranges(self.matrix, nthreads)]
+
+    def dot(self, X):
+        X = np.asarray(X)
+        if self.pool is None or len(self.blocks) <= 1:
+            return self.matrix * X
+        out = np.empty((self.shape[0],) + X.shape[1:],
+                       dtype=np.result_type(self.dtype, X.dtype))
+        def multiply(block):
+            start, stop, rows = block
+            out[start:stop] = rows * X
+        self.pool.map(multiply, self.blocks, 1)
+        return out
+
+    __mul__ = dot
+
+def thread_pool(threads):
+    """
+    Make a ThreadPool of `threads` threads, or return None if one thread
+    is all that's wanted. Close it with :func:`close_pool`.
+    """
+    if threads is None or threads <= 1: return None
+    return ThreadPool(threads)
+
+def close_pool(pool):
+    if pool is None: return
+    pool.close()
+    pool.join()
@@ -0,0 +1,81 @@
+"""
+Measure how the threaded sparse matrix product scales with the number of
+threads, on a random matrix shaped like a large blend.
+
+    python -m luminoso.matvec_bench [rows] [vectors] [max_threads]
+
+The matrix is `rows` by `rows` (default 300,000), with about 20 nonzeros
+per row, more of them in the first rows as in a blend with a few very
+common concepts. It is multiplied by a block of `vectors` random vectors
+(default 60, enough for 50 axes and some oversampling) with 1, 2, 4, ...
+up to `max_threads` threads (default 8), as is its transpose, and every
+result is checked against the single-threaded one.
+"""
+import sys, time
+import numpy as np
+import scipy.sparse
+from luminoso.matvec import ThreadedCSR, thread_pool, close_pool
+
+NONZEROS_PER_ROW = 20
+REPEATS = 3
+
+def random_blend(nrows, seed=0):
+    rand = np.random.RandomState(seed)
+    counts = rand.poisson(NONZEROS_PER_ROW / np.sqrt(np.arange(1, nrows + 1))
+                          * np.sqrt(nrows) / 2)
+    counts = np.minimum(np.maximum(counts, 1), nrows)
+    rows = np.repeat(np.arange(nrows), counts)
+    cols = rand.randint(0, nrows, len(rows))
+    values = rand.standard_normal(len(rows))
+    return scipy.sparse.csr_matrix((values, (rows, cols)),
+                                   shape=(nrows, nrows))
+
+def best_time(product, X):
+    best = None
+    for i in xrange(REPEATS):
+        start = time.time()
+        result = product * X
+        elapsed = time.time() - start
+        if best is None or elapsed < best: best = elapsed
+    return best, result
+
+def benchmark(nrows, nvectors, max_threads):
+    start = time.time()
+    A = random_blend(nrows)
+    AT = A.T.tocsr()
+    X = np.random.RandomState(1).standard_normal((nrows, nvectors))
+    print "Made a %d x %d matrix with %d nonzeros in %.1f s" % (
+        nrows, nrows, A.nnz, time.time() - start)
+    print "%8s %10s %10s %10s %8s" % ('threads', 'A*X', 'A.T*X',
+                                      'speedup', 'same')
+    threads = 1
+    baseline = None
+    expected = None
+    while threads <= max_threads:
+        pool = thread_pool(threads)
+        try:
+            forward, result = best_time(ThreadedCSR(A, pool, threads), X)
+            backward, result_t = best_time(ThreadedCSR(AT, pool, threads), X)
+        finally:
+            close_pool(pool)
+        elapsed = forward + backward
+        if baseline is None:
+            baseline = elapsed
+            expected = (result, result_t)
+        same = (np.allclose(result, expected[0])
+                and np.allclose(result_t, expected[1])) and 'yes' or 'NO'
+        print "%8d %10.3f %10.3f %9.2fx %8s" % (threads, forward, backward,
+                                                baseline / elapsed, same)
+        threads *= 2
+
+def main(args):
+    nrows = 300000
+    nvectors = 60
+    max_threads = 8
+    if len(args) > 0: nrows = int(args[0])
+    if len(args) > 1: nvectors = int(args[1])
+    if len(args) > 2: max_threads = int(args[2])
+    benchmark(nrows, nvectors, max_threads)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,67 @@
+"""
+Spreading independent pieces of work over a pool of processes.
+"""
+import multiprocessing
+
+def parallel_map(func, items, workers, initializer=None, initargs=(),
+                 pool=None):
+    """
+    Apply `func` to every item in `items`, using a pool of `workers`
+    processes if there is more than one. The results are returned in the
+    same order as `items`, no matter which worker finished first.
+
+    If `initializer` is given, each worker process calls
+    `initializer(*initargs)` before doing any work. This is the way to give
+    all the workers a large object without sending it along with every
+    item. When there is only one worker, it's called in this process.
+
+    If `pool` is given, it's a pool from :func:`worker_pool` that has
+    already been initialized, and it's used instead of starting a new one.
+    It stays open afterward.
+    """
+    items = list(items)
+    if pool is not None:
+        if len(items) <= 1: return [func(item) for item in items]
+        return pool.map(func, items, max(1, len(items) // (workers * 4)))
+    if workers is None or workers <= 1 or len(items) <= 1:
+        if initializer is not None: initializer(*initargs)
+        return [func(item) for item in items]
+    workers = min(workers, len(items))
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        try:
+            results = pool.map(func, items,
+                               max(1, len(items) // (workers * 4)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+    finally:
+        pool.join()
+    return results
+
+def worker_pool(workers, initializer=None, initargs=()):
+    """
+    Start a pool of `workers` processes that can be given to
+    :func:`parallel_map` many times, so that work done in several rounds
+    doesn't start new processes for every round. Returns None if there is
+    only one worker.
+
+    `initializer(*initargs)` is called in each worker, as it is by
+    :func:`parallel_map`, and also in this process, which does the work
+    itself when there's only one item to work on. Close the pool with
+    :func:`close_pool`.
+    """
+    if initializer is not None: initializer(*initargs)
+    if workers is None or workers <= 1: return None
+    return multiprocessing.Pool(workers, initializer, initargs)
+
+def close_pool(pool, failed=False):
+    """
+    Shut down a pool from :func:`worker_pool`, waiting for its workers to
+    finish, or stopping them at once if `failed`.
+    """
+    if pool is None: return
+    if failed: pool.terminate()
+    else: pool.close()
+    pool.join()
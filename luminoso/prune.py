@@ -0,0 +1,133 @@
+"""
+Pruning weak entries from a study's association matrix before it is
+blended, to make the SVD faster.
+
+There are three stages, each of which is skipped when its setting is 0:
+
+- `prune_min_weight`: drop entries whose absolute value is smaller than
+  this.
+- `prune_top_k`: keep only the entries that are among the k strongest in
+  their row or in their column, so the matrix stays symmetric.
+- `prune_max_nnz`: keep only this many of the strongest entries overall.
+
+Each stage reports how many nonzeros it removed and, if
+`prune_report_axes` is nonzero, how much that many of the top singular
+values changed.
+"""
+import numpy as np
+from csc import divisi2
+import logging
+logger = logging.getLogger('luminoso')
+
+def keep_min_weight(values, rows, cols, min_weight):
+    return np.abs(values) >= min_weight
+
+def _strongest_per_group(values, groups, others, k):
+    """
+    Find the entries that are among the `k` with the largest absolute value
+    in their group. Ties are broken by `others`, so the result doesn't
+    depend on the order of the entries.
+    """
+    order = np.lexsort((others, -np.abs(values), groups))
+    sorted_groups = groups[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_groups)) + 1])
+    lengths = np.diff(np.concatenate([starts, [len(order)]]))
+    rank = np.arange(len(order)) - np.repeat(starts, lengths)
+    keep = np.zeros(len(values), dtype=bool)
+    keep[order[rank < k]] = True
+    return keep
+
+def keep_top_k(values, rows, cols, k):
+    if len(values) == 0: return np.zeros(0, dtype=bool)
+    return (_strongest_per_group(values, rows, cols, k) |
+            _strongest_per_group(values, cols, rows, k))
+
+def keep_max_nnz(values, rows, cols, max_nnz):
+    """
+    Keep the `max_nnz` strongest entries. An entry and its mirror image
+    have the same strength and are kept or dropped together, so at most
+    `max_nnz` entries are kept.
+    """
+    keep = np.zeros(len(values), dtype=bool)
+    if len(values) <= max_nnz:
+        keep[:] = True
+        return keep
+    low = np.minimum(rows, cols)
+    high = np.maximum(rows, cols)
+    order = np.lexsort((high, low, -np.abs(values)))
+    kept = order[:max_nnz]
+    if max_nnz > 0:
+        last, next = order[max_nnz - 1], order[max_nnz]
+        if low[last] == low[next] and high[last] == high[next]:
+            # Don't split a symmetric pair.
+            kept = order[:max_nnz - 1]
+    keep[kept] = True
+    return keep
+
+STAGES = [
+    ('min_weight', 'prune_min_weight', keep_min_weight),
+    ('top_k', 'prune_top_k', keep_top_k),
+    ('max_nnz', 'prune_max_nnz', keep_max_nnz),
+]
+
+def top_singular_values(matrix, k):
+    k = min(k, min(matrix.shape) - 1)
+    if k < 1: return []
+    U, S, V = matrix.svd(k=k)
+    return sorted([float(s) for s in np.asarray(S)], reverse=True)
+
+def relative_change(before, after):
+    """
+    The largest relative change between corresponding singular values.
+    """
+    n = min(len(before), len(after))
+    if n == 0: return None
+    before = np.asarray(before[:n])
+    after = np.asarray(after[:n])
+    return float(np.max(np.abs(after - before) / np.maximum(before, 1e-12)))
+
+def prune_matrix(matrix, config):
+    """
+    Run the pruning stages that are turned on in `config` (a function that
+    looks up a setting) on the square SparseMatrix `matrix`.
+
+    Returns the pruned matrix, or None if nothing is left of it, and a list
+    of reports, one for each stage that ran, of the number of nonzeros
+    removed and the change in the top singular values.
+    """
+    stages = [(name, config(setting), test) for name, setting, test in STAGES
+              if config(setting)]
+    if not stages: return matrix, []
+    naxes = config('prune_report_axes')
+    values, rows, cols = matrix.find()
+    values = np.asarray(values)
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    labels = matrix.row_labels
+    singular = None
+    if naxes: singular = top_singular_values(matrix, naxes)
+
+    reports = []
+    for name, parameter, test in stages:
+        keep = test(values, rows, cols, parameter)
+        report = {'stage': name, 'parameter': parameter,
+                  'nnz_before': len(values), 'removed': int(len(keep) - keep.sum())}
+        values, rows, cols = values[keep], rows[keep], cols[keep]
+        matrix = divisi2.SparseMatrix.from_lists(values, rows, cols,
+                                                 nrows=len(labels),
+                                                 ncols=len(labels))
+        matrix.row_labels = matrix.col_labels = labels
+        report['nnz_after'] = len(values)
+        if naxes:
+            after = top_singular_values(matrix, naxes)
+            report['singular_values_before'] = singular
+            report['singular_values_after'] = after
+            report['max_relative_change'] = relative_change(singular, after)
+            singular = after
+        logger.info('Pruning by %s=%s removed %d of %d nonzeros'
+                    % (name, parameter, report['removed'], report['nnz_before']))
+        reports.append(report)
+        if len(values) == 0:
+            logger.warn('Pruning removed every association')
+            return None, reports
+    return matrix.squish(), reports
@@ -0,0 +1,55 @@
+"""
+A count-min sketch, for estimating how often each of a very large number
+of integer ids has been seen without keeping a counter for every id.
+
+The sketch has `depth` rows of `width` counters, and each row hashes an id
+to one of its counters. An id's estimate is the smallest of its counters,
+which is never less than its true count, and is more than the true count
+plus `e/width` times the total count only with probability `e**-depth`.
+"""
+import math
+import numpy as np
+
+# A Mersenne prime larger than any id, for the universal hash functions.
+HASH_PRIME = 2**31 - 1
+
+class CountMinSketch(object):
+    def __init__(self, width, depth=4, seed=0):
+        self.width = int(width)
+        self.depth = int(depth)
+        self.counts = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+        rand = np.random.RandomState(seed)
+        self.a = rand.randint(1, HASH_PRIME, size=self.depth).astype(np.int64)
+        self.b = rand.randint(0, HASH_PRIME, size=self.depth).astype(np.int64)
+
+    def _columns(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return ((self.a[:, np.newaxis] * ids + self.b[:, np.newaxis])
+                % HASH_PRIME) % self.width
+
+    def add(self, ids):
+        """
+        Count each id in `ids` once.
+        """
+        if len(ids) == 0: return
+        columns = self._columns(ids)
+        rows = np.repeat(np.arange(self.depth), columns.shape[1])
+        np.add.at(self.counts, (rows, columns.ravel()), 1)
+        self.total += len(ids)
+
+    def estimate(self, ids):
+        """
+        Get an array of the estimated counts of `ids`, none of which is less
+        than the true count.
+        """
+        if len(ids) == 0: return np.zeros(0, dtype=np.int64)
+        columns = self._columns(ids)
+        return np.min([self.counts[row][columns[row]]
+                       for row in xrange(self.depth)], axis=0)
+
+    def error_bound(self):
+        """
+        How much an estimate is likely to exceed the true count by, at most.
+        """
+        return int(math.ceil(math.e * self.total / self.width))
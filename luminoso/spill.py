@@ -0,0 +1,144 @@
+"""
+Adding up more (key, value) pairs than fit in memory, by spilling sorted
+runs of them to disk and merging the runs at the end.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import logging
+logger = logging.getLogger('luminoso')
+
+ENTRY_DTYPE = np.dtype([('key', '<i8'), ('value', '<f8')])
+
+# Sorting and merging need a few copies of whatever is being worked on, so
+# only this fraction of the memory budget is used to hold entries.
+BUDGET_FRACTION = 0.25
+
+def coalesce(keys, values):
+    """
+    Sort (key, value) pairs by key, adding together the values of equal
+    keys. Returns the distinct keys and their totals.
+    """
+    if len(keys) == 0: return keys, values
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    values = values[order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    return keys[starts], np.add.reduceat(values, starts)
+
+class ExternalSum(object):
+    """
+    Totals up the values for each key, using at most about `memory_limit`
+    bytes of memory for the entries it's holding. Whenever the entries that
+    have been added would go over that limit, they're sorted and written
+    to a file (a *run*) in a new directory inside `directory`.
+    :meth:`result` merges the runs.
+
+    Call :meth:`cleanup` to remove the runs when done, even if something
+    goes wrong.
+    """
+    def __init__(self, memory_limit, directory=None):
+        self.max_entries = max(1024, int(memory_limit * BUDGET_FRACTION)
+                                     // ENTRY_DTYPE.itemsize)
+        self.directory = directory
+        self.run_dir = None
+        self.runs = []
+        self.buffer_keys = []
+        self.buffer_values = []
+        self.buffered = 0
+
+    def add(self, keys, values):
+        keys, values = coalesce(np.asarray(keys, dtype=np.int64),
+                                np.asarray(values, dtype=np.float64))
+        self.buffer_keys.append(keys)
+        self.buffer_values.append(values)
+        self.buffered += len(keys)
+        if self.buffered > self.max_entries:
+            self._collapse()
+            if self.buffered > self.max_entries // 2:
+                self.spill()
+
+    def _collapse(self):
+        if len(self.buffer_keys) > 1:
+            keys, values = coalesce(np.concatenate(self.buffer_keys),
+                                    np.concatenate(self.buffer_values))
+            self.buffer_keys = [keys]
+            self.buffer_values = [values]
+            self.buffered = len(keys)
+
+    def spill(self):
+        """
+        Write the buffered entries to disk as a sorted run.
+        """
+        self._collapse()
+        if not self.buffered: return
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(prefix='runs-', dir=self.directory)
+        run = np.empty(self.buffered, dtype=ENTRY_DTYPE)
+        run['key'] = self.buffer_keys[0]
+        run['value'] = self.buffer_values[0]
+        filename = os.path.join(self.run_dir, 'run%04d.bin' % len(self.runs))
+        run.tofile(filename)
+        self.runs.append(filename)
+        logger.info('Spilled %d entries to %s' % (len(run), filename))
+        self.buffer_keys = []
+        self.buffer_values = []
+        self.buffered = 0
+
+    def result(self):
+        """
+        Get the distinct keys, in order, and the total of the values for
+        each one. Keys whose total is zero are left out.
+        """
+        if not self.runs:
+            self._collapse()
+            if not self.buffered:
+                return np.zeros(0, dtype=np.int64), np.zeros(0)
+            keys, values = self.buffer_keys[0], self.buffer_values[0]
+        else:
+            self.spill()
+            keys, values = self._merge_runs()
+        nonzero = values != 0
+        return keys[nonzero], values[nonzero]
+
+    def _merge_runs(self):
+        """
+        Merge all the runs, reading a block at a time from each.
+
+        Keys are distinct within a run, so all the entries with keys up to
+        the smallest last key of the blocks in memory are in those blocks,
+        and can be merged right away.
+        """
+        block_size = max(1024, self.max_entries // len(self.runs))
+        files = [open(filename, 'rb') for filename in self.runs]
+        try:
+            blocks = [np.fromfile(f, dtype=ENTRY_DTYPE, count=block_size)
+                      for f in files]
+            out_keys = []
+            out_values = []
+            while True:
+                active = [i for i in xrange(len(files)) if len(blocks[i])]
+                if not active: break
+                bound = min(blocks[i]['key'][-1] for i in active)
+                taken = []
+                for i in active:
+                    split = np.searchsorted(blocks[i]['key'], bound, side='right')
+                    taken.append(blocks[i][:split])
+                    blocks[i] = blocks[i][split:]
+                    if len(blocks[i]) == 0:
+                        blocks[i] = np.fromfile(files[i], dtype=ENTRY_DTYPE,
+                                                count=block_size)
+                taken = np.concatenate(taken)
+                keys, values = coalesce(taken['key'], taken['value'])
+                out_keys.append(keys)
+                out_values.append(values)
+        finally:
+            for f in files: f.close()
+        return np.concatenate(out_keys), np.concatenate(out_values)
+
+    def cleanup(self):
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+            self.run_dir = None
+        self.runs = []
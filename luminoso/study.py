@@ -30,6 +30,17 @@ from csc.divisi2.ordered_set import OrderedSet
 
 from luminoso.whereami import package_dir
 from luminoso.report import render_info_page, default_info_page
+from luminoso.cache import ConceptCache, VerdictCache, StageCache
+from luminoso.manifest import StudyManifest
+from luminoso.entries import EntryBuffer
+from luminoso.cooccurrence import association_matrix
+from luminoso.parallel import parallel_map
+from luminoso.prune import prune_matrix
+from luminoso.sketch import CountMinSketch
+from luminoso.doccounts import (DocumentCounts, tfidf_from_counts,
+                                MAX_DOCUMENT_CONCEPTS)
+from luminoso.svd import svd_rank, svd_settings, truncate_svd, blend_svd
+from luminoso.ccipca import CCIPCA
 
 import shutil
 
@@ -47,6 +58,10 @@ except ImportError:
 class OutdatedAnalysisError(Exception):
     pass
 
+def text_hash(text):
+    if isinstance(text, unicode): text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
 class Document(object):
     '''
     A Document is an entity in a Study.
@@ -54,6 +69,14 @@ class Document(object):
     def __init__(self, name, text):
         self.name = name
         self.text = text
+        self._parsed = None
+        self._hash = None
+
+    @property
+    def content_hash(self):
+        if self._hash is None:
+            self._hash = text_hash(self.text)
+        return self._hash
 
     @classmethod
     def from_file(cls, filename, name):
@@ -68,22 +91,33 @@ class Document(object):
             text = ''
         return cls(name, text)
 
+    def parse(self):
+        """
+        Get the ParsedDocument for this document's text, parsing it the first
+        time this is called.
+        """
+        if self._parsed is None:
+            self._parsed = ParsedDocument.from_text(self.text)
+        return self._parsed
+
+    def is_parsed(self):
+        return self._parsed is not None
+
+    def set_parsed(self, parsed):
+        """
+        Supply a ParsedDocument that was computed elsewhere, such as in a
+        worker process or a cache.
+        """
+        self._parsed = parsed
+
     def extract_concepts_with_negation(self):
-        return extract_concepts_with_negation(self.text)
+        return self.parse().concepts
+
+    def get_sentence_concepts(self):
+        return self.parse().sentences
 
     def get_sentences(self):
-        words = en_nl.tokenize(self.text).split()
-        sentences = []
-        current_sentence = []
-        for word in words:
-            if word in PUNCTUATION:
-                if len(current_sentence) >= 1:
-                    sentences.append(current_sentence)
-                    current_sentence = []
-            else:
-                current_sentence.append(word)
-        sentences.append(current_sentence)
-        return sentences
+        return split_sentences(en_nl.tokenize(self.text).split())
 
 class CanonicalDocument(Document):
     pass
@@ -91,17 +125,66 @@ class CanonicalDocument(Document):
 
 NEGATION = ['no', 'not', 'never', 'stop', 'lack', "n't", "without"]
 PUNCTUATION = ['.', ',', '!', '?', '...', '-', ':', ';', '``', "''", "`", "'"]
+
+# Increase this when the test in is_concept_allowed changes in a way the
+# fingerprint can't see, such as a change in tokenizing.
+CONCEPT_FILTER_VERSION = 1
+
+def is_concept_allowed(concept):
+    """
+    Whether a concept can appear in a document matrix: it can't be
+    punctuation, and it can't be made entirely of blacklisted words.
+    """
+    return (concept not in PUNCTUATION) and (not en_nl.is_blacklisted(concept))
+
+def concept_filter_fingerprint():
+    """
+    A hash of everything that decides is_concept_allowed, so that cached
+    verdicts can be thrown out when it changes.
+    """
+    sha = hashlib.sha1()
+    sha.update('%d\n' % CONCEPT_FILTER_VERSION)
+    sha.update('\n'.join(PUNCTUATION))
+    sha.update('\n--\n')
+    sha.update(u'\n'.join(sorted(en_nl.blacklist)).encode('utf-8'))
+    return sha.hexdigest()
+
+# Only this many words at the start of each sentence are used for finding
+# associations, to avoid insane space usage.
+SENTENCE_WORDS = 20
+
+def split_sentences(words):
+    """
+    Split a list of tokens into sentences (really, clauses) at punctuation.
+    The punctuation is dropped.
+    """
+    sentences = []
+    current_sentence = []
+    for word in words:
+        if word in PUNCTUATION:
+            if len(current_sentence) >= 1:
+                sentences.append(current_sentence)
+                current_sentence = []
+        else:
+            current_sentence.append(word)
+    sentences.append(current_sentence)
+    return sentences
+
 def extract_concepts_with_negation(text):
     words = en_nl.tokenize(text).split()
     return extract_concepts_from_words(words)
 
-def extract_concepts_from_words(words):
-    # FIXME: this may join together words from different contexts...
+def _polarity_groups(words, positive=True):
+    """
+    Sort words into (positive words, negative words, positive tags,
+    negative tags), according to whether a negation word precedes them in
+    the same clause. Also returns whether the clause is positive at the end
+    of `words`, so that a clause can be continued by another call.
+    """
     positive_words = []
     negative_words = []
-    neg_tagged_words = []
     pos_tagged_words = []
-    positive = True
+    neg_tagged_words = []
     for word in words:
         if word.startswith('#-'):
             neg_tagged_words.append('#'+word[2:])
@@ -117,12 +200,82 @@ def extract_concepts_from_words(words):
                 negative_words.append(word)
             if word in PUNCTUATION:
                 positive = True
-    positive_concepts = [(c, 1) for c in en_nl.extract_concepts(' '.join(positive_words))]
-    negative_concepts = [(c, -1) for c in en_nl.extract_concepts(' '.join(negative_words))]
+    return (positive_words, negative_words, pos_tagged_words,
+            neg_tagged_words), positive
+
+def _signed_concepts(groups):
+    """
+    Turn the result of _polarity_groups into lists of (concept, value)
+    pairs: positive concepts, positive tags, negative concepts and negative
+    tags.
+    """
+    positive_words, negative_words, pos_tagged_words, neg_tagged_words = groups
+    positive_concepts = []
+    negative_concepts = []
+    if positive_words:
+        positive_concepts = [(c, 1) for c in en_nl.extract_concepts(' '.join(positive_words))]
+    if negative_words:
+        negative_concepts = [(c, -1) for c in en_nl.extract_concepts(' '.join(negative_words))]
     neg_tagged_concepts = [(c, -1) for c in neg_tagged_words]
     pos_tagged_concepts = [(c, 1) for c in pos_tagged_words]
+    return (positive_concepts, pos_tagged_concepts, negative_concepts,
+            neg_tagged_concepts)
+
+def extract_concepts_from_words(words):
+    # FIXME: this may join together words from different contexts...
+    groups, positive = _polarity_groups(words)
+    positive_concepts, pos_tagged_concepts, negative_concepts, neg_tagged_concepts = _signed_concepts(groups)
     return positive_concepts + pos_tagged_concepts + negative_concepts + neg_tagged_concepts
 
+class ParsedDocument(object):
+    """
+    Everything the analysis needs to know about the text of a document,
+    found by tokenizing and lemmatizing it once.
+
+    - `sentences` has a list of signed concepts, as (concept, value) pairs,
+      for each sentence. Only the first SENTENCE_WORDS words of a sentence
+      count here, because these are what associations are made from.
+    - `concepts` has all the signed concepts in the document: the positive
+      concepts, then the positive tags, the negative concepts and the
+      negative tags.
+
+    Negation only extends to the end of the sentence it appears in, and
+    two-word concepts never span sentences.
+    """
+    def __init__(self, concepts, sentences):
+        self.concepts = concepts
+        self.sentences = sentences
+
+    @classmethod
+    def from_text(cls, text):
+        words = en_nl.tokenize(text).split()
+        sentences = []
+        doc_groups = ([], [], [], [])
+        for sentence in split_sentences(words):
+            groups, positive = _polarity_groups(sentence[:SENTENCE_WORDS])
+            head = _signed_concepts(groups)
+            sentences.append(head[0] + head[1] + head[2] + head[3])
+            for doc_group, group in zip(doc_groups, head):
+                doc_group.extend(group)
+            if len(sentence) > SENTENCE_WORDS:
+                # The rest of the sentence isn't used for associations, but
+                # its concepts are still in the document, with the negation
+                # carried over.
+                groups, positive = _polarity_groups(sentence[SENTENCE_WORDS:],
+                                                    positive)
+                for doc_group, group in zip(doc_groups, _signed_concepts(groups)):
+                    doc_group.extend(group)
+        concepts = doc_groups[0] + doc_groups[1] + doc_groups[2] + doc_groups[3]
+        return cls(concepts, sentences)
+
+def _read_document(job):
+    # Runs in a worker process; must be at the top level to be picklable.
+    cls, filename = job
+    return cls.from_file(filename, name=os.path.basename(filename))
+
+def _parse_document(text):
+    return ParsedDocument.from_text(text)
+
 def load_json_from_file(file):
     with open(file) as f:
         return json.load(f)
@@ -134,21 +287,139 @@ def write_json_to_file(data, file):
 def entry_count(vec):
     return np.sum(np.abs(vec))
 
+def document_hashes(documents):
+    return [(doc.name, doc.content_hash) for doc in documents]
+
+def matrix_fingerprint(matrix):
+    """
+    A hash of a SparseMatrix's entries and labels.
+    """
+    sha = hashlib.sha1()
+    for array in matrix.find():
+        sha.update(np.ascontiguousarray(array).tostring())
+    sha.update(repr(list(matrix.row_labels or [])))
+    sha.update(repr(list(matrix.col_labels or [])))
+    return sha.hexdigest()
+
+def matrix_counts(counts, ndocs):
+    """
+    Turn counts of study documents into counts of document matrix entries,
+    given the number of study documents in the matrix. A concept in more
+    than half the study documents gets a TF-IDF weight of 0 in all of them,
+    so they don't count.
+    """
+    return np.where(2 * counts > ndocs, 0, counts)
+
+def choose_cutoff(counts, minimum, max_concepts=0, max_nnz=0):
+    """
+    Given an array of how many documents each concept appears in, find the
+    smallest cutoff of at least `minimum` for which the concepts that meet
+    it number at most `max_concepts`, and appear in at most `max_nnz`
+    documents in total. A limit of 0 means no limit.
+
+    Concepts with the same count are kept or dropped together, so the
+    result can be well under the limits.
+    """
+    if not (max_concepts or max_nnz) or len(counts) == 0: return minimum
+    histogram = np.bincount(counts)
+    # the number of concepts, and of entries, with each count or more
+    concepts = np.cumsum(histogram[::-1])[::-1]
+    entries = np.cumsum((histogram * np.arange(len(histogram)))[::-1])[::-1]
+    fits = np.ones(len(histogram), dtype=bool)
+    if max_concepts: fits &= concepts <= max_concepts
+    if max_nnz: fits &= entries <= max_nnz
+    fits[:minimum] = False
+    if not fits.any(): return max(minimum, len(histogram))
+    return int(np.flatnonzero(fits)[0])
+
 DEFAULT_SETTINGS = {
     'axes': 50,
-    'concept_cutoff': 2
+    # if nonzero, the SVD is computed with this many axes (or 'axes', if
+    # that's more), so that changing 'axes' up to here only truncates it;
+    # with the default of 0, the SVD has exactly 'axes' axes, and is found
+    # again whenever 'axes' changes
+    'max_axes': 0,
+    # how to find the SVD: 'divisi2', 'randomized' or 'lanczos' (see
+    # luminoso/svd.py)
+    'svd_engine': 'divisi2',
+    # how many times the randomized engine refines its random vectors
+    'svd_power_iterations': 2,
+    # find the SVD by subspace iteration, starting from the last analysis's
+    # singular vectors, until every axis's residual is within svd_tolerance
+    # of the largest singular value
+    'svd_warm_start': False,
+    'svd_tolerance': 1e-4,
+    'svd_max_iterations': 100,
+    # how many extra vectors subspace iteration and the randomized engine
+    # work with
+    'svd_oversample': 10,
+    # number of threads that multiply the blend by vectors during the SVD,
+    # for every engine but divisi2
+    'svd_threads': 1,
+    # how much more `luminoso-study --update` weights new documents than
+    # the ones the space was found from, in a study that isn't associative
+    # (see luminoso/ccipca.py)
+    'ccipca_amnesia': 2.0,
+    'concept_cutoff': 2,
+    # number of processes used to read documents and extract their concepts
+    'ingest_workers': 1,
+    # number of processes used to count associations between concepts
+    'assoc_workers': 1,
+    # if nonzero, how many megabytes of association entries to keep in memory
+    # before spilling them to disk
+    'assoc_memory_mb': 0,
+    # pruning of the document association matrix before blending; 0 turns
+    # each stage off (see luminoso/prune.py)
+    'prune_min_weight': 0,
+    'prune_top_k': 0,
+    'prune_max_nnz': 0,
+    # how many singular values to compare before and after each pruning stage
+    'prune_report_axes': 10,
+    # if nonzero, raise concept_cutoff as far as needed to keep the study
+    # down to this many concepts, or this many document matrix entries of
+    # those concepts
+    'max_concepts': 0,
+    'max_nnz': 0,
+    # if nonzero, find the concepts that pass concept_cutoff with a count-min
+    # sketch of this many counters per row, instead of from the document
+    # matrix; an associative study's document matrix then only has columns
+    # for those concepts
+    'df_sketch_width': 0,
+    'df_sketch_depth': 4,
+    # count every concept the sketch can't rule out exactly, so that the
+    # valid concepts, and the cutoff max_concepts and max_nnz choose, are
+    # exactly the ones the document matrix would give; otherwise they come
+    # from the sketch's estimates
+    'df_sketch_verify': True
 }
 
+# The settings that change the association matrix, besides the ones that
+# decide which concepts are valid.
+ASSOC_SETTINGS = ['prune_min_weight', 'prune_top_k', 'prune_max_nnz',
+                  'prune_report_axes']
+
 class Study(QtCore.QObject):
     '''
     A Study is a collection of documents and other matrices that can be analyzed.
     '''
-    def __init__(self, name, documents, canonical, other_matrices, settings):
+    def __init__(self, name, documents, canonical, other_matrices, settings,
+                 concept_cache=None, verdict_cache=None, scratch_dir=None,
+                 document_counts=None, stage_cache=None):
         """
         documents: list of Document objects
         canonical: list of Document objects that are the canonical documents (possibly empty)
         other_matrices: things to blend.
         settings: a dict of settings. See DEFAULT_SETTINGS above.
+        concept_cache: a ConceptCache holding previously extracted concepts,
+        or None to always extract them from scratch.
+        verdict_cache: a VerdictCache of which concepts are allowed in the
+        document matrix, or None to check every concept.
+        scratch_dir: where to put temporary files, such as association
+        entries that don't fit in memory. None means the system default.
+        document_counts: the DocumentCounts from the last analysis, to update
+        the document matrix from, or None to build it from scratch.
+        stage_cache: a StageCache of results from earlier analyses, for the
+        stages whose inputs haven't changed, or None to run every stage.
         """
         QtCore.QObject.__init__(self)
         self.name = name
@@ -156,8 +427,26 @@ class Study(QtCore.QObject):
         self.canonical_documents = canonical
         # self.documents is now a property
         self._documents_matrix = None
+        self._allowed_concepts = None
+        self._vocabulary = None
         self.other_matrices = other_matrices
         self.settings = settings
+        self.concept_cache = concept_cache
+        self.verdict_cache = verdict_cache
+        self.scratch_dir = scratch_dir
+        self.document_counts = document_counts
+        self.stage_cache = stage_cache
+        self._stage_keys = {}
+        self._matrix_fingerprints = None
+        self._concepts_extracted = False
+        self._assoc_concepts = None
+        self._assoc_result = None
+        self.prune_report = []
+        self.cutoff_report = None
+        self.svd_report = None
+        self.sketch_report = None
+        self._df_sketch = None
+        self._df_counts = None
 
     def config(self, key):
         if key in self.settings: return self.settings[key]
@@ -169,19 +458,349 @@ class Study(QtCore.QObject):
         logger.info(msg)
         self.step.emit(msg)
 
-    def get_contents_hash(self):
-        def sha1(txt):
-            if isinstance(txt, unicode): txt = txt.encode('utf-8')
-            return hashlib.sha1(txt).hexdigest()
+    def extract_concepts(self):
+        """
+        Parse every document that hasn't been parsed yet, spreading the work
+        over `ingest_workers` processes.
+
+        If the study has a concept cache, documents whose text is in the
+        cache aren't extracted again, and the cache is updated to hold
+        exactly the current documents.
+        """
+        cache = self.concept_cache
+        pending = []
+        for doc in self.documents:
+            if doc.is_parsed(): continue
+            cached = None
+            if cache is not None:
+                cached = cache.get(doc.content_hash)
+            if cached is None:
+                pending.append(doc)
+            else:
+                doc.set_parsed(cached)
+        if pending:
+            self._step('Extracting concepts...')
+            parsed = parallel_map(_parse_document,
+                                  [doc.text for doc in pending],
+                                  self.config('ingest_workers'))
+            for doc, result in zip(pending, parsed):
+                doc.set_parsed(result)
+                if cache is not None:
+                    cache.put(doc.content_hash, result)
+            word_cache = getattr(en_nl, 'word_split_cache', None)
+            if word_cache is not None and word_cache.hits + word_cache.misses:
+                # Only meaningful when the parsing happened in this process.
+                logger.info('Lemmatizer cache: %(hits)d hits, %(misses)d '
+                            'misses, %(size)d of %(maxsize)d entries used'
+                            % word_cache.cache_info())
+        if cache is not None:
+            for doc in self.documents:
+                # documents parsed before we got here still count as used
+                if cache.get(doc.content_hash) is None:
+                    cache.put(doc.content_hash, doc.parse())
+            stale = cache.collect_garbage()
+            logger.info('Concept cache: %d documents extracted, %d cached, '
+                        '%d stale entries removed'
+                        % (len(pending), len(self.documents) - len(pending), stale))
+            cache.save()
+
+    def _stage(self, name, compute):
+        """
+        Get the result of the analysis stage `name`: from the stage cache,
+        if it has one computed from the same inputs, or else by calling
+        `compute` and saving what it returns there.
+        """
+        cache = self.stage_cache
+        if cache is None: return compute()
+        key = self.get_stage_key(name)
+        try:
+            result = cache.get(name, key)
+        except KeyError:
+            result = compute()
+            cache.put(name, key, result)
+        else:
+            logger.info('Reusing the saved %s stage' % name)
+        return result
+
+    def get_stage_key(self, name):
+        if name not in self._stage_keys:
+            self._stage_keys[name] = StageCache.key(name,
+                                                    self._stage_inputs(name))
+        return self._stage_keys[name]
+
+    def _stage_inputs(self, name):
+        """
+        Get everything that the result of analysis stage `name` depends on:
+        the documents or the earlier stages it's made from, and the settings
+        that affect it.
+        """
+        if name == 'documents':
+            inputs = (document_hashes(self.study_documents),
+                      ConceptCache.VERSION, concept_filter_fingerprint())
+            if self.sketches_documents():
+                inputs += (sorted(self.get_assoc_concepts()),)
+            return inputs
+        elif name == 'assoc':
+            # This depends on which concepts are valid, instead of on the
+            # settings that chose them, so that a change to those settings
+            # that doesn't change them doesn't change the blend either.
+            return (document_hashes(self.study_documents),
+                    sorted(self.get_assoc_concepts()),
+                    [self.config(key) for key in ASSOC_SETTINGS])
+        elif name == 'blend':
+            if self.is_associative():
+                source = self.get_stage_key('assoc')
+            else:
+                source = (self.get_stage_key('documents'),
+                          sorted(self.get_valid_concepts(3)))
+            return (self.is_associative(), source,
+                    self.get_matrix_fingerprints())
+        elif name == 'svd':
+            return (self.get_stage_key('blend'), svd_rank(self.config),
+                    svd_settings(self.config))
+        elif name == 'projections':
+            return (self.get_stage_key('svd'), self.config('axes'),
+                    self.get_stage_key('documents'), SUBTRACT_MEAN)
+        elif name == 'spectral':
+            return (self.get_stage_key('projections'),)
+        elif name == 'stats':
+            return (self.get_stage_key('spectral'),
+                    self.get_stage_key('documents'), self.cutoff_report)
+        raise KeyError(name)
+
+    def get_matrix_fingerprints(self):
+        if self._matrix_fingerprints is None:
+            self._matrix_fingerprints = [
+                (name, matrix_fingerprint(self.other_matrices[name]))
+                for name in sorted(self.other_matrices)]
+        return self._matrix_fingerprints
+
+    def get_vocabulary(self):
+        """
+        Get the OrderedSet of every concept in the documents, which gives
+        each concept the integer id that the matrix builders use for it.
+
+        Concepts are extracted from the documents the first time this is
+        needed, so an analysis whose stages are all cached doesn't extract
+        them at all.
+        """
+        if not self._concepts_extracted:
+            self.extract_concepts()
+            self._concepts_extracted = True
+        if self._vocabulary is None:
+            vocabulary = OrderedSet()
+            for doc in self.documents:
+                for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+                    vocabulary.add(concept)
+            self._vocabulary = vocabulary
+        return self._vocabulary
+
+    def get_allowed_concepts(self):
+        """
+        Get the set of concepts, out of all those in the documents, that
+        pass is_concept_allowed.
+
+        Each distinct concept is checked once, instead of once for every
+        time it appears, and the verdicts are kept in the verdict cache if
+        there is one.
+        """
+        if self._allowed_concepts is not None:
+            return self._allowed_concepts
+        vocabulary = self.get_vocabulary()
+        cache = self.verdict_cache
+        if cache is None:
+            allowed = set(concept for concept in vocabulary
+                          if is_concept_allowed(concept))
+        else:
+            allowed = cache.allowed(vocabulary, is_concept_allowed)
+            logger.info('Concept filter: %d distinct concepts, %d checked, '
+                        '%d allowed' % (len(vocabulary), cache.checked,
+                                        len(allowed)))
+        self._allowed_concepts = allowed
+        return allowed
+
+    def _document_concept_ids(self, doc):
+        """
+        Get the ids of the allowed concepts that have an entry in `doc`'s row
+        of the document matrix: that is, whose values in it don't add up to
+        0.
+        """
+        vocabulary = self.get_vocabulary()
+        allowed = self.get_allowed_concepts()
+        totals = {}
+        for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+            if concept in allowed:
+                index = vocabulary.index(concept)
+                totals[index] = totals.get(index, 0) + value
+        return np.array([index for index, total in totals.items() if total != 0],
+                        dtype=np.int64)
+
+    def get_concept_counts(self):
+        """
+        Get a dictionary of how many documents each concept has entries for
+        in the document matrix. If `df_sketch_width` is set, these are
+        estimates from the document frequency sketch, except that with
+        `df_sketch_verify` the concepts the sketch can't rule out at
+        `concept_cutoff` are counted exactly, and the others left out.
+        """
+        if self.config('df_sketch_width'):
+            ids, sketch, ndocs = self._get_df_sketch()
+            if self.config('df_sketch_verify'):
+                counted, counts = self._count_sketch_candidates(
+                    self.config('concept_cutoff'))
+                ids = ids[counted]
+                counts = counts[counted]
+            else:
+                counts = sketch.estimate(ids)
+            counts = matrix_counts(counts, ndocs)
+            vocabulary = self.get_vocabulary()
+            return dict((vocabulary[index], count)
+                        for index, count in zip(ids, counts) if count > 0)
+        docs = self.get_documents_matrix()
+        return dict(docs.col_op(len).to_sparse().named_items())
+
+    def get_valid_concepts(self, cutoff):
+        """
+        Get the set of concepts that have entries for at least `cutoff`
+        documents in the document matrix.
+        """
+        if self.config('df_sketch_width'):
+            return self._sketch_valid_concepts(cutoff)
+        valid_concepts = set()
+        for concept, count in self.get_concept_counts().items():
+            if count >= cutoff: valid_concepts.add(concept)
+        return valid_concepts
+
+    def choose_concept_cutoff(self):
+        """
+        Get the concept cutoff to use, and record it and the size of the
+        study it gives in `self.cutoff_report`.
+
+        If `max_concepts` or `max_nnz` is set, this is the smallest cutoff,
+        no lower than `concept_cutoff`, that keeps the number of valid
+        concepts, or the number of document matrix entries they have,
+        within them. Otherwise it's just `concept_cutoff`.
+
+        Raises a ValueError if the limits leave fewer than two concepts to
+        associate.
+        """
+        counts = np.array(self.get_concept_counts().values(), dtype=np.int64)
+        cutoff = choose_cutoff(counts, self.config('concept_cutoff'),
+                               self.config('max_concepts'),
+                               self.config('max_nnz'))
+        kept = counts[counts >= cutoff]
+        if cutoff > self.config('concept_cutoff') and len(kept) < 2:
+            limits = ['%s=%d' % (key, self.config(key))
+                      for key in ('max_concepts', 'max_nnz') if self.config(key)]
+            raise ValueError("%s leaves %d concepts in the study, at a concept "
+                             "cutoff of %d; raise it" %
+                             (' and '.join(limits), len(kept), cutoff))
+        self.cutoff_report = {
+            'cutoff': cutoff,
+            'max_concepts': self.config('max_concepts'),
+            'max_nnz': self.config('max_nnz'),
+            'num_concepts': len(kept),
+            'nnz': int(kept.sum()),
+        }
+        logger.info('Concept cutoff %d keeps %d of %d concepts, with %d '
+                    'document entries' % (cutoff, len(kept), len(counts),
+                                          kept.sum()))
+        return cutoff
+
+    def _get_df_sketch(self):
+        """
+        Sketch how many study documents each allowed concept appears in.
 
-        docs = dict((doc.name, (isinstance(doc, CanonicalDocument),
-                                sha1(doc.text)))
-                    for doc in self.documents)
-        matrices = tuple(sorted(self.other_matrices.keys()))
+        Returns the ids of the allowed concepts, the CountMinSketch, and the
+        number of study documents that have a row in the document matrix.
+        """
+        if self._df_sketch is None:
+            vocabulary = self.get_vocabulary()
+            allowed = self.get_allowed_concepts()
+            sketch = CountMinSketch(self.config('df_sketch_width'),
+                                    self.config('df_sketch_depth'))
+            ndocs = 0
+            for doc in self.study_documents:
+                sketch.add(self._document_concept_ids(doc))
+                for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+                    if concept in allowed:
+                        ndocs += 1
+                        break
+            ids = np.array([vocabulary.index(concept) for concept in allowed],
+                           dtype=np.int64)
+            self._df_sketch = (ids, sketch, ndocs)
+        return self._df_sketch
+
+    def _count_sketch_candidates(self, cutoff):
+        """
+        Count exactly, in a pass over the study documents, how many of them
+        have entries for each allowed concept whose estimate in the document
+        frequency sketch is at least `cutoff`.
+
+        Returns a boolean array of which of the allowed concepts (in the
+        order of the sketch's ids) were counted, and an array of their
+        counts, which is 0 for the others. The counts from a lower cutoff
+        are reused, since they cover every concept a higher one would count.
+        """
+        if self._df_counts is not None and self._df_counts[0] <= cutoff:
+            return self._df_counts[1:]
+        ids, sketch, ndocs = self._get_df_sketch()
+        vocabulary = self.get_vocabulary()
+        counted = sketch.estimate(ids) >= cutoff
+        checking = np.zeros(len(vocabulary), dtype=bool)
+        checking[ids[counted]] = True
+        counts = np.zeros(len(vocabulary), dtype=np.int64)
+        if counted.any():
+            for doc in self.study_documents:
+                present = self._document_concept_ids(doc)
+                counts[present[checking[present]]] += 1
+        self._df_counts = (cutoff, counted, counts[ids])
+        return self._df_counts[1:]
+
+    def _sketch_valid_concepts(self, cutoff):
+        """
+        Find the valid concepts like get_valid_concepts, without building the
+        document matrix, using the estimates from the document frequency
+        sketch.
+
+        The sketch never underestimates, so every concept that is valid is
+        a candidate. With `df_sketch_verify`, every candidate is counted
+        exactly in a second pass over the documents (see
+        _count_sketch_candidates). What happened goes in
+        `self.sketch_report`.
+        """
+        vocabulary = self.get_vocabulary()
+        ids, sketch, ndocs = self._get_df_sketch()
+        estimate = sketch.estimate(ids)
+        candidates = estimate >= cutoff
+        counted = 0
+        if self.config('df_sketch_verify'):
+            was_counted, counts = self._count_sketch_candidates(cutoff)
+            valid = candidates & (matrix_counts(counts, ndocs) >= cutoff)
+            counted = int(was_counted.sum())
+        else:
+            valid = candidates & (matrix_counts(estimate, ndocs) >= cutoff)
+        self.sketch_report = {
+            'cutoff': cutoff,
+            'concepts': len(ids),
+            'candidates': int(candidates.sum()),
+            'counted': counted,
+            'valid': int(valid.sum()),
+            'error_bound': sketch.error_bound(),
+        }
+        logger.info('Document frequency sketch: %d of %d concepts are '
+                    'candidates, %d counted exactly, %d valid'
+                    % (candidates.sum(), len(ids), counted, valid.sum()))
+        return set(vocabulary[index] for index in ids[valid])
 
-        # TODO: make sure matrices have a meaningful `hash`.
-        #matrices = dict((name, hash(mat)) for name, mat in self.other_matrices.items())
-        return dict(docs=docs, matrices=matrices)
+    def sketches_documents(self):
+        """
+        Whether the document matrix only has columns for the valid
+        concepts. That's the case in an associative study whose valid
+        concepts come from the document frequency sketch, where the other
+        columns would never be used.
+        """
+        return bool(self.config('df_sketch_width')) and self.is_associative()
 
     @property
     def num_documents(self):
@@ -193,83 +812,160 @@ class Study(QtCore.QObject):
     
     def get_documents_matrix(self):
         """
-        Get a matrix of documents vs. concepts.
+        Get a matrix of study documents vs. concepts.
 
         This is temporarily cached (besides what StudyDir does) because it
         will be needed multiple times in analyzing a study.
 
-        FIXME: try to make canonical documents not change the results
+        Canonical documents aren't in it, so they don't change the space
+        the study is analyzed into; see get_canonical_matrix.
         """
         self._step('Building document matrix...')
         if self.num_documents == 0:
             assert False
             return None
-        if self._documents_matrix is not None:
-            return self._documents_matrix
-        entries = []
+        if self._documents_matrix is None:
+            self._documents_matrix = self._stage('documents',
+                                                 self._build_documents_matrix)
+        return self._documents_matrix
+
+    def _build_documents_matrix(self):
+        if self.sketches_documents():
+            return self._build_sketched_documents_matrix()
+        vocabulary = self.get_vocabulary()
+        allowed = self.get_allowed_concepts()
+        counts = self.document_counts
+        if counts is not None:
+            counts.update(self.study_documents, allowed)
+            counts.save()
+            documents_matrix = counts.tfidf_matrix(self.study_documents)
+        else:
+            entries = EntryBuffer()
+            for docid, doc in enumerate(self.study_documents):
+                self._step(doc.name)
+                for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+                    if concept in allowed:
+                        entries.append(value, docid, vocabulary.index(concept))
+            doc_names = [doc.name for doc in self.study_documents]
+            documents_matrix = entries.to_matrix(doc_names, vocabulary).normalize_tfidf(cols_are_terms=True)
+        return documents_matrix
+
+    def _build_sketched_documents_matrix(self):
+        """
+        Build the document matrix with columns for only the valid concepts,
+        so that the rare concepts that the sketch was used to avoid
+        counting never get an entry.
+
+        The entries are the same as those columns of the full matrix: every
+        document with allowed concepts has a row, its term frequencies are
+        divided by the total of all its allowed concepts, and the valid
+        concepts' document frequencies are counted exactly. An associative
+        study projects a document as the sum of the study concepts in it,
+        so the missing columns don't change anything.
+        """
+        vocabulary = self.get_vocabulary()
+        allowed = self.get_allowed_concepts()
+        valid = self.get_assoc_concepts()
+        doc_names = []
+        doc_totals = []
+        rows = []
+        ids = []
+        values = []
         for doc in self.study_documents:
             self._step(doc.name)
-            for concept, value in doc.extract_concepts_with_negation()[:1000]:
-                if (concept not in PUNCTUATION) and (not en_nl.is_blacklisted(concept)):
-                    entries.append((value, doc.name, concept))
-        documents_matrix = divisi2.make_sparse(entries).normalize_tfidf(cols_are_terms=True)
-        canon_entries = []
-        for doc in self.canonical_documents:
-            self._step(doc.name)
-            for concept, value in doc.extract_concepts_with_negation()[:1000]:
-                if (concept not in PUNCTUATION) and (not en_nl.is_blacklisted(concept)):
-                    canon_entries.append((value, doc.name, concept))
-        if canon_entries:
-            canonical_matrix = divisi2.make_sparse(canon_entries).normalize_rows()
-            self._documents_matrix = documents_matrix + canonical_matrix
-        else:
-            self._documents_matrix = documents_matrix
-        return self._documents_matrix
-    
+            totals = {}
+            order = []
+            for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+                if concept in allowed:
+                    if concept not in totals:
+                        totals[concept] = 0
+                        order.append(concept)
+                    totals[concept] += value
+            if not order: continue
+            row = len(doc_names)
+            doc_names.append(doc.name)
+            doc_totals.append(sum(abs(total) for total in totals.values()))
+            for concept in order:
+                if concept in valid and totals[concept] != 0:
+                    rows.append(row)
+                    ids.append(vocabulary.index(concept))
+                    values.append(totals[concept])
+        ids = np.array(ids, dtype=np.int64)
+        doc_freq = np.bincount(ids, minlength=len(vocabulary))
+        return tfidf_from_counts(doc_names, np.array(rows, dtype=np.int64),
+                                 ids, np.array(values, dtype=np.float64),
+                                 np.array(doc_totals, dtype=np.float64),
+                                 doc_freq, vocabulary)
+
+    def get_canonical_matrix(self):
+        """
+        Get a matrix of canonical documents vs. concepts, or None if no
+        canonical document has any allowed concepts.
+
+        Canonical documents are categories that are projected into the
+        study's space after it's found, instead of being used to find it.
+        There are few of them, so this is cheap enough to build every time.
+        """
+        vocabulary = self.get_vocabulary()
+        allowed = self.get_allowed_concepts()
+        canon_entries = EntryBuffer()
+        for docid, doc in enumerate(self.canonical_documents):
+            for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+                if concept in allowed:
+                    canon_entries.append(value, docid, vocabulary.index(concept))
+        if not len(canon_entries): return None
+        canon_names = [doc.name for doc in self.canonical_documents]
+        return canon_entries.to_matrix(canon_names, vocabulary).normalize_rows()
+
+    def get_assoc_concepts(self):
+        """
+        Get the set of concepts that go into the association matrix.
+        """
+        if self._assoc_concepts is None:
+            # NOTE: concept_cutoff is the number you change to make a study
+            # larger or smaller, or set max_concepts or max_nnz to have it
+            # chosen for you.
+            valid_concepts = self.get_valid_concepts(self.choose_concept_cutoff())
+            self.cutoff_report['num_concepts'] = len(valid_concepts)
+            self._assoc_concepts = valid_concepts
+        return self._assoc_concepts
+
     def get_documents_assoc(self):
+        """
+        Get the pruned association matrix of the study documents, or None
+        if there isn't one. The pruning report goes in `self.prune_report`.
+        """
         self._step('Finding associated concepts...')
         if self.num_documents == 0: return None
-        docs = self.get_documents_matrix()
-        concept_counts = docs.col_op(len)
-        valid_concepts = set()
-
-        # NOTE: this is the number you change to make a study larger or
-        # smaller.
-        for concept, count in concept_counts.to_sparse().named_items():
-            if count >= self.config('concept_cutoff'): valid_concepts.add(concept)
-        if len(valid_concepts) == 0:
-            # No valid concepts. This unfortunately happens when
-            # concept_cutoff is too low.
-            return None
+        if self._assoc_result is None:
+            if len(self.get_assoc_concepts()) == 0:
+                # No valid concepts. This unfortunately happens when
+                # concept_cutoff is too low.
+                self._assoc_result = (None, [])
+            else:
+                self._assoc_result = self._stage('assoc',
+                                                 self._count_associations)
+        doc_matrix, self.prune_report = self._assoc_result
+        return doc_matrix
+
+    def _count_associations(self):
+        memory_limit = self.config('assoc_memory_mb') * 2**20
+        doc_matrix = association_matrix(self.study_documents,
+                                        self.get_vocabulary(),
+                                        self.get_assoc_concepts(),
+                                        self.config('assoc_workers'),
+                                        memory_limit, self.scratch_dir).squish()
+        return prune_matrix(doc_matrix, self.config)
 
-        entries = []
-        for doc in self.study_documents:
-            prev_concepts = []
-            for sentence in doc.get_sentences():
-                # avoid insane space usage by limiting to 20 words
-                concepts = extract_concepts_from_words(sentence[:20])
-                for concept1, value1 in concepts:
-                    if concept1 in valid_concepts:
-                        for concept2, value2 in concepts:
-                            if concept2 in valid_concepts and concept1 < concept2:
-                                entries.append( (value1*value2, concept1, concept2) )
-                                entries.append( (value1*value2, concept2, concept1) )
-                        for concept2, value2 in prev_concepts:
-                            if concept2 in valid_concepts and concept1 != concept2:
-                                entries.append( (value1*value2/2, concept1, concept2) )
-                                entries.append( (value1*value2/2, concept2, concept1) )
-                # Remember tags, but forget words that were too long ago
-                prev_concepts = [p for p in prev_concepts[:-100] if
-                p[0].startswith('#')] + prev_concepts[-100:]
-                prev_concepts.extend(concepts)
-        assert len(entries) > 0
-        return divisi2.SparseMatrix.square_from_named_entries(entries).squish()
-    
     def get_blend(self):
+        """
+        Get the blend of the study's matrices, and the set of concepts that
+        came from the documents.
+        """
         if self.is_associative():
-            return self.get_assoc_blend()
+            return self._stage('blend', self.get_assoc_blend)
         else:
-            return self.get_analogy_blend()
+            return self._stage('blend', self.get_analogy_blend)
     
     def is_associative(self):
         if not self.other_matrices: return True
@@ -283,22 +979,16 @@ class Study(QtCore.QObject):
         
         # find concepts used at least twice
         docs = self.get_documents_matrix()
-        concept_counts = docs.col_op(len)
-        valid_concepts = set()
-        for concept, count in concept_counts.to_sparse().named_items():
-            if count >= 3: valid_concepts.add(concept)
+        valid_concepts = self.get_valid_concepts(3)
         
         # extract relevant concepts from the doc matrix;
         # transpose it so it's concepts vs. documents
-        orig_doc_matrix = self.get_documents_matrix()
+        orig_doc_matrix = docs
         #sdoc_indices = [orig_doc_matrix.row_index(sdoc.name)
         #                for sdoc in self.study_documents]
         concept_indices = [orig_doc_matrix.col_index(c)
                            for c in valid_concepts]
 
-        # NOTE: canonical documents can affect the stats this way.
-        # Is there a clean way to fix this?
-
         doc_matrix = orig_doc_matrix[:,concept_indices].T.squish()
         if doc_matrix is None:
             theblend = blend(other_matrices)
@@ -328,22 +1018,72 @@ class Study(QtCore.QObject):
             study_concepts = set(doc_matrix.row_labels)
         return theblend, study_concepts
 
+    def get_svd(self):
+        """
+        Get the SVD of the normalized blend with `axes` axes, along with the
+        set of concepts that came from the documents.
+
+        The SVD is computed, and saved in the stage cache, with as many as
+        `max_axes` axes, so that a smaller number of axes only has to be
+        truncated from it. With `svd_warm_start`, it starts from the SVD
+        that was saved last time.
+
+        A report on how the SVD was found goes in `self.svd_report`.
+        """
+        def compute():
+            theblend, study_concepts = self.get_blend()
+            previous = None
+            if self.config('svd_warm_start') and self.stage_cache is not None:
+                previous = self.stage_cache.previous('svd')
+            U, Sigma, V, report = blend_svd(theblend.normalize_all(),
+                                            svd_rank(self.config), self.config,
+                                            previous)
+            return U, Sigma, V, study_concepts, report
+        U, Sigma, V, study_concepts, self.svd_report = self._stage('svd', compute)
+        U, Sigma, V = truncate_svd(U, Sigma, V, self.config('axes'))
+        return U, Sigma, V, study_concepts
+
     def get_eigenstuff(self):
         self._step('Finding eigenvectors...')
         document_matrix = self.get_documents_matrix()
-        theblend, study_concepts = self.get_blend()
-        U, Sigma, V = theblend.normalize_all().svd(k=self.config('axes'))
+        projections, Sigma = self._stage(
+            'projections', lambda: self._project(document_matrix))
+        return document_matrix, projections, Sigma
+
+    def _project(self, document_matrix):
+        U, Sigma, V, study_concepts = self.get_svd()
+        return self._project_into(document_matrix, U, Sigma, V, study_concepts)
+
+    def _project_into(self, document_matrix, U, Sigma, V, study_concepts):
+        """
+        Get the projections of the study concepts and the study documents
+        into the space of an SVD. In a non-associative study, documents that
+        aren't in V (or all of them, if V is None) are folded in as new
+        columns of the decomposed matrix.
+        """
         indices = [U.row_index(concept) for concept in study_concepts]
         reduced_U = U[indices]
         if self.is_associative():
-            doc_rows = divisi2.aligned_matrix_multiply(document_matrix, reduced_U)
+            doc_rows = self._fold_in(document_matrix, reduced_U, Sigma)
             projections = reduced_U.extend(doc_rows)
 
         else:
+            if V is None: V_labels = set()
+            else: V_labels = set(V.row_labels)
             doc_indices = [V.row_index(doc.name)
-                           for doc in self.documents
-                           if doc.name in V.row_labels]
-            projections = reduced_U.extend(V[doc_indices])
+                           for doc in self.study_documents
+                           if doc.name in V_labels]
+            missing = [document_matrix.row_index(doc.name)
+                       for doc in self.study_documents
+                       if doc.name not in V_labels
+                       and doc.name in document_matrix.row_labels]
+            if doc_indices:
+                projections = reduced_U.extend(V[doc_indices])
+            else:
+                projections = reduced_U
+            if missing:
+                projections = projections.extend(
+                    self._fold_in(document_matrix[missing], U, Sigma))
         
         #if SUBTRACT_MEAN:
         #    sdoc_indices = [projections.row_index(doc.name) for doc in
@@ -352,28 +1092,56 @@ class Study(QtCore.QObject):
         if SUBTRACT_MEAN:
             projections -= np.asarray(projections).mean(axis=0)
 
-        return document_matrix, projections, Sigma
+        return projections, Sigma
+
+    def _fold_in(self, matrix, U, Sigma):
+        """
+        Project the rows of a document matrix into the space whose concepts
+        have the rows of `U`. In an associative study, a document is the
+        sum of its concepts. Otherwise it's a new column of the decomposed
+        matrix, a, which the SVD would give the row U^T a / Sigma of V.
+        """
+        if self.is_associative():
+            return divisi2.aligned_matrix_multiply(matrix, U)
+        folded = divisi2.aligned_matrix_multiply(matrix.normalize_rows(), U)
+        return divisi2.DenseMatrix(np.asarray(folded) / np.asarray(Sigma),
+                                   folded.row_labels, None)
+
+    def add_canonicals(self, docs, projections, Sigma):
+        """
+        Fold the canonical documents into the projections of a study,
+        using the projections of its concepts as U. Returns the document
+        matrix and the projections with the canonical documents added.
+        """
+        canonical_matrix = self.get_canonical_matrix()
+        if canonical_matrix is None: return docs, projections
+        doc_names = set(doc.name for doc in self.study_documents)
+        concept_rows = [i for i, label in enumerate(projections.row_labels)
+                        if label not in doc_names]
+        canonical_rows = self._fold_in(canonical_matrix,
+                                       projections[concept_rows], Sigma)
+        return docs + canonical_matrix, projections.extend(canonical_rows)
 
     def compute_stats(self, docs, spectral):
         """
-        Calculate statistics.
+        Calculate statistics of the study documents and concepts.
 
         Consistency: how tightly-clustered the documents are in the spectral
         decomposition space.
 
         Centrality: a Z-score for how "central" each concept and document
         is. Same general idea as "congruence" from Luminoso 1.0.
+
+        The statistics of canonical documents, which don't change these,
+        are added by compute_canonical_stats.
         """
 
         if len(self.study_documents) <= 1:
             # consistency and centrality are undefined
             consistency = None
-            centrality = None
-            correlation = None
             core = None
-            key_concepts = None
-            c_centrality = None
-            c_correlation = None
+            doc_mean = None
+            doc_stderr = None
         else:
             # Determine which indices of the association matrix correspond to
             # documents.
@@ -381,7 +1149,6 @@ class Study(QtCore.QObject):
                            for doc in self.study_documents
                            if doc.name in spectral.row_labels]
             valid_concepts = [c for c in spectral.row_labels if not c.endswith('.txt')]
-            concept_indices = [spectral.row_index(c) for c in valid_concepts]
             
             # Make an ad hoc category of documents, then find how much each
             # document is associated with this average document.
@@ -402,66 +1169,234 @@ class Study(QtCore.QObject):
 
             consistency = doc_mean / doc_stderr
             centrality = divisi2.DenseVector((all_assoc - doc_mean) / doc_stderr, spectral.row_labels)
-            correlation = divisi2.DenseVector(all_assoc / doc_stderr, spectral.row_labels)
             core = centrality.top_items(len(centrality)/2)
             core = [c[0] for c in core
                     if c[0] in valid_concepts
                     and c[1] > .001][:20]
 
-            c_centrality = {}
-            c_correlation = {}
-            key_concepts = {}
-            
-            # the number of times each concept appears in each document
-            doc_occur = self._documents_matrix
-
-            # the average number of occurrences you expect of each document
-            baseline = (1.0 + doc_occur.col_op(len)) / doc_occur.shape[0]
-            for doc in self.canonical_documents:
-                # record centrality and correlation for this document
-                c_centrality[doc.name] = centrality.entry_named(doc.name)
-                c_correlation[doc.name] = correlation.entry_named(doc.name)
-
-                # find a weighted vector of similar documents
-                docvec = np.maximum(0, spectral.row_named(doc.name)[doc_indices]) ** 3
-                docvec /= (0.0001 + np.sum(docvec))
-                keyvec = divisi2.aligned_matrix_multiply(docvec, doc_occur)
-
-                assert not any(np.isnan(keyvec))
-                assert not any(np.isinf(keyvec))
-                interesting = spectral.row_named(doc.name)[concept_indices]
-                #interesting = keyvec/baseline
-                key_concepts[doc.name] = []
-                for key, val in interesting.top_items(5):
-                    if val > 0.0 and keyvec.entry_named(key) > 0.0:
-                        key_concepts[doc.name].append((key, keyvec.entry_named(key)))
-        
         return {
-            'num_documents': self.num_documents,
-            'num_concepts': spectral.shape[0] - self.num_documents,
+            'num_concepts': spectral.shape[0] - len(self.study_documents),
             'consistency': consistency,
-            'centrality': c_centrality,
-            'correlation': c_correlation,
-            'key_concepts': key_concepts,
+            # filled in by compute_canonical_stats
+            'centrality': {},
+            'correlation': {},
+            'key_concepts': {},
             'core': core,
+            'doc_mean': doc_mean,
+            'doc_stderr': doc_stderr,
+            'concept_cutoff': self.cutoff_report,
+            'pruning': self.prune_report,
+            'svd': self.svd_report,
             'timestamp': list(time.localtime())
         }
+
+    def compute_canonical_stats(self, docs, spectral, stats):
+        """
+        Add the number of documents, and the centrality, correlation and
+        key concepts of each canonical document, to the study's `stats`
+        from compute_stats. `spectral` must have the canonical documents
+        folded into it, and `docs` is the matrix of study documents.
+
+        This only looks at the canonical documents' own rows, so it's cheap
+        enough to do every time the study is analyzed, and the stats stage
+        that's cached doesn't depend on the canonical documents at all.
+        """
+        stats = dict(stats)
+        stats['num_documents'] = self.num_documents
+        c_centrality = {}
+        c_correlation = {}
+        key_concepts = {}
+        stats['centrality'] = c_centrality
+        stats['correlation'] = c_correlation
+        stats['key_concepts'] = key_concepts
+        # centrality is undefined without at least two study documents
+        if stats['consistency'] is None: return stats
+        doc_mean = stats['doc_mean']
+        doc_stderr = stats['doc_stderr']
+        doc_indices = [spectral.row_index(doc.name)
+                       for doc in self.study_documents
+                       if doc.name in spectral.row_labels]
+        valid_concepts = [c for c in spectral.row_labels if not c.endswith('.txt')]
+        concept_indices = [spectral.row_index(c) for c in valid_concepts]
+
+        # the number of times each concept appears in each document
+        doc_occur = docs
+        for doc in self.canonical_documents:
+            if doc.name not in spectral.row_labels: continue
+            # record centrality and correlation for this document, from its
+            # association with the average document
+            row = spectral.row_named(doc.name)
+            assoc = np.mean(np.asarray(row[doc_indices]))
+            c_centrality[doc.name] = (assoc - doc_mean) / doc_stderr
+            c_correlation[doc.name] = assoc / doc_stderr
+
+            # find a weighted vector of similar documents
+            docvec = np.maximum(0, row[doc_indices]) ** 3
+            docvec /= (0.0001 + np.sum(docvec))
+            keyvec = divisi2.aligned_matrix_multiply(docvec, doc_occur)
+
+            assert not any(np.isnan(keyvec))
+            assert not any(np.isinf(keyvec))
+            interesting = row[concept_indices]
+            key_concepts[doc.name] = []
+            for key, val in interesting.top_items(5):
+                if val > 0.0 and keyvec.entry_named(key) > 0.0:
+                    key_concepts[doc.name].append((key, keyvec.entry_named(key)))
+        return stats
     
-    def analyze(self):
-        # TODO: make it possible to blend multiple directories
+    def _reset(self):
         self._documents_matrix = None
-        docs, projections, Sigma = self.get_eigenstuff()
+        self._allowed_concepts = None
+        self._vocabulary = None
+        self.prune_report = []
+        self.cutoff_report = None
+        self.svd_report = None
+        self.sketch_report = None
+        self._df_sketch = None
+        self._df_counts = None
+        self._stage_keys = {}
+        self._concepts_extracted = False
+        self._assoc_concepts = None
+        self._assoc_result = None
+
+    def _spectral(self, projections, Sigma):
         magnitudes = np.sqrt(np.sum(np.asarray(projections*projections), axis=1))
         if self.is_associative():
             spectral = divisi2.reconstruct_activation(projections, Sigma, post_normalize=True, offset=0.0001)
         else:
             spectral = divisi2.reconstruct_similarity(projections, Sigma,
             post_normalize=True, offset=0.0001)
+        return spectral, magnitudes
+
+    def analyze(self):
+        # TODO: make it possible to blend multiple directories
+        self._reset()
+        docs, projections, Sigma = self.get_eigenstuff()
+        spectral, magnitudes = self._stage(
+            'spectral', lambda: self._spectral(projections, Sigma))
         self._step('Calculating stats...')
-        stats = self.compute_stats(docs, spectral)
-        
-        results = StudyResults(self, docs, spectral.left, spectral, magnitudes, stats)
-        return results
+        def compute_stats():
+            if self.is_associative():
+                # the pruning report comes from the association stage
+                self.get_documents_assoc()
+            if self.svd_report is None:
+                self.get_svd()
+            return self.compute_stats(docs, spectral)
+        stats = self._stage('stats', compute_stats)
+        return self._results(docs, projections, Sigma, spectral, magnitudes,
+                             stats)
+
+    def _results(self, docs, projections, Sigma, spectral, magnitudes, stats):
+        """
+        Make the StudyResults from the analysis of the study documents, by
+        folding in the canonical documents and adding their statistics.
+        """
+        study_docs = docs
+        if self.canonical_documents:
+            self._step('Projecting canonical documents...')
+            docs, projections = self.add_canonicals(docs, projections, Sigma)
+            spectral, magnitudes = self._spectral(projections, Sigma)
+        stats = self.compute_canonical_stats(study_docs, spectral, stats)
+        return StudyResults(self, docs, spectral.left, spectral, magnitudes,
+                            stats)
+
+    def update(self):
+        """
+        Fold the study documents that are new since the last analysis into
+        its space with CCIPCA (see luminoso/ccipca.py), instead of finding
+        the SVD again. The updated space is kept in the stage cache, so
+        that later updates only have to fold in the documents that are new
+        since then, until a full analysis finds a new SVD.
+
+        Only new documents are learned. Documents that were removed are
+        left out of the results, and documents that were changed keep
+        their old place in the space, until the next full analysis.
+
+        This only works when the study's SVD is of its document matrix,
+        where each document is a column of the blend. In an associative
+        study the blend's columns are concepts, and new documents change
+        their associations instead of adding columns, so the study has to
+        be analyzed again.
+
+        Returns the StudyResults, or None if the study is associative or
+        there is no earlier analysis to update, in which case the study
+        should be analyzed instead.
+        """
+        if self.is_associative():
+            logger.info('An associative study has to be analyzed again '
+                        'to add documents to it')
+            return None
+        if self.stage_cache is None: return None
+        saved = self.stage_cache.previous('svd')
+        if saved is None: return None
+        self._reset()
+        start_time = time.time()
+        U, Sigma, V, study_concepts, report = saved
+        U, Sigma, V = truncate_svd(U, Sigma, V, self.config('axes'))
+        key = StageCache.key('ccipca', [float(s) for s in np.asarray(Sigma)])
+        try:
+            state = self.stage_cache.get('ccipca', key)
+        except KeyError:
+            # Start from the SVD, which already has the documents that
+            # were projected into it.
+            previous = self.stage_cache.previous('projections')
+            known = set()
+            if previous is not None: known = set(previous[0].row_labels)
+            state = {'pca': CCIPCA.from_svd(U, Sigma, V.shape[0]),
+                     'documents': known}
+        pca = state['pca']
+        pca.amnesia = self.config('ccipca_amnesia')
+        # New documents are scaled to the average length of the columns
+        # the space was found from, as far as the space captures them.
+        scale = np.sqrt(pca.values().sum())
+
+        document_matrix = self.get_documents_matrix()
+        self._step('Folding in new documents...')
+        positions = {}
+        for i, label in enumerate(U.row_labels):
+            positions[label] = i
+        col_positions = np.array([positions.get(label, -1)
+                                  for label in document_matrix.col_labels],
+                                 dtype=np.int64)
+        values, rows, cols = document_matrix.find()
+        values = np.asarray(values)
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        order = np.argsort(rows, kind='mergesort')
+        row_starts = np.searchsorted(rows[order],
+                                     np.arange(document_matrix.shape[0] + 1))
+        learned = 0
+        for doc in self.study_documents:
+            if doc.name in state['documents']: continue
+            state['documents'].add(doc.name)
+            if doc.name not in document_matrix.row_labels: continue
+            row = document_matrix.row_index(doc.name)
+            entries = order[row_starts[row]:row_starts[row+1]]
+            places = col_positions[cols[entries]]
+            found = places >= 0
+            x = np.zeros(U.shape[0])
+            x[places[found]] = values[entries][found]
+            norm = np.sqrt(np.dot(x, x))
+            if norm == 0: continue
+            pca.learn(x * (scale / norm))
+            learned += 1
+        new_U, new_Sigma = pca.svd()
+        U = divisi2.DenseMatrix(new_U, U.row_labels, None)
+        Sigma = divisi2.DenseVector(new_Sigma)
+        self.svd_report = {'method': 'ccipca', 'documents': learned,
+                           'axes': len(new_Sigma),
+                           'seconds': time.time() - start_time}
+        logger.info('Folded %d new documents into the space in %.1f s'
+                    % (learned, self.svd_report['seconds']))
+
+        projections, Sigma = self._project_into(document_matrix, U, Sigma,
+                                                None, study_concepts)
+        spectral, magnitudes = self._spectral(projections, Sigma)
+        self._step('Calculating stats...')
+        stats = self.compute_stats(document_matrix, spectral)
+        self.stage_cache.put('ccipca', key, state)
+        return self._results(document_matrix, projections, Sigma, spectral,
+                             magnitudes, stats)
 
 class StudyResults(QtCore.QObject):
     def __init__(self, study, docs, projections, spectral, magnitudes, stats):
@@ -563,9 +1498,6 @@ class StudyResults(QtCore.QObject):
         self.write_core(tgt("core.txt"))
         self.write_report(tgt("report.html"))
 
-        # Save input contents hash to know if the study has changed.
-        save_pickle('input_hash.pickle', self.study.get_contents_hash())
-
     @classmethod
     def load(cls, dir, for_study):
         def tgt(name): return os.path.join(dir, name)
@@ -573,27 +1505,23 @@ class StudyResults(QtCore.QObject):
             with open(tgt(name), 'rb') as f:
                 return pickle.load(f)
 
-        # Either this will all fail or all succeed.
+        # Either this will all fail or all succeed. Whether the results are
+        # up to date is checked by the StudyDirectory, using its manifest.
         try:
-            input_hash = load_pickle('input_hash.pickle')
+            for_study._step('Loading document matrix...')
+            docs = load_pickle("documents.smat")
+            for_study._step('Loading eigenvectors...')
+            spectral = load_pickle("spectral.rmat")
+            for_study._step('Loading projections...')
+            projections = load_pickle("projections.dmat")
+            for_study._step('Loading magnitudes...')
+            magnitudes = load_pickle("magnitudes.dvec")
+
+            # Load stats
+            for_study._step('Loading stats...')
+            stats = load_json_from_file(tgt("stats.json"))
         except IOError:
             raise OutdatedAnalysisError()
-        cur_hash = for_study.get_contents_hash()
-        if input_hash != cur_hash:
-            raise OutdatedAnalysisError()
-        
-        for_study._step('Loading document matrix...')
-        docs = load_pickle("documents.smat")
-        for_study._step('Loading eigenvectors...')
-        spectral = load_pickle("spectral.rmat")
-        for_study._step('Loading projections...')
-        projections = load_pickle("projections.dmat")
-        for_study._step('Loading magnitudes...')
-        magnitudes = load_pickle("magnitudes.dvec")
-
-        # Load stats
-        for_study._step('Loading stats...')
-        stats = load_json_from_file(tgt("stats.json"))
 
         return cls(for_study, docs, projections, spectral, magnitudes, stats)
 
@@ -611,6 +1539,10 @@ class StudyDirectory(QtCore.QObject):
         self.dir = dir.rstrip(os.path.sep)
         self.load_settings()
 
+    def config(self, key):
+        if key in self.settings: return self.settings[key]
+        else: return DEFAULT_SETTINGS[key]
+
     @staticmethod
     def make_new(destdir):
         # make a new study... the hard way.
@@ -687,16 +1619,23 @@ class StudyDirectory(QtCore.QObject):
             
         return self.listdir('Matrices', text_only=False, full_names=True)
 
+    def load_documents(self, dir, cls):
+        """
+        Read, detect the encoding of, and decode all the text files in `dir`,
+        using `ingest_workers` processes. Documents come back sorted by
+        filename so that the order doesn't depend on the filesystem.
+        """
+        filenames = sorted(self.listdir(dir, text_only=True, full_names=True))
+        return parallel_map(_read_document,
+                            [(cls, filename) for filename in filenames],
+                            self.config('ingest_workers'))
+
     def get_documents(self):
-        study_documents = [Document.from_file(filename, name=os.path.basename(filename))
-                           for filename in self.listdir('Documents', text_only=True, full_names=True)]
-        return study_documents
+        return self.load_documents('Documents', Document)
 
     def get_canonical_documents(self):
         self._ensure_dir_exists("Canonical")
-        canonical_documents = [CanonicalDocument.from_file(filename, name=os.path.basename(filename))
-                               for filename in self.listdir('Canonical', text_only=True, full_names=True)]
-        return canonical_documents
+        return self.load_documents('Canonical', CanonicalDocument)
 
     def get_matrices(self):
         return dict((os.path.basename(filename), divisi2.load(filename))
@@ -704,22 +1643,92 @@ class StudyDirectory(QtCore.QObject):
                     if filename.endswith('.smat'))
     
 
+    def get_concept_cache(self):
+        return ConceptCache(os.path.join(self.get_results_dir(),
+                                         'concepts.pickle'))
+
+    def get_verdict_cache(self):
+        return VerdictCache(os.path.join(self.get_results_dir(),
+                                         'verdicts.pickle'),
+                            concept_filter_fingerprint())
+
+    def get_document_counts(self):
+        return DocumentCounts(os.path.join(self.get_results_dir(),
+                                           'doccounts.pickle'),
+                              (ConceptCache.VERSION,
+                               concept_filter_fingerprint()))
+
+    def get_stage_cache(self):
+        return StageCache(os.path.join(self.get_results_dir(), 'stages'))
+
     def get_study(self):
         try:
             return Study(name=self.dir.split(os.path.sep)[-1],
                          documents=self.get_documents(),
                          canonical=self.get_canonical_documents(),
                          other_matrices=self.get_matrices(),
-                         settings = self.settings
+                         settings = self.settings,
+                         concept_cache=self.get_concept_cache(),
+                         verdict_cache=self.get_verdict_cache(),
+                         scratch_dir=self.get_results_dir(),
+                         document_counts=self.get_document_counts(),
+                         stage_cache=self.get_stage_cache()
                         )
         except (IOError, OSError):
             raise StudyLoadError
 
-    def analyze(self):
+    def get_manifest_file(self):
+        return os.path.join(self.get_results_dir(), 'manifest.json')
+
+    def load_manifest(self):
+        """
+        Get the manifest of the inputs that the saved results were computed
+        from, or None if there isn't one.
+        """
+        try:
+            return StudyManifest.load(self.get_manifest_file())
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def is_analysis_fresh(self):
+        """
+        Check whether the saved results were computed from the documents,
+        canonical documents and matrices that are in the study now.
+
+        This only needs to `stat()` the input files; a file is rehashed only
+        if its size or modification time has changed.
+        """
+        saved = self.load_manifest()
+        if saved is None: return False
+        current = StudyManifest.scan(self.dir, previous=saved)
+        if current != saved:
+            logger.info('Inputs changed since the last analysis: %s'
+                        % ', '.join(current.changed_files(saved)))
+            return False
+        if current.rehashed:
+            # The files were touched but not changed. Remember their new
+            # times so we don't hash them again next time.
+            current.save(self.get_manifest_file())
+        return True
+
+    def analyze(self, update=False):
+        """
+        Analyze the study and save the results. With `update`, new
+        documents are folded into the last analysis instead, if there is
+        one and the study isn't associative (see Study.update).
+        """
+        # Scan the inputs before analyzing, so that files that change
+        # during the analysis will be noticed next time.
+        manifest = StudyManifest.scan(self.dir, previous=self.load_manifest())
         study = self.get_study()
-        results = study.analyze()
+        results = None
+        if update: results = study.update()
+        if results is None: results = study.analyze()
         self._ensure_dir_exists('Results')
+        if os.path.exists(self.get_manifest_file()):
+            os.remove(self.get_manifest_file())
         results.save(self.study_path('Results'))
+        manifest.save(self.get_manifest_file())
         return results
 
     def set_setting(self, key, value):
@@ -729,24 +1738,42 @@ class StudyDirectory(QtCore.QObject):
     def set_num_axes(self, axes):
         self.set_setting('axes', axes)
     
-    def get_existing_analysis(self):
-        # FIXME: this loads the study twice, I think
+    def get_existing_analysis(self, study=None):
+        """
+        Load the saved results of analyzing this study, or return None if
+        there are none or they are out of date.
+
+        Pass in `study` if you have already loaded it, so that it isn't
+        loaded again.
+        """
         try:
-            return StudyResults.load(self.study_path('Results'), self.get_study())
+            if not self.is_analysis_fresh():
+                raise OutdatedAnalysisError()
+            if study is None: study = self.get_study()
+            return StudyResults.load(self.study_path('Results'), study)
         except OutdatedAnalysisError:
             print "Skipping outdated analysis."
             return None
 
-def run_study(dirname):
+def run_study(dirname, update=False):
     study = StudyDirectory(dirname)
-    study.analyze()
+    study.analyze(update)
 
 def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [--update] StudyDir')
+    parser.add_option('--update', action='store_true', default=False,
+                      help='fold new documents into the last analysis '
+                           'instead of analyzing the study again, unless '
+                           'the study is associative')
+    options, args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    if len(sys.argv) > 1:
-        run_study(sys.argv[1])
+    if args:
+        run_study(args[0], options.update)
     else:
-        print 'Run "luminoso-study StudyDir" to analyze a study directory.'
+        print 'Run "luminoso-study StudyDir" to analyze a study directory,'
+        print 'or "luminoso-study --update StudyDir" to add new documents to'
+        print 'its last analysis.'
 
 import sys
 if __name__ == '__main__':
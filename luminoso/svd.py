@@ -0,0 +1,245 @@
+"""
+Working with the truncated SVD of a study's blend.
+
+The SVD is computed once at the study's largest number of axes (see the
+`max_axes` setting), and fewer axes are had by keeping a prefix of it: the
+rank-k truncated SVD is the first k singular triples of any larger one.
+
+The `svd_engine` setting picks how the SVD is found:
+
+- `divisi2`: divisi2's own SVD.
+- `randomized`: a randomized SVD, which multiplies the matrix by
+  `axes + svd_oversample` random vectors and then refines them with
+  `svd_power_iterations` rounds of multiplying by the matrix and its
+  transpose. This is much faster on a large blend, and close to the
+  divisi2 result for the largest singular values.
+- `lanczos`: SciPy's ARPACK solver.
+
+Any engine can be replaced by subspace iteration that starts from the SVD
+of the study's last analysis (`svd_warm_start`). When only a few documents
+have changed, the old singular vectors are nearly right, and only a few
+iterations are needed to fix them up.
+"""
+import time
+import numpy as np
+from csc import divisi2
+import logging
+logger = logging.getLogger('luminoso')
+
+def svd_rank(config):
+    """
+    How many axes to compute the SVD with, for a study whose settings are
+    looked up with `config`.
+    """
+    return max(config('axes'), config('max_axes'))
+
+ENGINES = ['divisi2', 'randomized', 'lanczos']
+
+def svd_settings(config):
+    """
+    The settings, looked up with `config`, that change the SVD that is
+    found. A warm start stops when its residuals are within `svd_tolerance`
+    or after `svd_max_iterations`, so its result depends on those, and it
+    isn't interchangeable with a cold start's.
+    """
+    engine = config('svd_engine')
+    if engine == 'randomized':
+        settings = (engine, config('svd_oversample'),
+                    config('svd_power_iterations'))
+    else:
+        settings = (engine,)
+    if config('svd_warm_start'):
+        settings += ('warm_start', config('svd_tolerance'),
+                     config('svd_max_iterations'), config('svd_oversample'))
+    return settings
+
+def truncate_svd(U, Sigma, V, k):
+    """
+    Keep the `k` largest singular values of an SVD and their vectors.
+    """
+    order = np.argsort(-np.asarray(Sigma), kind='mergesort')[:k]
+    if np.all(order == np.arange(len(order))):
+        return U[:, :k], Sigma[:k], V[:, :k]
+    return U[:, order], Sigma[order], V[:, order]
+
+def blend_svd(matrix, k, config, previous=None):
+    """
+    Find the SVD of the SparseMatrix `matrix` with `k` axes, the way the
+    settings looked up with `config` ask for. `previous` is the `(U, Sigma,
+    V)` of the last analysis, if there was one, to warm start from.
+
+    Returns U, Sigma, V, and a report of the method used, how long it took
+    and, for subspace iteration, how many iterations it ran.
+    """
+    engine = config('svd_engine')
+    if engine not in ENGINES:
+        raise ValueError('Unknown svd_engine %r; it should be one of %s'
+                         % (engine, ', '.join(ENGINES)))
+    start_time = time.time()
+    if config('svd_warm_start'):
+        start = None
+        if previous is not None:
+            start = aligned_start(previous[2], matrix.col_labels)
+        U, Sigma, V, report = subspace_svd(
+            matrix.to_scipy_csr(), k, start=start,
+            oversample=config('svd_oversample'),
+            tol=config('svd_tolerance'),
+            max_iter=config('svd_max_iterations'),
+            threads=config('svd_threads'))
+        report['method'] = 'subspace'
+        report['warm'] = start is not None
+    elif engine == 'randomized':
+        U, Sigma, V, report = subspace_svd(
+            matrix.to_scipy_csr(), k,
+            oversample=config('svd_oversample'),
+            iterations=config('svd_power_iterations') + 1,
+            threads=config('svd_threads'))
+        report['method'] = 'randomized'
+        report['power_iterations'] = config('svd_power_iterations')
+    elif engine == 'lanczos':
+        U, Sigma, V = lanczos_svd(matrix.to_scipy_csr(), k,
+                                  threads=config('svd_threads'))
+        report = {'method': 'lanczos'}
+    else:
+        U, Sigma, V = matrix.svd(k=k)
+        report = {'method': 'divisi2'}
+    if report['method'] != 'divisi2':
+        U = divisi2.DenseMatrix(U, matrix.row_labels, None)
+        V = divisi2.DenseMatrix(V, matrix.col_labels, None)
+    report['axes'] = k
+    report['seconds'] = time.time() - start_time
+    if report['method'] == 'subspace':
+        logger.info('SVD by subspace iteration from a %s start: %d '
+                    'iterations, residual %.2g, %.1f s'
+                    % (report['warm'] and 'warm' or 'cold',
+                       report['iterations'], report['residual'],
+                       report['seconds']))
+    elif report['method'] == 'randomized':
+        logger.info('SVD by randomized range finding with %d power '
+                    'iterations: %.1f s'
+                    % (report['power_iterations'], report['seconds']))
+    else:
+        logger.info('SVD by %s: %.1f s' % (report['method'], report['seconds']))
+    return U, Sigma, V, report
+
+def lanczos_svd(A, k, threads=1):
+    """
+    Find the `k` largest singular values of the SciPy sparse matrix `A`,
+    and their vectors, with ARPACK. ARPACK can't find every singular value,
+    so `k` is cut down to one less than the smaller dimension of `A`.
+    Products with `A` and its transpose are spread over `threads` threads.
+
+    Returns U, Sigma and V, largest singular value first.
+    """
+    from scipy.sparse.linalg import svds, LinearOperator
+    from luminoso.matvec import ThreadedCSR, thread_pool, close_pool
+    k = max(1, min(k, min(A.shape) - 1))
+    pool = thread_pool(threads)
+    try:
+        if pool is not None:
+            forward = ThreadedCSR(A, pool, threads)
+            backward = ThreadedCSR(A.T, pool, threads)
+            A = LinearOperator(A.shape, matvec=forward.dot,
+                               rmatvec=backward.dot, matmat=forward.dot,
+                               dtype=A.dtype)
+        U, Sigma, Vt = svds(A, k=k)
+    finally:
+        close_pool(pool)
+    order = np.argsort(-Sigma, kind='mergesort')
+    return U[:, order], Sigma[order], Vt.T[:, order]
+
+def aligned_start(V, labels):
+    """
+    Line up the rows of the old right singular vectors `V`, a labeled
+    DenseMatrix, with the columns labeled `labels` in the new matrix.
+    Labels that are new get rows of zeros.
+    """
+    positions = {}
+    for i, label in enumerate(V.row_labels):
+        positions[label] = i
+    old_rows = np.array([positions.get(label, -1) for label in labels])
+    start = np.zeros((len(labels), V.shape[1]))
+    found = old_rows >= 0
+    start[found] = np.asarray(V)[old_rows[found]]
+    return start
+
+def _orthonormalize(X):
+    Q, R = np.linalg.qr(X)
+    return Q
+
+def subspace_svd(A, k, start=None, oversample=10, tol=1e-4, max_iter=100,
+                 iterations=None, seed=0, threads=1):
+    """
+    Find the `k` largest singular values of the SciPy sparse matrix `A`,
+    and their left and right singular vectors, by subspace iteration.
+
+    The iteration works on `k + oversample` vectors at a time, starting
+    from the columns of `start` (a guess at the right singular vectors)
+    filled out with random ones. Each iteration multiplies by `A` and by
+    its transpose once, and then finds the best SVD it can within the
+    subspace it has.
+
+    It stops when every one of the `k` singular triples has a residual
+    `|A v - s u|` of at most `tol` times the largest singular value, or
+    after `max_iter` iterations. If `iterations` is given, exactly that
+    many iterations are run without checking the residual, which makes
+    this a randomized SVD with `iterations - 1` power iterations.
+
+    The products with `A` and its transpose are spread over `threads`
+    threads.
+
+    Returns U, Sigma, V and a report of the number of iterations and the
+    final residual.
+    """
+    pool = None
+    AT = A.T.tocsr()
+    if threads is not None and threads > 1:
+        from luminoso.matvec import ThreadedCSR, thread_pool, close_pool
+        pool = thread_pool(threads)
+        A = ThreadedCSR(A, pool, threads)
+        AT = ThreadedCSR(AT, pool, threads)
+    try:
+        return _subspace_iterate(A, AT, k, start, oversample, tol, max_iter,
+                                 iterations, seed)
+    finally:
+        if pool is not None: close_pool(pool)
+
+def _subspace_iterate(A, AT, k, start, oversample, tol, max_iter, iterations,
+                      seed):
+    m, n = A.shape
+    k = min(k, m, n)
+    p = min(k + oversample, m, n)
+    rand = np.random.RandomState(seed)
+    Q = rand.standard_normal((n, p))
+    if start is not None:
+        width = min(start.shape[1], p)
+        Q[:, :width] = start[:, :width]
+    Q = _orthonormalize(Q)
+    Y = A * Q
+    if iterations is not None: max_iter = iterations
+    residual = None
+    iteration = 0
+    while iteration < max_iter:
+        iteration += 1
+        P = _orthonormalize(Y)
+        Q, R = np.linalg.qr(AT * P)
+        # P^T A is R^T Q^T, so the SVD of the small matrix R^T gives the
+        # SVD of A within these subspaces.
+        Ub, Sigma, Vbt = np.linalg.svd(R.T)
+        U = np.dot(P, Ub[:, :k])
+        Vb = Vbt.T[:, :k]
+        Sigma = Sigma[:k]
+        V = np.dot(Q, Vb)
+        if iterations is not None:
+            if iteration < iterations: Y = A * Q
+            continue
+        Y = A * Q
+        errors = np.dot(Y, Vb) - U * Sigma
+        residual = (np.sqrt((errors ** 2).sum(axis=0)).max()
+                    / max(Sigma[0], 1e-300))
+        if residual <= tol: break
+    report = {'iterations': iteration, 'residual': None, 'converged': False}
+    if residual is not None:
+        report['residual'] = float(residual)
+        report['converged'] = bool(residual <= tol)
+    return U, Sigma, V, report
@@ -0,0 +1,60 @@
+"""
+Compare the SVD engines on a real study.
+
+    python -m luminoso.svd_bench StudyDir [axes]
+
+The study is analyzed once with each `svd_engine` (see luminoso/svd.py),
+using the study's other settings, and with `axes` axes if that's given.
+The blend is made once and kept in a temporary stage cache, so only the
+SVD and what comes after it are done again for each engine. For each one
+this prints how long the SVD took, the largest relative difference between
+its singular values and divisi2's, and the study's consistency.
+
+Nothing in the study's Results directory is changed.
+"""
+import sys, shutil, tempfile
+import logging
+import numpy as np
+from luminoso.cache import StageCache
+from luminoso.prune import relative_change
+from luminoso.study import StudyDirectory
+from luminoso.svd import ENGINES
+
+def benchmark(dirname, axes=None):
+    study = StudyDirectory(dirname).get_study()
+    study.document_counts = None
+    scratch_dir = tempfile.mkdtemp()
+    study.stage_cache = StageCache(scratch_dir)
+    settings = dict(study.settings)
+    settings['svd_warm_start'] = False
+    if axes is not None: settings['axes'] = axes
+    try:
+        baseline = None
+        print "%-12s %10s %10s %14s %12s" % ('engine', 'seconds', 'speedup',
+                                             'sigma change', 'consistency')
+        for engine in ENGINES:
+            study.settings = dict(settings, svd_engine=engine)
+            results = study.analyze()
+            U, Sigma, V, study_concepts = study.get_svd()
+            Sigma = sorted([float(s) for s in np.asarray(Sigma)], reverse=True)
+            seconds = study.svd_report['seconds']
+            if baseline is None: baseline = (seconds, Sigma)
+            consistency = results.stats['consistency']
+            if consistency is None: consistency = float('nan')
+            print "%-12s %10.2f %9.2fx %14.2g %12.4f" % (
+                engine, seconds, baseline[0] / max(seconds, 1e-9),
+                relative_change(baseline[1], Sigma), consistency)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def main(args):
+    logging.basicConfig(level=logging.WARN)
+    if not args:
+        print 'Run "python -m luminoso.svd_bench StudyDir [axes]".'
+        return
+    axes = None
+    if len(args) > 1: axes = int(args[1])
+    benchmark(args[0], axes)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
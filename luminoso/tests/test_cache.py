@@ -0,0 +1,224 @@
+from __future__ import with_statement
+from luminoso.study import *
+import luminoso.study
+from csc import divisi2
+import os, shutil, tempfile
+import unittest
+
+'''
+Unit tests for StageCache, and for which stages of an analysis are run
+again when the study changes.
+'''
+
+STUDY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', 'ThaiFoodStudy')
+
+def read_documents(subdir, cls=Document):
+    dir = os.path.join(STUDY_DIR, subdir)
+    return [cls.from_file(os.path.join(dir, name), name)
+            for name in sorted(os.listdir(dir)) if name.endswith('.txt')]
+
+class CountingStudy(Study):
+    '''
+    A Study that counts how many times each stage is computed.
+    '''
+    def __init__(self, *args, **kwargs):
+        Study.__init__(self, *args, **kwargs)
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _build_documents_matrix(self):
+        self._count('documents')
+        return Study._build_documents_matrix(self)
+
+    def _count_associations(self):
+        self._count('assoc')
+        return Study._count_associations(self)
+
+    def _project(self, document_matrix):
+        self._count('projections')
+        return Study._project(self, document_matrix)
+
+    def compute_stats(self, docs, spectral):
+        self._count('stats')
+        return Study.compute_stats(self, docs, spectral)
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = StageCache(os.path.join(self.dir, 'stages'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get(self):
+        key = StageCache.key('blend', ([1, 2], 'x'))
+        self.assertRaises(KeyError, self.cache.get, 'blend', key)
+        self.assertEqual(self.cache.previous('blend'), None)
+        self.cache.put('blend', key, {'value': 1})
+        self.assertEqual(self.cache.get('blend', key), {'value': 1})
+
+    '''
+    A result saved with other inputs isn't returned by get, but is by
+    previous.
+    '''
+    def test_changed_inputs(self):
+        old_key = StageCache.key('svd', (1,))
+        new_key = StageCache.key('svd', (2,))
+        self.assertNotEqual(old_key, new_key)
+        self.assertNotEqual(old_key, StageCache.key('blend', (1,)))
+        self.cache.put('svd', old_key, 'old')
+        self.assertRaises(KeyError, self.cache.get, 'svd', new_key)
+        self.assertEqual(self.cache.previous('svd'), 'old')
+        self.cache.put('svd', new_key, 'new')
+        self.assertEqual(self.cache.get('svd', new_key), 'new')
+
+    def test_unreadable(self):
+        key = StageCache.key('stats', ())
+        self.cache.put('stats', key, 'stats')
+        with open(os.path.join(self.dir, 'stages', 'stats.pickle'), 'wb') as f:
+            f.write('not a pickle')
+        self.assertRaises(KeyError, self.cache.get, 'stats', key)
+        self.assertEqual(self.cache.previous('stats'), None)
+
+class TestStudyStages(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.documents = read_documents('Documents')
+        self.canonical = read_documents('Canonical', CanonicalDocument)
+        self.svd_calls = 0
+        self.blend_svd = luminoso.study.blend_svd
+        def counting_svd(*args):
+            self.svd_calls += 1
+            return self.blend_svd(*args)
+        luminoso.study.blend_svd = counting_svd
+
+    def tearDown(self):
+        luminoso.study.blend_svd = self.blend_svd
+        shutil.rmtree(self.dir)
+
+    def analyze(self, settings, documents=None, canonical=()):
+        '''
+        Analyze the study with the shared stage cache, and return the
+        results and the stages that were computed.
+        '''
+        if documents is None: documents = self.documents
+        self.svd_calls = 0
+        study = CountingStudy('test', documents, list(canonical), {},
+                              settings, stage_cache=StageCache(self.dir))
+        results = study.analyze()
+        calls = dict(study.calls)
+        if self.svd_calls: calls['svd'] = self.svd_calls
+        return results, calls
+
+    '''
+    Nothing is computed again when nothing has changed.
+    '''
+    def test_unchanged(self):
+        results, calls = self.analyze({'axes': 10})
+        for stage in ('documents', 'assoc', 'svd', 'projections', 'stats'):
+            self.assertEqual(calls.get(stage), 1, stage)
+        self.assertEqual(results.stats['key_concepts'], {})
+        again, calls = self.analyze({'axes': 10})
+        self.assertEqual(calls, {})
+        self.assertEqual(again.stats['consistency'],
+                         results.stats['consistency'])
+
+    '''
+    With max_axes, fewer axes are truncated from the saved SVD.
+    '''
+    def test_axes(self):
+        self.analyze({'axes': 10, 'max_axes': 20})
+        results, calls = self.analyze({'axes': 5, 'max_axes': 20})
+        self.assertFalse('svd' in calls)
+        self.assertFalse('assoc' in calls)
+        self.assertEqual(calls.get('projections'), 1)
+        self.assertEqual(results.projections.shape[1], 5)
+
+    '''
+    A pruning setting changes the association matrix and what comes
+    after it, but not the document matrix.
+    '''
+    def test_prune_setting(self):
+        self.analyze({'axes': 10})
+        results, calls = self.analyze({'axes': 10, 'prune_top_k': 5})
+        self.assertFalse('documents' in calls)
+        self.assertEqual(calls.get('assoc'), 1)
+        self.assertEqual(calls.get('svd'), 1)
+
+    '''
+    Canonical documents are folded in after the cached stages, so adding
+    them doesn't compute any stage again.
+    '''
+    def test_canonical(self):
+        self.analyze({'axes': 10})
+        results, calls = self.analyze({'axes': 10}, canonical=self.canonical)
+        self.assertEqual(calls, {})
+        for doc in self.canonical:
+            self.assertTrue(doc.name in results.spectral.row_labels)
+            self.assertTrue(doc.name in results.stats['centrality'])
+        self.assertEqual(results.stats['num_documents'],
+                         len(self.documents) + len(self.canonical))
+        # Taking them out again gives back the stats without them.
+        results, calls = self.analyze({'axes': 10})
+        self.assertEqual(calls, {})
+        self.assertEqual(results.stats['num_documents'], len(self.documents))
+        self.assertEqual(results.stats['centrality'], {})
+
+    '''
+    Changing a document changes every stage.
+    '''
+    def test_changed_document(self):
+        self.analyze({'axes': 10})
+        documents = list(self.documents)
+        documents[0] = Document(documents[0].name,
+                                documents[0].text + u' The curry was cold.')
+        results, calls = self.analyze({'axes': 10}, documents)
+        for stage in ('documents', 'assoc', 'svd', 'projections', 'stats'):
+            self.assertEqual(calls.get(stage), 1, stage)
+
+    '''
+    An associative study's blend has no column for each document, so it
+    can't be updated with CCIPCA and has to be analyzed again.
+    '''
+    def test_update_associative(self):
+        self.analyze({'axes': 10})
+        study = CountingStudy('test', self.documents[:-1], [], {},
+                              {'axes': 10}, stage_cache=StageCache(self.dir))
+        self.assertTrue(study.is_associative())
+        self.assertEqual(study.update(), None)
+
+    '''
+    A study blended with a concept-by-feature matrix is updated by folding
+    in the documents that are new since the last analysis, and only those.
+    '''
+    def test_update(self):
+        features = divisi2.make_sparse(
+            [(1.0, concept, u'starts with ' + concept[0])
+             for doc in self.documents
+             for concept, value in doc.extract_concepts_with_negation()])
+        def study(documents, canonical=()):
+            return CountingStudy('test', documents, list(canonical),
+                                 {'features.smat': features}, {'axes': 10},
+                                 stage_cache=StageCache(self.dir))
+        first = study(self.documents[:-3])
+        self.assertFalse(first.is_associative())
+        first.analyze()
+        updating = study(self.documents, self.canonical)
+        results = updating.update()
+        self.assertEqual(updating.svd_report['method'], 'ccipca')
+        self.assertEqual(updating.svd_report['documents'], 3)
+        for doc in self.documents + self.canonical:
+            self.assertTrue(doc.name in results.spectral.row_labels)
+        again = study(self.documents)
+        self.assertNotEqual(again.update(), None)
+        self.assertEqual(again.svd_report['documents'], 0)
+
+if __name__ == '__main__':
+    for case in (TestStageCache, TestStudyStages):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,80 @@
+import luminoso
+import unittest
+import numpy as np
+from luminoso.ccipca import CCIPCA
+
+'''
+Unit tests for CCIPCA, which has to move the SVD it starts from toward the
+SVD of the matrix with the new columns added.
+'''
+
+SIZE = 40
+AXES = 4
+
+def subspace_distance(U1, U2):
+    return np.linalg.norm(np.dot(U1, U1.T) - np.dot(U2, U2.T))
+
+def top_svd(matrix, k=AXES):
+    U, Sigma, Vt = np.linalg.svd(matrix, full_matrices=False)
+    return U[:, :k], Sigma[:k]
+
+class TestCCIPCA(unittest.TestCase):
+
+    def setUp(self):
+        self.rand = np.random.RandomState(0)
+        self.basis = np.linalg.qr(self.rand.randn(SIZE, SIZE))[0]
+
+    def columns(self, n, strengths):
+        '''
+        `n` random columns, whose strongest directions are the first few
+        basis vectors with the given strengths, plus a little noise.
+        '''
+        basis = self.basis[:, :len(strengths)] * strengths
+        return (np.dot(basis, self.rand.randn(len(strengths), n))
+                + 0.05 * self.rand.randn(SIZE, n))
+
+    def test_from_svd(self):
+        U, Sigma = top_svd(self.columns(100, [5.0, 4.0, 3.0, 2.0, 1.0]))
+        pca = CCIPCA.from_svd(U, Sigma, 100)
+        U2, Sigma2 = pca.svd()
+        self.assertTrue(np.allclose(U, U2))
+        self.assertTrue(np.allclose(Sigma, Sigma2))
+
+    '''
+    Learning new columns whose strongest directions are in a different
+    order moves U and Sigma toward the SVD of all the columns together.
+    '''
+    def test_moves_toward_batch(self):
+        old = self.columns(200, [5.0, 4.0, 3.0, 2.0, 1.0])
+        new = self.columns(200, [2.0, 5.0, 4.0, 1.0, 3.0])
+        U, Sigma = top_svd(old)
+        batch_U, batch_Sigma = top_svd(np.hstack([old, new]))
+        before = subspace_distance(U, batch_U)
+        before_sigma = np.abs(Sigma - batch_Sigma).max()
+        for amnesia in (0.0, 2.0):
+            pca = CCIPCA.from_svd(U, Sigma, old.shape[1], amnesia)
+            for column in new.T:
+                pca.learn(column)
+            updated_U, updated_Sigma = pca.svd()
+            self.assertTrue(subspace_distance(updated_U, batch_U) < before)
+            self.assertTrue(np.abs(updated_Sigma - batch_Sigma).max()
+                            < before_sigma / 2)
+            self.assertEqual(pca.count, old.shape[1] + new.shape[1])
+
+    '''
+    From a rough start, a long stream of columns finds the strongest
+    direction.
+    '''
+    def test_converges(self):
+        strengths = [5.0, 3.0, 2.0, 1.0]
+        U, Sigma = top_svd(self.columns(10, strengths))
+        pca = CCIPCA.from_svd(U, Sigma, 10, amnesia=2.0)
+        for column in self.columns(3000, strengths).T:
+            pca.learn(column)
+        U, Sigma = pca.svd()
+        self.assertTrue(abs(np.dot(U[:, 0], self.basis[:, 0])) > 0.99)
+        self.assertTrue(np.all(np.diff(Sigma) <= 0))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCCIPCA)
+    unittest.TextTestRunner(verbosity=2).run(suite)
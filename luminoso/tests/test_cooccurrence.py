@@ -0,0 +1,108 @@
+import luminoso
+import random
+import unittest
+from luminoso.cooccurrence import (association_entries, association_arrays,
+                                   flatten_occurrences, WINDOW_SIZE)
+
+'''
+Unit tests for association_arrays, which has to count the same associations
+as visiting every pair of nearby concepts does.
+'''
+
+def summed(values, rows, cols):
+    '''
+    Add up the values of repeated (row, column) pairs, leaving out zeros.
+    '''
+    totals = {}
+    for value, row, col in zip(values, rows, cols):
+        key = (int(row), int(col))
+        totals[key] = totals.get(key, 0) + float(value)
+    return dict((key, value) for key, value in totals.items() if value != 0)
+
+def random_documents(rand, words, ndocs, nsentences, sentence_lengths,
+                     floats=False):
+    docs = []
+    for d in xrange(ndocs):
+        sentences = []
+        for s in xrange(rand.randint(0, nsentences)):
+            length = rand.choice(sentence_lengths)
+            sentence = []
+            for k in xrange(length):
+                value = rand.choice([1, -1])
+                if floats: value = value * rand.choice([0.5, 1.0, 2.0])
+                sentence.append((rand.choice(words), value))
+            sentences.append(sentence)
+        docs.append(sentences)
+    return docs
+
+class TestAssociations(unittest.TestCase):
+
+    def assertSameAssociations(self, doc_sentences, concept_ids):
+        expected = summed(*association_entries(doc_sentences,
+                                               concept_ids).arrays())
+        occurrences = flatten_occurrences(doc_sentences, concept_ids)
+        self.assertNotEqual(occurrences, None)
+        actual = summed(*association_arrays(occurrences))
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for key in expected:
+            self.assertAlmostEqual(actual[key], expected[key])
+
+    def random_ids(self, rand, words, fraction=0.7):
+        '''
+        Number a random subset of the words, so the others get an id of -1.
+        '''
+        order = rand.sample(words, len(words))
+        return dict((word, i) for i, word in enumerate(order)
+                    if rand.random() < fraction)
+
+    '''
+    Short documents, with values of 1 and -1 and with float values.
+    '''
+    def test_random(self):
+        rand = random.Random(0)
+        for trial in xrange(100):
+            words = ([u'w%d' % i for i in xrange(rand.randint(2, 40))] +
+                     [u'#t%d' % i for i in xrange(4)])
+            docs = random_documents(rand, words, rand.randint(1, 5), 10,
+                                    [0, 1, 3, 8], floats=(trial % 4 == 3))
+            self.assertSameAssociations(docs, self.random_ids(rand, words))
+
+    '''
+    Documents with many more than WINDOW_SIZE concepts, where words fall
+    out of the window but tags seen long ago stay in it.
+    '''
+    def test_long_documents(self):
+        rand = random.Random(1)
+        for trial in xrange(20):
+            words = ([u'w%d' % i for i in xrange(300)] +
+                     [u'#t%d' % i for i in xrange(10)])
+            docs = random_documents(rand, words, 3, 30, [1, 20, 60])
+            self.assertTrue(max(sum(len(s) for s in doc) for doc in docs)
+                            > WINDOW_SIZE)
+            self.assertSameAssociations(docs, self.random_ids(rand, words))
+
+    '''
+    A tag at the start of a document is still associated with a word that
+    comes more than WINDOW_SIZE concepts later, but a word is not.
+    '''
+    def test_old_tag(self):
+        filler = [[(u'f%d' % i, 1)] for i in xrange(WINDOW_SIZE + 10)]
+        doc = [[(u'#tag', 1), (u'early', 1)]] + filler + [[(u'late', -1)]]
+        concept_ids = {u'#tag': 0, u'early': 1, u'late': 2}
+        self.assertSameAssociations([doc], concept_ids)
+        assoc = summed(*association_arrays(flatten_occurrences([doc],
+                                                               concept_ids)))
+        self.assertEqual(assoc[0, 2], -1)
+        self.assertFalse((1, 2) in assoc)
+
+    '''
+    Nothing is associated when no concept has an id.
+    '''
+    def test_no_valid_concepts(self):
+        doc = [[(u'a', 1), (u'b', -1)], [(u'c', 1)]]
+        values, rows, cols = association_arrays(flatten_occurrences([doc], {}))
+        self.assertEqual(len(values), 0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAssociations)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,127 @@
+import luminoso
+import os, shutil, tempfile
+import random
+import unittest
+from csc.divisi2.ordered_set import OrderedSet
+from luminoso.doccounts import DocumentCounts, MAX_DOCUMENT_CONCEPTS
+from luminoso.entries import EntryBuffer
+
+'''
+Unit tests for DocumentCounts, whose TF-IDF matrix has to be the same after
+any number of updates as the one built from scratch.
+'''
+
+class Parsed(object):
+    def __init__(self, concepts):
+        self.concepts = concepts
+
+class CountedDocument(object):
+    def __init__(self, name, concepts):
+        self.name = name
+        self.content_hash = hash(tuple(concepts))
+        self.parsed = Parsed(concepts)
+
+    def parse(self):
+        return self.parsed
+
+def random_document(rand, name, words):
+    concepts = [(rand.choice(words), rand.choice([1, -1]))
+                for i in xrange(rand.choice([0, 1, 5, 20]))]
+    return CountedDocument(name, concepts)
+
+def rebuilt_matrix(documents, allowed):
+    '''
+    The document matrix, built from scratch the way Study does without
+    document counts.
+    '''
+    vocabulary = OrderedSet()
+    entries = EntryBuffer()
+    for docid, doc in enumerate(documents):
+        for concept, value in doc.parse().concepts[:MAX_DOCUMENT_CONCEPTS]:
+            if concept in allowed:
+                entries.append(value, docid, vocabulary.add(concept))
+    doc_names = [doc.name for doc in documents]
+    return entries.to_matrix(doc_names, vocabulary).normalize_tfidf(
+        cols_are_terms=True)
+
+def named_values(matrix):
+    return dict(((row, col), value) for value, row, col
+                in matrix.named_entries() if value != 0)
+
+class TestDocumentCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rand = random.Random(0)
+        self.words = [u'w%d' % i for i in xrange(60)]
+        self.allowed = set(self.words[:50])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertSameMatrix(self, counts, documents):
+        actual = counts.tfidf_matrix(documents)
+        expected = rebuilt_matrix(documents, self.allowed)
+        self.assertEqual(list(actual.row_labels), list(expected.row_labels))
+        self.assertEqual(list(actual.col_labels), list(expected.col_labels))
+        actual = named_values(actual)
+        expected = named_values(expected)
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for key in expected:
+            self.assertAlmostEqual(actual[key], expected[key])
+
+    '''
+    After documents are added, changed and removed, in any order, the
+    matrix is the one a full rebuild gives.
+    '''
+    def test_updates(self):
+        rand = self.rand
+        filename = os.path.join(self.dir, 'counts.pickle')
+        documents = [random_document(rand, 'doc%d' % i, self.words)
+                     for i in xrange(30)]
+        next_name = len(documents)
+        for round in xrange(20):
+            counts = DocumentCounts(filename, 'test')
+            counts.update(documents, self.allowed)
+            counts.save()
+            self.assertSameMatrix(counts, documents)
+            for i in xrange(rand.randint(0, 5)):
+                documents.pop(rand.randrange(len(documents)))
+            for i in xrange(rand.randint(0, 5)):
+                documents.append(random_document(rand, 'doc%d' % next_name,
+                                                 self.words))
+                next_name += 1
+            for i in xrange(rand.randint(0, 5)):
+                index = rand.randrange(len(documents))
+                documents[index] = random_document(
+                    rand, documents[index].name, self.words)
+            rand.shuffle(documents)
+
+    '''
+    Concepts that no document has any more are forgotten.
+    '''
+    def test_forget_concepts(self):
+        counts = DocumentCounts()
+        first = CountedDocument('a', [(u'w1', 1), (u'w2', -1)])
+        second = CountedDocument('b', [(u'w2', 1), (u'w3', 1)])
+        counts.update([first, second], self.allowed)
+        self.assertEqual(len(counts.concepts), 3)
+        counts.update([second], self.allowed)
+        self.assertEqual(sorted(counts.concepts), [u'w2', u'w3'])
+        self.assertEqual(len(counts.doc_freq), 2)
+        self.assertSameMatrix(counts, [second])
+
+    '''
+    Counts saved with another fingerprint are thrown away.
+    '''
+    def test_fingerprint(self):
+        filename = os.path.join(self.dir, 'counts.pickle')
+        counts = DocumentCounts(filename, 'one')
+        counts.update([CountedDocument('a', [(u'w1', 1)])], self.allowed)
+        counts.save()
+        self.assertEqual(len(DocumentCounts(filename, 'one').rows), 1)
+        self.assertEqual(len(DocumentCounts(filename, 'two').rows), 0)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDocumentCounts)
+    unittest.TextTestRunner(verbosity=2).run(suite)
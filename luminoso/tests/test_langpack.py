@@ -0,0 +1,88 @@
+import luminoso
+import os, re, shutil, tempfile
+import cPickle as pickle
+import unittest
+from csc.nl import get_nl
+from standalone_nlp import local_unpickle
+from standalone_nlp.langpack import write_language_pack, PackedEuroNL
+
+'''
+Unit test for the English language pack, which has to give the same results
+as the pickled en_nl that make_standalone.py used to write.
+'''
+
+STUDY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', 'ThaiFoodStudy')
+
+def corpus_lines():
+    lines = []
+    for subdir in ('Documents', 'Canonical'):
+        dir = os.path.join(STUDY_DIR, subdir)
+        for name in sorted(os.listdir(dir)):
+            text = open(os.path.join(dir, name)).read().decode('utf-8', 'replace')
+            lines.extend(line.strip() for line in text.splitlines()
+                         if line.strip())
+    return lines
+
+class TestLanguagePack(unittest.TestCase):
+
+    def setUp(self):
+        # This is the object that make_standalone.py used to pickle.
+        nl = get_nl('en')
+        nl.lemmatizer
+        nl.unlemmatizer
+        self.pickled = local_unpickle.loads(pickle.dumps(nl))
+        self.dir = tempfile.mkdtemp()
+        filename = os.path.join(self.dir, 'lang_en.lpk')
+        write_language_pack(self.pickled, filename)
+        self.packed = PackedEuroNL(filename, 'en')
+        self.lines = corpus_lines()
+        words = set()
+        for line in self.lines:
+            words.update(re.findall(r"\w+", line.lower(), re.UNICODE))
+        self.words = sorted(words)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    '''
+    The lemmatizer and every unlemmatizer trie give the same results for
+    every word in the corpus.
+    '''
+    def test_tries(self):
+        for word in self.words:
+            self.assertEqual(self.packed.lemmatizer.mblem(word),
+                             self.pickled.lemmatizer.mblem(word), word)
+        self.assertEqual(sorted(self.packed.unlemmatizer.keys()),
+                         sorted(self.pickled.unlemmatizer.keys()))
+        for key in self.pickled.unlemmatizer.keys():
+            packed_trie = self.packed.unlemmatizer[key]
+            pickled_trie = self.pickled.unlemmatizer[key]
+            for word in self.words:
+                self.assertEqual(packed_trie.unlem(word),
+                                 pickled_trie.unlem(word), (key, word))
+
+    '''
+    Whole sentences are normalized and lemma split the same way.
+    '''
+    def test_sentences(self):
+        for line in self.lines:
+            self.assertEqual(self.packed.normalize(line),
+                             self.pickled.normalize(line), line)
+            self.assertEqual(self.packed.lemma_split(line),
+                             self.pickled.lemma_split(line), line)
+
+    def test_wordlists(self):
+        for name in ('stopwords', 'blacklist', 'frequencies'):
+            self.assertEqual(set(getattr(self.packed, name)),
+                             set(getattr(self.pickled, name)), name)
+        for name in ('autocorrect', 'swapdict'):
+            self.assertEqual(dict(getattr(self.packed, name)),
+                             dict(getattr(self.pickled, name)), name)
+        self.assertEqual(self.packed.exceptions,
+                         dict((word, tuple(split)) for word, split in
+                              self.pickled.exceptions.items()))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLanguagePack)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,85 @@
+import luminoso
+import unittest
+import numpy as np
+import scipy.sparse
+from luminoso.matvec import (ThreadedCSR, row_ranges, row_slice, thread_pool,
+                             close_pool)
+from luminoso.svd import lanczos_svd, subspace_svd
+
+'''
+Unit tests for multiplying a CSR matrix on several threads, which has to
+give the same products as multiplying it on one.
+'''
+
+def random_csr(seed=0, shape=(500, 300), density=0.02):
+    rand = np.random.RandomState(seed)
+    matrix = scipy.sparse.rand(shape[0], shape[1], density=density,
+                               format='csr', random_state=rand)
+    # Some empty rows and one dense row, so the ranges aren't even.
+    matrix = matrix.tolil()
+    matrix[10:40, :] = 0
+    matrix[100, :] = rand.rand(shape[1])
+    return matrix.tocsr()
+
+class TestMatvec(unittest.TestCase):
+
+    def setUp(self):
+        self.matrix = random_csr()
+        self.pool = thread_pool(4)
+
+    def tearDown(self):
+        close_pool(self.pool)
+
+    '''
+    The ranges cover every row once, in order, and none is empty.
+    '''
+    def test_row_ranges(self):
+        for nranges in (1, 2, 3, 7, 1000):
+            ranges = row_ranges(self.matrix, nranges)
+            self.assertTrue(len(ranges) <= nranges)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], self.matrix.shape[0])
+            for (start, stop), (next_start, next_stop) in zip(ranges, ranges[1:]):
+                self.assertEqual(stop, next_start)
+            for start, stop in ranges:
+                self.assertTrue(stop > start)
+
+    '''
+    A row slice has the same rows, and shares the matrix's arrays.
+    '''
+    def test_row_slice(self):
+        rows = row_slice(self.matrix, 90, 120)
+        self.assertEqual((rows - self.matrix[90:120]).nnz, 0)
+        self.assertTrue(np.may_share_memory(rows.data, self.matrix.data))
+        self.assertTrue(np.may_share_memory(rows.indices, self.matrix.indices))
+
+    def test_products(self):
+        threaded = ThreadedCSR(self.matrix, self.pool, 4)
+        single = ThreadedCSR(self.matrix)
+        rand = np.random.RandomState(1)
+        for X in (rand.rand(300), rand.rand(300, 5)):
+            expected = self.matrix * X
+            self.assertTrue(np.allclose(threaded * X, expected))
+            self.assertTrue(np.allclose(single.dot(X), expected))
+            self.assertEqual((threaded * X).shape, expected.shape)
+
+    def test_no_pool(self):
+        self.assertEqual(thread_pool(1), None)
+        self.assertEqual(thread_pool(None), None)
+        self.assertEqual(len(ThreadedCSR(self.matrix, None, 4).blocks), 1)
+
+    '''
+    The SVD engines find the same singular values on any number of
+    threads.
+    '''
+    def test_svd_threads(self):
+        one = subspace_svd(self.matrix, 8, iterations=3)[1]
+        several = subspace_svd(self.matrix, 8, iterations=3, threads=4)[1]
+        self.assertTrue(np.allclose(one, several))
+        one = lanczos_svd(self.matrix, 8)[1]
+        several = lanczos_svd(self.matrix, 8, threads=4)[1]
+        self.assertTrue(np.allclose(one, several))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMatvec)
+    unittest.TextTestRunner(verbosity=2).run(suite)
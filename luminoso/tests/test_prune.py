@@ -0,0 +1,81 @@
+import luminoso
+import unittest
+import numpy as np
+from luminoso.prune import (keep_min_weight, keep_top_k, keep_max_nnz,
+                            relative_change)
+
+'''
+Unit tests for the stages that prune the association matrix, which have to
+keep it symmetric.
+'''
+
+def random_symmetric(rand, n=40, density=0.3):
+    A = rand.randn(n, n) * (rand.rand(n, n) < density)
+    A = A + A.T
+    np.fill_diagonal(A, 0)
+    rows, cols = np.nonzero(A)
+    return A[rows, cols], rows, cols
+
+def is_symmetric(values, rows, cols, keep):
+    kept = set(zip(rows[keep].tolist(), cols[keep].tolist()))
+    return all((col, row) in kept for row, col in kept)
+
+class TestPrune(unittest.TestCase):
+
+    def setUp(self):
+        self.values, self.rows, self.cols = random_symmetric(
+            np.random.RandomState(0))
+
+    def test_min_weight(self):
+        keep = keep_min_weight(self.values, self.rows, self.cols, 1.0)
+        self.assertTrue(np.all(np.abs(self.values[keep]) >= 1.0))
+        self.assertTrue(np.all(np.abs(self.values[~keep]) < 1.0))
+
+    '''
+    Every row keeps at least its k strongest entries (or all of them), and
+    whatever is kept is symmetric.
+    '''
+    def test_top_k(self):
+        for k in (1, 2, 5):
+            keep = keep_top_k(self.values, self.rows, self.cols, k)
+            self.assertTrue(is_symmetric(self.values, self.rows, self.cols, keep))
+            for row in np.unique(self.rows):
+                in_row = self.rows == row
+                strengths = np.sort(np.abs(self.values[in_row]))[::-1]
+                kept = np.abs(self.values[in_row & keep])
+                self.assertTrue(len(kept) >= min(k, len(strengths)))
+                self.assertEqual(kept.max(), strengths[0])
+
+    '''
+    At most max_nnz entries are kept, they're the strongest ones, and a
+    symmetric pair is never split.
+    '''
+    def test_max_nnz(self):
+        for max_nnz in (0, 1, 7, 50, len(self.values) + 3):
+            keep = keep_max_nnz(self.values, self.rows, self.cols, max_nnz)
+            self.assertTrue(keep.sum() <= max_nnz)
+            self.assertTrue(keep.sum() >= min(max_nnz, len(self.values)) - 1)
+            self.assertTrue(is_symmetric(self.values, self.rows, self.cols, keep))
+            if 0 < keep.sum() < len(self.values):
+                self.assertTrue(np.abs(self.values[keep]).min() >=
+                                np.abs(self.values[~keep]).max())
+
+    '''
+    The result doesn't depend on the order of the entries.
+    '''
+    def test_order(self):
+        order = np.random.RandomState(1).permutation(len(self.values))
+        for test, parameter in ((keep_top_k, 3), (keep_max_nnz, 40)):
+            keep = test(self.values, self.rows, self.cols, parameter)
+            shuffled = test(self.values[order], self.rows[order],
+                            self.cols[order], parameter)
+            self.assertEqual(keep[order].tolist(), shuffled.tolist())
+
+    def test_relative_change(self):
+        self.assertEqual(relative_change([], [1.0]), None)
+        self.assertAlmostEqual(relative_change([2.0, 1.0], [2.0, 1.5, 0.5]),
+                               0.5)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPrune)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,149 @@
+from luminoso.study import *
+from luminoso.sketch import CountMinSketch
+import os
+import unittest
+import numpy as np
+
+'''
+Unit tests for the count-min sketch, and for finding a study's valid
+concepts and document matrix with it.
+'''
+
+STUDY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', 'ThaiFoodStudy')
+
+def true_counts(batches):
+    counts = {}
+    for ids in batches:
+        for id in ids:
+            counts[id] = counts.get(id, 0) + 1
+    return counts
+
+def thai_food_documents():
+    dir = os.path.join(STUDY_DIR, 'Documents')
+    return [Document.from_file(os.path.join(dir, name), name)
+            for name in sorted(os.listdir(dir)) if name.endswith('.txt')]
+
+class TestCountMinSketch(unittest.TestCase):
+
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        self.batches = [rand.randint(0, 2000, size=rand.randint(0, 50))
+                        for i in xrange(300)]
+        self.counts = true_counts(self.batches)
+        self.ids = np.array(sorted(self.counts), dtype=np.int64)
+        self.expected = np.array([self.counts[id] for id in self.ids])
+
+    def sketch(self, width, depth=4):
+        sketch = CountMinSketch(width, depth)
+        for ids in self.batches:
+            sketch.add(ids)
+        return sketch
+
+    '''
+    No estimate is ever less than the true count, however small the sketch.
+    '''
+    def test_never_under(self):
+        for width in (1, 7, 64, 1000):
+            estimate = self.sketch(width).estimate(self.ids)
+            self.assertTrue(np.all(estimate >= self.expected))
+
+    def test_wide_sketch_is_exact(self):
+        estimate = self.sketch(10**6).estimate(self.ids)
+        self.assertEqual(estimate.tolist(), self.expected.tolist())
+
+    '''
+    Repeated ids in one call are each counted, and the total is the number
+    of ids added.
+    '''
+    def test_repeats(self):
+        sketch = CountMinSketch(10**6)
+        sketch.add(np.array([5, 5, 9, 5]))
+        sketch.add(np.array([], dtype=np.int64))
+        self.assertEqual(sketch.estimate(np.array([5, 9, 1])).tolist(),
+                         [3, 1, 0])
+        self.assertEqual(sketch.total, 4)
+
+    def test_error_bound(self):
+        sketch = self.sketch(200)
+        over = sketch.estimate(self.ids) - self.expected
+        self.assertTrue(np.mean(over > sketch.error_bound()) < 0.05)
+
+class TestSketchedStudy(unittest.TestCase):
+
+    def setUp(self):
+        documents = thai_food_documents()
+        self.exact = Study('exact', documents, [], {}, {})
+        # A sketch this narrow overestimates nearly everything, so the
+        # exact counts are what decide which concepts are valid.
+        self.sketched = Study('sketched', documents, [], {},
+                              {'df_sketch_width': 16})
+
+    '''
+    With df_sketch_verify, every candidate is counted exactly, and the
+    valid concepts are exactly the ones the document matrix gives.
+    '''
+    def test_valid_concepts(self):
+        for cutoff in (1, 2, 3, 5):
+            valid = self.sketched.get_valid_concepts(cutoff)
+            report = self.sketched.sketch_report
+            self.assertEqual(valid, self.exact.get_valid_concepts(cutoff))
+            # the counts from a lower cutoff cover every candidate
+            self.assertTrue(report['counted'] >= report['candidates'])
+            self.assertTrue(report['candidates'] > report['valid'])
+
+    '''
+    A budget is met with the exact counts of the concepts the sketch can't
+    rule out, so it picks the same cutoff, and the same concepts, as the
+    document matrix does.
+    '''
+    def test_budgets(self):
+        documents = thai_food_documents()
+        for budget in ({'max_concepts': 100}, {'max_nnz': 500}):
+            exact = Study('exact', documents, [], {}, budget)
+            settings = dict(budget, df_sketch_width=256)
+            sketched = Study('sketched', documents, [], {}, settings)
+            cutoff = exact.choose_concept_cutoff()
+            self.assertEqual(sketched.choose_concept_cutoff(), cutoff)
+            self.assertEqual(sketched.cutoff_report, exact.cutoff_report)
+            self.assertEqual(sketched.get_assoc_concepts(),
+                             exact.get_assoc_concepts())
+            self.assertTrue(len(sketched.get_assoc_concepts()) > 1)
+
+    '''
+    A budget too small to leave any concepts to associate is an error
+    that names it.
+    '''
+    def test_budget_too_small(self):
+        for budget in ({'max_concepts': 1}, {'max_nnz': 1}):
+            for settings in (budget, dict(budget, df_sketch_width=256)):
+                study = Study('small', thai_food_documents(), [], {}, settings)
+                try:
+                    study.get_assoc_concepts()
+                except ValueError, e:
+                    self.assertTrue(budget.keys()[0] in str(e))
+                else:
+                    self.fail('no ValueError for %r' % settings)
+
+    '''
+    The sketched document matrix has the valid concepts' columns of the
+    full one, with the same weights, and a row for every document.
+    '''
+    def test_documents_matrix(self):
+        full = self.exact.get_documents_matrix()
+        sketched = self.sketched.get_documents_matrix()
+        valid = self.sketched.get_assoc_concepts()
+        self.assertEqual(set(sketched.col_labels), valid)
+        self.assertEqual(list(sketched.row_labels), list(full.row_labels))
+        expected = dict(((doc, concept), value) for value, doc, concept
+                        in full.named_entries() if concept in valid)
+        actual = dict(((doc, concept), value) for value, doc, concept
+                      in sketched.named_entries())
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for key in expected:
+            self.assertAlmostEqual(actual[key], expected[key])
+
+if __name__ == '__main__':
+    for case in (TestCountMinSketch, TestSketchedStudy):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
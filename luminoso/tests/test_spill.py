@@ -0,0 +1,79 @@
+import luminoso
+import os, shutil, tempfile
+import unittest
+import numpy as np
+from luminoso.spill import ExternalSum, coalesce
+
+'''
+Unit tests for ExternalSum, which has to add up the same totals whether or
+not it spills runs to disk.
+'''
+
+def expected_totals(keys, values):
+    totals = {}
+    for key, value in zip(keys, values):
+        totals[int(key)] = totals.get(int(key), 0.0) + float(value)
+    return sorted((key, value) for key, value in totals.items() if value != 0)
+
+class TestExternalSum(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check_sum(self, rand, memory_limit, nbatches):
+        total = ExternalSum(memory_limit, self.dir)
+        all_keys = []
+        all_values = []
+        try:
+            for batch in xrange(nbatches):
+                keys = rand.randint(0, 5000, size=rand.randint(0, 3000))
+                values = rand.choice([-1.0, 1.0, 0.5], size=len(keys))
+                total.add(keys, values)
+                all_keys.append(keys)
+                all_values.append(values)
+            nruns = len(total.runs)
+            keys, values = total.result()
+        finally:
+            total.cleanup()
+        self.assertEqual(os.listdir(self.dir), [])
+        self.assertEqual(zip(keys.tolist(), values.tolist()),
+                         expected_totals(np.concatenate(all_keys),
+                                         np.concatenate(all_values)))
+        return nruns
+
+    '''
+    Totals are the same with a small budget that spills many runs as with
+    one large enough that nothing is spilled.
+    '''
+    def test_spilled(self):
+        rand = np.random.RandomState(0)
+        self.assertTrue(self.check_sum(rand, 20000, 40) > 1)
+
+    def test_in_memory(self):
+        rand = np.random.RandomState(1)
+        self.assertEqual(self.check_sum(rand, 10**8, 10), 0)
+
+    def test_random_budgets(self):
+        rand = np.random.RandomState(2)
+        for trial in xrange(20):
+            self.check_sum(rand, rand.randint(20000, 200000),
+                           rand.randint(1, 40))
+
+    def test_empty(self):
+        total = ExternalSum(20000, self.dir)
+        keys, values = total.result()
+        self.assertEqual(len(keys), 0)
+        self.assertEqual(len(values), 0)
+
+    def test_coalesce(self):
+        keys, values = coalesce(np.array([3, 1, 3, 2, 1]),
+                                np.array([1.0, 2.0, 3.0, 4.0, -2.0]))
+        self.assertEqual(keys.tolist(), [1, 2, 3])
+        self.assertEqual(values.tolist(), [0.0, 4.0, 4.0])
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestExternalSum)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -54,6 +54,22 @@ class TestStudy(unittest.TestCase):
         self.assertTrue( (len(pos) + len(neg)) == len(concepts))
         self.assertTrue( 0 == len(empty_concepts))
 
+    '''
+    Test that parsing a document in one pass finds the same concepts in each
+    sentence as extracting them from the sentence's words directly.
+    '''
+    def test_parsed_document(self):
+        parsed = self.doc.parse()
+        sentences = self.doc.get_sentences()
+        self.assertEqual(len(parsed.sentences), len(sentences))
+        for concepts, sentence in zip(parsed.sentences, sentences):
+            self.assertEqual(concepts, extract_concepts_from_words(sentence[:SENTENCE_WORDS]))
+
+        #Every concept in a sentence is also in the document.
+        for concepts in parsed.sentences:
+            for concept in concepts:
+                self.assertTrue(concept in parsed.concepts)
+
     '''
     Test the different functions in StudyDirectory.
     '''
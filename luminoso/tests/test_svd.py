@@ -0,0 +1,128 @@
+import luminoso
+import unittest
+import numpy as np
+import scipy.sparse
+from luminoso.svd import (svd_settings, truncate_svd, blend_svd, lanczos_svd,
+                          subspace_svd, aligned_start)
+
+'''
+Unit tests for the SVD engines, which have to find the same largest
+singular values as a dense SVD.
+'''
+
+def blend_like_matrix(seed=0, shape=(300, 200)):
+    '''
+    A sparse matrix with a few strong directions, like a blend.
+    '''
+    rand = np.random.RandomState(seed)
+    A = scipy.sparse.rand(shape[0], shape[1], density=0.03,
+                          random_state=rand).toarray()
+    for strength in (8.0, 6.0, 4.0, 3.0, 2.0):
+        A += strength * np.outer(rand.rand(shape[0]), rand.rand(shape[1])) / 10
+    return scipy.sparse.csr_matrix(A)
+
+def dense_svd(A):
+    U, Sigma, Vt = np.linalg.svd(A.toarray(), full_matrices=False)
+    return U, Sigma, Vt.T
+
+class Config(object):
+    def __init__(self, **settings):
+        self.settings = {'svd_engine': 'divisi2', 'svd_warm_start': False,
+                         'svd_oversample': 10, 'svd_power_iterations': 2,
+                         'svd_tolerance': 1e-4, 'svd_max_iterations': 100,
+                         'svd_threads': 1}
+        self.settings.update(settings)
+
+    def __call__(self, key):
+        return self.settings[key]
+
+class TestSVD(unittest.TestCase):
+
+    def setUp(self):
+        self.A = blend_like_matrix()
+        self.U, self.Sigma, self.V = dense_svd(self.A)
+        self.k = 10
+
+    def assertSameSpace(self, U, Sigma, V, tolerance):
+        k = self.k
+        self.assertEqual(len(Sigma), k)
+        relative = np.abs(np.asarray(Sigma) - self.Sigma[:k]) / self.Sigma[0]
+        self.assertTrue(relative.max() < tolerance, relative.max())
+        # Singular vectors are only defined up to sign.
+        for i in xrange(3):
+            self.assertTrue(abs(abs(np.dot(U[:, i], self.U[:, i])) - 1) < tolerance)
+            self.assertTrue(abs(abs(np.dot(V[:, i], self.V[:, i])) - 1) < tolerance)
+
+    def test_subspace(self):
+        U, Sigma, V, report = subspace_svd(self.A, self.k, tol=1e-10,
+                                           max_iter=500)
+        self.assertTrue(report['converged'])
+        self.assertSameSpace(U, Sigma, V, 1e-6)
+
+    def test_randomized(self):
+        U, Sigma, V, report = subspace_svd(self.A, self.k, iterations=3)
+        self.assertEqual(report['iterations'], 3)
+        self.assertEqual(report['residual'], None)
+        self.assertSameSpace(U, Sigma, V, 1e-2)
+
+    def test_lanczos(self):
+        U, Sigma, V = lanczos_svd(self.A, self.k)
+        self.assertSameSpace(U, Sigma, V, 1e-8)
+
+    '''
+    Starting from the right singular vectors of a nearby matrix takes
+    fewer iterations than starting from random ones.
+    '''
+    def test_warm_start(self):
+        cold = subspace_svd(self.A, self.k, tol=1e-8, max_iter=500)[3]
+        changed = self.A.tolil()
+        changed[0, :] = 0
+        changed = changed.tocsr()
+        U, Sigma, V = dense_svd(changed)
+        warm = subspace_svd(self.A, self.k, start=V[:, :self.k], tol=1e-8,
+                            max_iter=500)[3]
+        self.assertTrue(warm['converged'])
+        self.assertTrue(warm['iterations'] < cold['iterations'])
+
+    def test_truncate(self):
+        Sigma = np.array([1.0, 3.0, 2.0])
+        U = np.arange(6.0).reshape(2, 3)
+        V = np.arange(9.0).reshape(3, 3)
+        U2, Sigma2, V2 = truncate_svd(U, Sigma, V, 2)
+        self.assertEqual(Sigma2.tolist(), [3.0, 2.0])
+        self.assertEqual(U2.tolist(), U[:, [1, 2]].tolist())
+        self.assertEqual(V2.tolist(), V[:, [1, 2]].tolist())
+
+    def test_aligned_start(self):
+        class Labeled(np.ndarray):
+            pass
+        V = np.array([[1.0, 2.0], [3.0, 4.0]]).view(Labeled)
+        V.row_labels = ['a', 'b']
+        start = aligned_start(V, ['b', 'new', 'a'])
+        self.assertEqual(start.tolist(), [[3.0, 4.0], [0.0, 0.0], [1.0, 2.0]])
+
+    '''
+    Every setting that changes the result is in the SVD stage's key.
+    '''
+    def test_settings(self):
+        base = svd_settings(Config())
+        self.assertNotEqual(base, svd_settings(Config(svd_engine='lanczos')))
+        randomized = svd_settings(Config(svd_engine='randomized'))
+        self.assertNotEqual(randomized, svd_settings(
+            Config(svd_engine='randomized', svd_power_iterations=3)))
+        warm = svd_settings(Config(svd_warm_start=True))
+        self.assertNotEqual(base, warm)
+        for setting, value in (('svd_tolerance', 1e-6),
+                               ('svd_max_iterations', 10),
+                               ('svd_oversample', 20)):
+            changed = Config(svd_warm_start=True)
+            changed.settings[setting] = value
+            self.assertNotEqual(warm, svd_settings(changed), setting)
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, blend_svd, None, self.k,
+                          Config(svd_engine='magic'))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSVD)
+    unittest.TextTestRunner(verbosity=2).run(suite)
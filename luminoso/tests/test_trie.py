@@ -0,0 +1,94 @@
+import luminoso
+import random
+import unittest
+from standalone_nlp.trie import Node, Leaf, CompactTrie
+
+'''
+Unit tests for CompactTrie, which has to give exactly the same results as
+the Node trie it was converted from.
+'''
+
+ALPHABET = 'abdeisy'
+
+def leaf_keys(leaves):
+    return [(leaf.add, leaf.delete, leaf.pos, leaf.inflections)
+            for leaf in leaves]
+
+def random_word(rand, max_length=8):
+    return ''.join(rand.choice(ALPHABET)
+                   for i in xrange(rand.randint(1, max_length)))
+
+def random_trie(seed):
+    '''
+    Build a Node trie of random words, the way unlemmatizer tries are
+    built: each word is added backwards, with a random leaf.
+    '''
+    rand = random.Random(seed)
+    root = Node()
+    words = []
+    for i in xrange(rand.randint(1, 100)):
+        word = random_word(rand)
+        words.append(word)
+        leaf = Leaf.make(rand.choice(['', 's', 'ed']), rand.choice(['', 'e', 'y']),
+                         rand.choice(['N', 'V', 'A']), rand.choice(['s', 'p', 'pr']))
+        root.add(word[::-1], leaf)
+    others = [random_word(rand, 10) for i in xrange(50)]
+    return root, words, others
+
+class TestCompactTrie(unittest.TestCase):
+
+    '''
+    Every word that was added, and words that weren't, should get the same
+    leaves from both tries, before and after serializing the compact one.
+    '''
+    def test_random_tries(self):
+        for seed in xrange(200):
+            root, words, others = random_trie(seed)
+            compact = CompactTrie.from_node(root)
+            reloaded = CompactTrie.from_buffer(compact.to_string())
+            for word in words + others:
+                expected = leaf_keys(root.lookup(word[::-1]))
+                self.assertEqual(leaf_keys(compact.lookup(word[::-1])), expected,
+                                 'seed %d, word %r' % (seed, word))
+                self.assertEqual(leaf_keys(reloaded.lookup(word[::-1])), expected,
+                                 'seed %d, word %r' % (seed, word))
+                self.assertEqual(compact.unlem(word), root.unlem(word))
+
+    '''
+    Every state of the Node trie should be reachable in the compact one
+    with the same leaves.
+    '''
+    def test_every_state(self):
+        for seed in xrange(50):
+            root, words, others = random_trie(seed)
+            compact = CompactTrie.from_node(root)
+            for node, suffix in root.walk(''):
+                # walk() builds suffixes from the end, so this is the key
+                # that reaches the node.
+                key = suffix[::-1]
+                state = 0
+                for char in key:
+                    target = compact.base[state] + compact.codes[char]
+                    self.assertEqual(compact.check[target], state)
+                    state = target
+                self.assertEqual(leaf_keys(compact.state_leaves(state)),
+                                 leaf_keys(node.leaves()))
+
+    '''
+    A permuted trie, like the lemmatizer, should give the same mblem results.
+    '''
+    def test_permutation(self):
+        rand = random.Random(0)
+        root = Node()
+        root.permutation = range(19, -1, -1)
+        words = [random_word(rand) for i in xrange(200)]
+        for word in words:
+            root.add(root.permute(word), Leaf.make('', rand.choice(['', 's']),
+                                                   'N', 's'))
+        compact = CompactTrie.from_buffer(CompactTrie.from_node(root).to_string())
+        for word in words:
+            self.assertEqual(compact.mblem(word), root.mblem(word))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCompactTrie)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -222,7 +222,7 @@ class MainWindow(QtGui.QMainWindow):
                 self.study = self.study_dir.get_study()
                 self.study.step.connect(progress.tick)
                 progress.set_text('Loading analysis.')
-                results = self.study_dir.get_existing_analysis()
+                results = self.study_dir.get_existing_analysis(self.study)
                 progress.tick('Updating view.')
                 self.update_svdview(results)
                 progress.tick('Updating options.')